@@ -0,0 +1,362 @@
+"""Scaling benchmarks for the tasker commands.
+
+Generates synthetic task lists of every size for every storage backend and
+times add, update, mark, delete, list (all, filtered, the 20 most
+recently updated and all as NDJSON), search, stats and REPL startup against them, the way one shell
+command runs: each op opens the file, does its work and commits. The "cli-" ops run the
+same commands through main([...]), the path `tasker add ...` takes (catalog, command
+registry, Workspace), minus interpreter startup. For every op it records the best time,
+the peak Python memory (tracemalloc) and the bytes written to files and
+the (discarded) output (/proc/self/io, Linux only).
+
+--parse N also measures command-line parsing throughput on N generated
+lines: the character-by-character parser and argument guessing tasker
+used before the command registry ("parse-legacy") against parse_commands()
+plus CommandSpec.bind() ("parse"), and ";"-joined lines ("parse-multi").
+
+Results are written as one JSON object per line to bench_output.txt. With
+--baseline FILE they are compared with an earlier run and every op slower
+than TOLERANCE times its baseline fails the run; --save-baseline FILE
+stores this run as the new baseline.
+
+    python bench_tasker.py                      # 10^3, 10^4, 10^5 tasks
+    python bench_tasker.py --sizes 1000,1000000 --backends db
+    python bench_tasker.py --sizes 1000000 --repeat 1     # the run documented in README.md
+    python bench_tasker.py --save-baseline bench_baseline.json
+    python bench_tasker.py --baseline bench_baseline.json --tolerance 1.5
+    python bench_tasker.py --sizes "" --parse 100000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import task_manager
+from task_manager import (
+    Task, open_backend, add_task, update_task, update_status, delete_task,
+    show_full_list, show_done_list, show_search_results, show_sorted_list, main, parse_commands, COMMANDS,
+    pop_option, parse_date_option, STATUS_COLORS, run_command, Workspace, Catalog,
+)
+
+BACKEND_SUFFIXES = {"json": ".json", "journal": ".journal", "db": ".db", "tbin": ".tbin"}
+DEFAULT_SIZES = [1000, 10000, 100000]
+# Differences below this many seconds are timer noise, never regressions
+NOISE_FLOOR = 0.005
+WORDS = ["buy", "milk", "call", "mom", "fix", "bug", "write", "report", "plan", "trip", "pay", "rent"]
+STATUSES = ["todo", "in-progress", "done"]
+
+
+def generate_tasks(size):
+    """The function returns a synthetic {id: Task} dictionary of size tasks with mixed statuses and dates."""
+    start = int(time.time()) - size * 60
+    tasks_dict = {}
+    for number in range(1, size + 1):
+        description = f"{WORDS[number % len(WORDS)]} {WORDS[number * 7 % len(WORDS)]} #{number}"
+        updated = start + number * 60 + 30 if number % 4 == 0 else None
+        tasks_dict[str(number)] = Task(description, STATUSES[number % 3], start + number * 60, updated)
+    return tasks_dict
+
+
+def write_task_file(path, size):
+    """The function creates a task file of the backend matching path with size synthetic tasks."""
+    with open_backend(path) as backend:
+        backend.replace_all(generate_tasks(size))
+
+
+def bytes_written():
+    """The function returns the bytes this process has written so far, None where /proc is missing."""
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                if line.startswith("wchar:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+def run_repl_startup(path):
+    """The function starts the interactive prompt on path and leaves it right away."""
+    task_manager.filename = path
+    stdin = sys.stdin
+    sys.stdin = io.StringIO("exit\n")
+    try:
+        main([])
+    finally:
+        sys.stdin = stdin
+
+
+def run_cli(path, *argv):
+    """The function runs one shell command (tasker argv...) on path through main()."""
+    task_manager.filename = path
+    task_manager.CATALOG_FILE = f"{path}.lists.json"
+    main(list(argv))
+
+
+def operations(path, size):
+    """The function returns the (name, callable) ops benchmarked on a list of size tasks.
+
+    Every call of a mutating op touches a task of its own so repeats do the
+    same work.
+    """
+    middle = size // 2
+    counters = {"delete": 0, "cli-delete": 0}
+
+    def delete():
+        counters["delete"] += 1
+        delete_task(str(middle + counters["delete"]), path)
+
+    def cli_delete():
+        counters["cli-delete"] += 1
+        run_cli(path, "delete", str(middle - counters["cli-delete"]))
+
+    return [
+        ("startup", lambda: run_repl_startup(path)),
+        ("add", lambda: add_task("benchmark task", path)),
+        ("update", lambda: update_task(str(middle), "benchmark update", path)),
+        ("mark", lambda: update_status(str(middle), "done", path)),
+        ("delete", delete),
+        ("list-all", lambda: show_full_list(path)),
+        ("list-filtered", lambda: show_done_list(path)),
+        ("list-limit", lambda: show_full_list(path, 20)),
+        ("list-top", lambda: show_sorted_list(path, "all", "-updated", 20)),
+        ("list-ndjson", lambda: show_full_list(path, format="ndjson")),
+        ("search", lambda: show_search_results("milk", path, limit=20)),
+        ("stats", lambda: run_command(["stats"], Workspace(Catalog(f"{path}.lists.json", path)))),
+        ("cli-add", lambda: run_cli(path, "add", "benchmark task")),
+        ("cli-update", lambda: run_cli(path, "update", str(middle), "benchmark update")),
+        ("cli-mark", lambda: run_cli(path, "mark-done", str(middle))),
+        ("cli-delete", cli_delete),
+        ("cli-list-all", lambda: run_cli(path, "list")),
+        ("cli-list-filtered", lambda: run_cli(path, "list", "done")),
+        ("cli-list-limit", lambda: run_cli(path, "list", "--limit", "20")),
+        ("cli-list-top", lambda: run_cli(path, "list", "--sort", "-updated", "--limit", "20")),
+        ("cli-search", lambda: run_cli(path, "search", "milk", "--limit", "20")),
+        ("cli-stats", lambda: run_cli(path, "stats")),
+    ]
+
+
+def measure(function, repeat):
+    """The function runs function repeat times and returns (best seconds, peak bytes, bytes written per run).
+
+    Time is measured without tracemalloc, which slows Python code down; one
+    extra traced run gives the peak memory.
+    """
+    best = None
+    written = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            before = bytes_written()
+            started = time.perf_counter()
+            function()
+            elapsed = time.perf_counter() - started
+            after = bytes_written()
+            best = elapsed if best is None else min(best, elapsed)
+            if before is not None and after is not None:
+                written.append(after - before)
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak, min(written) if written else None
+
+
+def run_benchmarks(sizes, backends, repeat=3, directory=None, log=None):
+    """The function benchmarks every op on every size and backend and returns the result records.
+
+    The task files live in a temporary directory (inside directory if given)
+    that is removed at the end.
+    """
+    results = []
+    directory = tempfile.mkdtemp(prefix="tasker-bench-", dir=directory)
+    saved_filename, saved_catalog = task_manager.filename, task_manager.CATALOG_FILE
+    try:
+        for backend in backends:
+            for size in sizes:
+                path = os.path.join(directory, f"bench-{size}{BACKEND_SUFFIXES[backend]}")
+                started = time.perf_counter()
+                write_task_file(path, size)
+                if log:
+                    log(f"{backend} {size}: generated in {time.perf_counter() - started:.2f}s")
+                for op, function in operations(path, size):
+                    seconds, peak, written = measure(function, repeat)
+                    record = {"backend": backend, "size": size, "op": op, "seconds": round(seconds, 6),
+                              "peak_bytes": peak, "bytes_written": written}
+                    results.append(record)
+                    if log:
+                        log(f"  {op:<17} {seconds * 1000:10.2f} ms  {peak / 1024:10.0f} KiB peak  "
+                            f"{'-' if written is None else written:>10} B written")
+    finally:
+        task_manager.filename, task_manager.CATALOG_FILE = saved_filename, saved_catalog
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def legacy_parse_input(users_input):
+    """The parser tasker used before parse_commands(), kept as the baseline of --parse."""
+    parts = []
+    current_part = []
+    in_quotes = False
+
+    for char in users_input:
+        if char == '"':
+            in_quotes = not in_quotes
+        elif char == ' ':
+            if in_quotes == False:
+                parts.append(''.join(current_part))
+                current_part = []
+            elif in_quotes == True:
+                current_part.append(char)
+        else:
+            current_part.append(char)
+
+    if current_part:
+        parts.append(''.join(current_part))
+    return parts
+
+
+def legacy_bind(parts):
+    """The function pops the options and guesses (command, id, description) the way run_command
+    did before the registry."""
+    parts = list(parts)
+    limit = pop_option(parts, "--limit")
+    if limit is not None and not limit.isdigit():
+        raise ValueError(limit)
+    parse_date_option(pop_option(parts, "--since"))
+    parse_date_option(pop_option(parts, "--until"), end_of_day=True)
+    parse_date_option(pop_option(parts, "--updated-since"))
+    status = pop_option(parts, "--status")
+    pop_option(parts, "--format")
+    if status is not None and status not in STATUS_COLORS:
+        raise ValueError(status)
+    if parts and parts[0].lower() == "search":
+        return "search", None, " ".join(parts[1:])
+    match len(parts):
+        case 1:
+            return parts[0], None, None
+        case 2:
+            try:
+                int(parts[1])
+            except ValueError:
+                return parts[0], None, parts[1]
+            return parts[0], parts[1], None
+        case 3:
+            return parts[0], parts[1], parts[2]
+        case _:
+            return "error", None, None
+
+
+def command_lines(count):
+    """The function returns count typical command lines."""
+    templates = ['add "Buy milk and bread for the weekend"', "mark-done {n}", 'update {n} "Call mom about the trip"',
+                 "delete {n}", "list todo --limit 20", "search milk bread --status todo"]
+    return [templates[n % len(templates)].format(n=n) for n in range(count)]
+
+
+def new_parse(lines):
+    for line in lines:
+        for parts in parse_commands(line):
+            COMMANDS[parts[0]].bind(parts[1:])
+
+
+def legacy_parse(lines):
+    for line in lines:
+        legacy_bind(legacy_parse_input(line))
+
+
+def run_parse_benchmarks(count, repeat=3, log=None):
+    """The function measures the lines/s of the old and the new command parser on count lines."""
+    lines = command_lines(count)
+    multi = ["; ".join(lines[number:number + 6]) for number in range(0, count, 6)]
+    results = []
+    for op, function, argument in (("parse-legacy", legacy_parse, lines), ("parse", new_parse, lines),
+                                   ("parse-multi", new_parse, multi)):
+        seconds, peak, _ = measure(lambda: function(argument), repeat)
+        results.append({"backend": "parser", "size": count, "op": op, "seconds": round(seconds, 6),
+                        "peak_bytes": peak, "bytes_written": None})
+        if log:
+            log(f"parser {op:<13} {count / seconds:12.0f} commands/s")
+    return results
+
+
+def write_results(results, path):
+    """The function writes the result records as JSON lines."""
+    with open(path, 'w') as file:
+        for record in results:
+            file.write(json.dumps(record) + "\n")
+
+
+def read_results(path):
+    """The function reads result records written by write_results."""
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def compare_results(results, baseline, tolerance):
+    """The function returns a message for every op slower than tolerance times its baseline."""
+    expected = {(record["backend"], record["size"], record["op"]): record["seconds"] for record in baseline}
+    regressions = []
+    for record in results:
+        before = expected.get((record["backend"], record["size"], record["op"]))
+        if before is None:
+            continue
+        if record["seconds"] > before * tolerance and record["seconds"] - before > NOISE_FLOOR:
+            regressions.append(
+                f"{record['backend']} {record['size']} {record['op']}: "
+                f"{record['seconds'] * 1000:.2f} ms, baseline {before * 1000:.2f} ms"
+            )
+    return regressions
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the tasker commands on growing task lists.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated list sizes (default: %(default)s)")
+    parser.add_argument("--backends", default=",".join(BACKEND_SUFFIXES),
+                        help="comma-separated backends out of json, journal, db, tbin (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per op, the best counts")
+    parser.add_argument("--parse", type=int, default=0, metavar="N",
+                        help="also benchmark the command parser on N lines")
+    parser.add_argument("--output", default="bench_output.txt", help="JSON lines result file")
+    parser.add_argument("--baseline", help="fail if an op got slower than in this result file")
+    parser.add_argument("--tolerance", type=float, default=2.0, help="allowed slowdown factor (default: 2.0)")
+    parser.add_argument("--save-baseline", help="also write the results to this file")
+    arguments = parser.parse_args(argv)
+    arguments.sizes = [int(size) for size in arguments.sizes.split(",") if size]
+    arguments.backends = arguments.backends.split(",")
+    unknown = set(arguments.backends) - set(BACKEND_SUFFIXES)
+    if unknown:
+        parser.error(f"unknown backends: {', '.join(sorted(unknown))}")
+    return arguments
+
+
+def main_bench(argv=None):
+    """The function runs the benchmarks from the command line and returns the exit status."""
+    arguments = parse_arguments(argv)
+    log = lambda line: print(line, file=sys.stderr)
+    results = run_benchmarks(arguments.sizes, arguments.backends, arguments.repeat, log=log)
+    if arguments.parse:
+        results += run_parse_benchmarks(arguments.parse, arguments.repeat, log=log)
+    write_results(results, arguments.output)
+    if arguments.save_baseline:
+        write_results(results, arguments.save_baseline)
+    if arguments.baseline:
+        regressions = compare_results(results, read_results(arguments.baseline), arguments.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            print(f"{len(regressions)} ops slower than {arguments.tolerance}x the baseline.", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_bench())
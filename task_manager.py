@@ -1,6 +1,83 @@
+import base64
+import csv
+import hashlib
+import io
 import json
-from datetime import datetime
-filename = "user_tasks.json"
+import lzma
+import math
+import mmap
+import os
+import re
+import select
+import shutil
+import socket
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager, nullcontext, redirect_stderr, redirect_stdout
+from datetime import datetime, timedelta
+from functools import lru_cache
+from heapq import merge, nlargest, nsmallest
+from itertools import chain, islice
+try:
+    import fcntl
+except ImportError:  # Windows: the lock then only covers threads of one process
+    fcntl = None
+filename = os.environ.get("TASKER_FILE", "user_tasks.json")
+# When the REPL writes changes: immediate, ops:N, ms:T or exit (see TaskStore)
+FLUSH_POLICY = os.environ.get("TASKER_FLUSH", "immediate")
+
+# Per-command profiling: on with TASKER_PROFILE=1 or --profile, see Profile
+PROFILE = os.environ.get("TASKER_PROFILE", "") not in {"", "0"}
+# cProfile stats of the last profiled command are dumped here if set
+CPROFILE_FILE = os.environ.get("TASKER_CPROFILE")
+# JSON-lines metrics file, "<task file>.metrics.jsonl" by default
+METRICS_FILE = os.environ.get("TASKER_METRICS")
+
+# tasker serve: Unix socket of the daemon ("<task file>.sock" by default) and
+# its write-behind policy, see TaskStore
+SOCKET_FILE = os.environ.get("TASKER_SOCKET")
+SERVE_FLUSH_POLICY = os.environ.get("TASKER_FLUSH", "ms:200")
+# tasker watch: seconds between mtime/size checks where inotify is missing
+WATCH_INTERVAL = 0.1
+
+# Named lists: the catalog maps list names to task files, see Catalog
+CATALOG_FILE = os.environ.get("TASKER_CATALOG", "tasker_lists.json")
+DEFAULT_LIST = "default"
+# Memory budget of the lists a session keeps loaded, see StoreCache
+CACHE_BUDGET = int(os.environ.get("TASKER_CACHE_MB", "256")) * 1024 * 1024
+# Estimated memory of one loaded task with its index entries (measured about 1 KB)
+TASK_MEMORY = 1024
+
+# Archive tier: done tasks older than this many days go to compressed segments
+ARCHIVE_DAYS = int(os.environ.get("TASKER_ARCHIVE_DAYS", "30"))
+ARCHIVE_COMPRESSION = os.environ.get("TASKER_ARCHIVE_COMPRESSION", "lzma")
+ARCHIVE_SEGMENT_TASKS = 50000
+
+# stats: relative accuracy of the lead-time percentiles and days of counts shown (see TaskStats)
+STATS_ACCURACY = 0.01
+STATS_DAYS = 14
+
+# Bulk mark/delete: ID ranges covering at most this many IDs are looked up one by one, wider ones scan the list
+BULK_LOOKUP_IDS = 10000
+
+# JSON storage: list --limit streams files of at least this size, smaller ones (and lists without a limit) are read whole
+JSON_STREAM_BYTES = 1024 * 1024
+# Journal storage: files ending with this suffix are append-only logs
+JOURNAL_SUFFIX = ".journal"
+JOURNAL_MAX_RECORDS = 1000
+JOURNAL_MAX_BYTES = 1024 * 1024
+# SQLite storage logs which IDs the last this many commits changed, for readers catching up
+SQLITE_CHANGE_LOG = 1000
+# Binary storage: files ending with this suffix hold fixed-width records (see BinaryBackend)
+BINARY_SUFFIX = ".tbin"
+# The string heap of a binary file is rewritten once this much of it is unused
+BINARY_HEAP_GARBAGE = 1024 * 1024
 
 # ANSI-colors
 COLOR_RESET = "\033[0m"
@@ -23,6 +100,20 @@ def get_colored_status(status):
     return f"{color_code}{status}{COLOR_RESET}"
 
 
+def display_width(text):
+    """The function returns how many terminal columns text takes: East Asian wide characters
+    count two, combining marks none."""
+    if text.isascii():
+        return len(text)
+    return _wide_display_width(text)
+
+
+@lru_cache(maxsize=65536)
+def _wide_display_width(text):
+    return sum(0 if unicodedata.combining(char) else 2 if unicodedata.east_asian_width(char) in "WF" else 1
+               for char in text)
+
+
 def check_file(filename):
     """The function checks if a file exists in a directory and creates it otherwise."""
     try:
@@ -32,372 +123,4809 @@ def check_file(filename):
         pass
 
 
+def write_file(filename, text):
+    """The function replaces a file's content by writing a temporary file and renaming it."""
+    with profile_phase("write"):
+        tmp_filename = f"{filename}.tmp"
+        with open(tmp_filename, 'w') as file:
+            file.write(text)
+        os.replace(tmp_filename, filename)
+
+
 def crush_program(reason):
     """The function terminates the program when an error occurs."""
     raise SystemExit(f"Error: {reason}")
     
 
+# One word of a command line: plain characters, \-escapes of quotes, backslashes,
+# ";" and blanks, and "quoted parts" that may contain blanks and ";".
+_WORD = r'(?:[^\s"\\;]+|\\[\s"\\;]|\\|"(?:[^"\\]|\\["\\]|\\)*"?)+'
+COMMAND_TOKEN = re.compile(r'(;)|(' + _WORD + ')')
+INPUT_TOKEN = re.compile(_WORD.replace(';', ''))
+UNQUOTE = re.compile(r'\\([\s"\\;])|"')
+
+
+def _unquote(word):
+    if '"' not in word and '\\' not in word:
+        return word
+    if word[0] == '"' and word[-1] == '"' and len(word) > 1 and '"' not in word[1:-1] and '\\' not in word:
+        return word[1:-1]
+    return UNQUOTE.sub(lambda match: match.group(1) or '', word)
+
+
 def parse_input(users_input):
-    """The function splits a string into parts, taking into account spaces and quotation marks."""
+    """The function splits a string into parts, taking into account spaces, quotation marks
+    and backslash escapes (\\" is a literal quote)."""
+    return [_unquote(word) for word in INPUT_TOKEN.findall(users_input)]
+
+
+def _split_unescaped(line):
+    """Splits a line without backslashes: quotes toggle, blanks and ";" separate outside them."""
+    commands = []
+    parts = []
+    word = None  # the word being built, None between words
+    for number, segment in enumerate(line.split('"')):
+        if number % 2:
+            word = segment if word is None else word + segment
+            continue
+        for position, chunk in enumerate(segment.split(';')):
+            if position:
+                if word is not None:
+                    parts.append(word)
+                    word = None
+                if parts:
+                    commands.append(parts)
+                    parts = []
+            if not chunk:
+                continue
+            if chunk[0].isspace() and word is not None:
+                parts.append(word)
+                word = None
+            words = chunk.split()
+            if not words:
+                continue
+            if word is not None:
+                words[0] = word + words[0]
+            word = None if chunk[-1].isspace() else words.pop()
+            parts.extend(words)
+    if word is not None:
+        parts.append(word)
+    if parts:
+        commands.append(parts)
+    return commands
+
+
+def parse_commands(line):
+    """The function splits a command line into the parts of each ";"-separated command, in one pass."""
+    if '\\' not in line:
+        if '"' in line:
+            return _split_unescaped(line)
+        # Nothing to unquote: str.split does it at C speed.
+        if ';' not in line:
+            parts = line.split()
+            return [parts] if parts else []
+        return [parts for parts in map(str.split, line.split(';')) if parts]
+    commands = []
     parts = []
-    current_part = []
-    in_quotes = False
-
-    for char in users_input:
-        if char == '"':
-            in_quotes = not in_quotes
-        elif char == ' ':
-            if in_quotes == False:
-                parts.append(''.join(current_part))
-                current_part = []
-            elif in_quotes == True:
-                current_part.append(char)
+    for separator, word in COMMAND_TOKEN.findall(line):
+        if separator:
+            if parts:
+                commands.append(parts)
+            parts = []
         else:
-            current_part.append(char)
-    
-    if current_part:
-        parts.append(''.join(current_part))
-        current_part = []
- 
-    return parts
+            parts.append(_unquote(word))
+    if parts:
+        commands.append(parts)
+    return commands
 
 
-def add_task(data, filename):
-    """The function adds a new task to our dictionary."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
+TIMESTAMP_FORMAT = '%d.%m.%Y %H:%M:%S'
+_hour_epochs = {}
+_minute_strings = {}
+
+
+def parse_timestamp(value):
+    """The function converts a 'dd.mm.YYYY HH:MM:SS' string into epoch seconds, None if it can't."""
+    if not isinstance(value, str) or len(value) != 19 or value[13] != ':' or value[16] != ':':
+        return None
+    # strptime is slow, so only the hour goes through it (DST changes on the hour).
+    hour = value[:13]
+    base = _hour_epochs.get(hour)
+    if base is None:
         try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            id = 1
-            created_at = datetime.now().strftime('%d.%m.%Y %H:%M:%S')
-            tasks_dict[id] = [data, "todo", created_at, "N/A"]
-        else:
-            id = len(tasks_dict) + 1
-            created_at = datetime.now().strftime('%d.%m.%Y %H:%M:%S')
-            tasks_dict[id] = [data, "todo", created_at, "N/A"]
+            base = int(datetime.strptime(hour, '%d.%m.%Y %H').timestamp())
+        except ValueError:
+            return None
+        _hour_epochs[hour] = base
+    minutes, seconds = value[14:16], value[17:19]
+    if not (minutes.isdigit() and seconds.isdigit()) or minutes >= "60" or seconds >= "60":
+        return None
+    return base + int(minutes) * 60 + int(seconds)
 
-    with open(filename, 'w') as file:
-        json.dump(tasks_dict, file)
 
+def format_timestamp(value):
+    """The function renders a task timestamp: epoch seconds, None for "N/A" or a legacy string."""
+    if value is None:
+        return "N/A"
+    if isinstance(value, str):
+        return value
+    # Time zone offsets are whole minutes, so only the minute goes through strftime.
+    minute, seconds = divmod(value, 60)
+    prefix = _minute_strings.get(minute)
+    if prefix is None:
+        if len(_minute_strings) >= 100000:
+            _minute_strings.clear()
+        prefix = _minute_strings[minute] = datetime.fromtimestamp(minute * 60).strftime('%d.%m.%Y %H:%M:')
+    return f"{prefix}{seconds:02d}"
 
-def delete_task(id, filename):
-    """The function delete a task to our dictionary."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
+
+def now_timestamp():
+    """The function returns the current time in whole epoch seconds."""
+    return int(time.time())
+
+
+PROFILE_PHASES = ["load", "mutate", "serialize", "write", "render", "other"]
+_profile = None
+
+
+def read_io_counters():
+    """The function returns the (read, written) byte counters of this process, (None, None) without /proc."""
+    counters = {}
+    try:
+        with open("/proc/self/io") as file:
+            for line in file:
+                name, _, value = line.partition(":")
+                counters[name] = int(value)
+    except (OSError, ValueError):
+        return None, None
+    return counters.get("rchar"), counters.get("wchar")
+
+
+class Profile:
+    """Wall time per phase and counters of one command.
+
+    Phases nest: time spent in an inner phase (a "write" inside "mutate")
+    counts only towards the inner one, and whatever no phase claims is
+    "other". Only the thread that started the command is measured, so a
+    background journal compaction doesn't mix in. Bytes come from
+    /proc/self/io and include the command's own output.
+    """
+
+    def __init__(self, command):
+        self.command = command
+        self.thread = threading.get_ident()
+        self.phases = {}
+        self.counters = {}
+        self.stack = []
+        self.read, self.written = read_io_counters()
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        now = time.perf_counter()
+        if self.stack:
+            outer, since = self.stack[-1]
+            self.phases[outer] = self.phases.get(outer, 0) + now - since
+        self.stack.append([name, now])
         try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            crush_program("You can't delete the task because the to-do list is empty now.")
-        else:
-            if id in tasks_dict.keys():
-                key_exists = True
-            else:
-                key_exists = False
-            
-            if key_exists:
-                tasks_dict.pop(id)
-
-                values = []
-                for value in tasks_dict.values():
-                    values.append(value)
-
-                tasks_dict = {}
-                for key in range(1, len(values) + 1):
-                    tasks_dict[key] = values[key - 1]
-                    
-            else:
-                crush_program("You can't delete this task because it's not on the to-do list.")
+            yield
+        finally:
+            now = time.perf_counter()
+            name, since = self.stack.pop()
+            self.phases[name] = self.phases.get(name, 0) + now - since
+            if self.stack:
+                self.stack[-1][1] = now
 
-    with open(filename, 'w') as file:
-        json.dump(tasks_dict, file)
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
 
+    def finish(self):
+        """Returns the metrics record of the command."""
+        total = time.perf_counter() - self.started
+        read, written = read_io_counters()
+        phases = {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()}
+        phases["other"] = round(max(total - sum(self.phases.values()), 0) * 1000, 3)
+        return {
+            "time": now_timestamp(),
+            "command": self.command,
+            "total_ms": round(total * 1000, 3),
+            "phases_ms": phases,
+            "bytes_read": None if read is None else read - self.read,
+            "bytes_written": None if written is None else written - self.written,
+            "tasks_scanned": self.counters.get("tasks_scanned", 0),
+            "tasks_emitted": self.counters.get("tasks_emitted", 0),
+        }
 
-def update_task(id, data, filename):
-    """The function update a current task to our dictionary."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
+
+def profile_phase(name):
+    """The function returns a context manager timing a phase of the profiled command, a no-op otherwise."""
+    if _profile is None or _profile.thread != threading.get_ident():
+        return nullcontext()
+    return _profile.phase(name)
+
+
+def profile_count(name, amount=1):
+    """The function adds to a counter of the profiled command."""
+    if _profile is not None and _profile.thread == threading.get_ident():
+        _profile.count(name, amount)
+
+
+def profile_rows(rows):
+    """The function counts the rows a list emits and times reading them as "load" while profiling."""
+    if _profile is None:
+        return rows
+
+    def timed():
+        iterator = iter(rows)
+        while True:
+            with profile_phase("load"):
+                row = next(iterator, None)
+            if row is None:
+                return
+            profile_count("tasks_emitted")
+            yield row
+
+    return timed()
+
+
+def metrics_filename(task_filename):
+    """The function returns the metrics file of a task file."""
+    return METRICS_FILE or f"{task_filename}.metrics.jsonl"
+
+
+def format_profile(record):
+    """The function renders a metrics record as one line for stderr."""
+    phases = ", ".join(f"{name} {record['phases_ms'][name]:.1f}"
+                       for name in PROFILE_PHASES if record["phases_ms"].get(name))
+    line = f"[profile] {record['command']}: {record['total_ms']:.1f} ms ({phases})"
+    if record["bytes_read"] is not None:
+        line += f", read {record['bytes_read']} B, written {record['bytes_written']} B"
+    return line + f", scanned {record['tasks_scanned']}, emitted {record['tasks_emitted']}"
+
+
+def profiled(command, task_filename, function, *args, enabled=None):
+    """The function runs function(*args) as one command, profiling it if enabled (default PROFILE).
+
+    The metrics go to stderr and are appended to the metrics file; with
+    CPROFILE_FILE set the cProfile stats of the command are dumped there.
+    """
+    global _profile
+    if not (PROFILE if enabled is None else enabled) or _profile is not None:
+        return function(*args)
+    profiler = None
+    if CPROFILE_FILE:
+        import cProfile
+        profiler = cProfile.Profile()
+    _profile = Profile(command)
+    try:
+        if profiler is None:
+            return function(*args)
+        return profiler.runcall(function, *args)
+    finally:
+        record = _profile.finish()
+        _profile = None
+        if profiler is not None:
+            profiler.dump_stats(CPROFILE_FILE)
+        print(format_profile(record), file=sys.stderr)
+        with open(metrics_filename(task_filename), 'a') as file:
+            file.write(json.dumps(record) + "\n")
+
+
+def read_metrics(path, last=None):
+    """The function returns the last metrics records of a metrics file (all if last is None)."""
+    try:
+        with open(path, 'r') as file:
+            lines = file.readlines()
+    except FileNotFoundError:
+        return []
+    records = []
+    for line in lines[-last:] if last else lines:
         try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            crush_program("You can't update the task because the to-do list is empty now.")
-        else:
-            if id in tasks_dict.keys():
-                key_exists = True
-            else:
-                key_exists = False
-            
-            if key_exists:
-                status = tasks_dict[id][1]
-                created_at = tasks_dict[id][2]
-                updated_at = datetime.now().strftime('%d.%m.%Y %H:%M:%S')
-                tasks_dict[id] = [data, status, created_at, updated_at]
-            else:
-                crush_program("You can't update this task because it's not on the to-do list.")
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
 
-    with open(filename, 'w') as file:
-        json.dump(tasks_dict, file)
 
+class Task:
+    """One task: description, interned status and epoch-second timestamps.
 
-def update_status(id, status, filename):
-    """The function update a current status for task to our dictionary."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
+    updated is None until the description is first changed, completed is
+    when the task was last marked done (None while it isn't). Timestamps
+    that came from a legacy file and don't parse are kept as the original
+    string. A description longer than BLOB_THRESHOLD lives in the
+    BlobStore: blob is its hash and description only a short preview.
+    """
+
+    __slots__ = ("description", "status", "created", "updated", "blob", "completed")
+
+    def __init__(self, description, status, created, updated=None, blob=None, completed=None):
+        self.description = description
+        self.status = sys.intern(status)
+        self.created = created
+        self.updated = updated
+        self.blob = blob
+        self.completed = completed
+
+    @classmethod
+    def from_list(cls, values):
+        """Converts [description, status, created, updated(, blob(, completed))] with either legacy
+        'dd.mm.YYYY HH:MM:SS'/"N/A" strings or epoch seconds/None."""
+        description, status, created, updated, *extra = values
+        if isinstance(created, str):
+            created = parse_timestamp(created) or created
+        if updated == "N/A":
+            updated = None
+        elif isinstance(updated, str):
+            updated = parse_timestamp(updated) or updated
+        blob = extra[0] if extra else None
+        completed = extra[1] if len(extra) > 1 else None
+        if isinstance(completed, str):
+            completed = parse_timestamp(completed) or completed
+        return cls(description, status, created, updated, blob, completed)
+
+    def _extra(self, completed):
+        if self.completed is not None:
+            return [self.blob, completed]
+        if self.blob is not None:
+            return [self.blob]
+        return []
+
+    def to_list(self):
+        """Returns the legacy [description, status, created, updated] layout, plus the blob hash
+        and completion time if set."""
+        return [self.description, self.status, format_timestamp(self.created), format_timestamp(self.updated),
+                *self._extra(format_timestamp(self.completed))]
+
+    def to_row(self):
+        """Returns [description, status, created, updated] with epoch seconds, plus the blob hash
+        and completion time if set."""
+        return [self.description, self.status, self.created, self.updated, *self._extra(self.completed)]
+
+    def __eq__(self, other):
+        if not isinstance(other, Task):
+            return NotImplemented
+        return self.to_row() == other.to_row()
+
+    def __repr__(self):
+        extra = f", blob={self.blob!r}" if self.blob is not None else ""
+        if self.completed is not None:
+            extra += f", completed={self.completed!r}"
+        return f"Task({self.description!r}, {self.status!r}, {self.created!r}, {self.updated!r}{extra})"
+
+
+# Descriptions longer than this many characters are moved into the BlobStore
+BLOB_THRESHOLD = 1024
+# Characters of such a description kept inline and shown by the lists
+PREVIEW_LENGTH = 60
+# Stored search indexes of another version are built again: 2 indexes the whole text of long descriptions
+SEARCH_INDEX_VERSION = 2
+
+
+class BlobStore:
+    """Content-addressed description texts next to a task file.
+
+    Each text is stored once, UTF-8 encoded, as "<file>.blobs/<sha256[:2]>/<sha256[2:]>",
+    so identical descriptions share one file and the task file keeps only
+    the hash and a preview. Blobs are never rewritten: a changed text gets a
+    new hash.
+    """
+
+    def __init__(self, filename):
+        self.directory = f"{store_filename(filename)}.blobs"
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest[:2], digest[2:])
+
+    def put(self, text):
+        """Stores text if it isn't there yet and returns its hash."""
+        data = text.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def get(self, digest):
+        """Returns the stored text, None if the blob is missing."""
         try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            crush_program("You can't mark this task because the to-do list is empty now.")
+            with open(self.path(digest), 'rb') as file:
+                return file.read().decode('utf-8')
+        except FileNotFoundError:
+            return None
+
+
+def store_filename(filename):
+    """The function returns the path of a task file given as a path or a TaskStore."""
+    return filename.filename if isinstance(filename, TaskStore) else str(filename)
+
+
+def preview(text):
+    """The function returns the inline preview of a long description: its first line, truncated."""
+    line = text.split("\n", 1)[0]
+    return line[:PREVIEW_LENGTH - 1].rstrip() + "…"
+
+
+def new_task(filename, description, status, created, updated=None):
+    """The function builds a Task, moving a description above BLOB_THRESHOLD into the task file's blob store."""
+    if len(description) <= BLOB_THRESHOLD:
+        return Task(description, status, created, updated)
+    return Task(preview(description), status, created, updated, BlobStore(filename).put(description))
+
+
+def full_description(filename, task):
+    """The function returns a task's whole description, fetched from the blob store if it was moved there."""
+    if task.blob is None:
+        return task.description
+    text = BlobStore(filename).get(task.blob)
+    if text is None:
+        crush_program(f"The description of this task is missing from \"{BlobStore(filename).directory}\".")
+    return text
+
+
+def tasks_from_lists(tasks_dict):
+    """The function converts a legacy {id: [description, status, created, updated]} dictionary."""
+    return {str(id): Task.from_list(values) for id, values in tasks_dict.items()}
+
+
+class LazyTasks(dict):
+    """{id: Task} dictionary over the rows of a task file: a row becomes a Task (Task.from_list())
+    the first time it is read, so a command that touches a few tasks converts only those,
+    and rows() hands the others back as they were read."""
+
+    def __getitem__(self, id):
+        value = dict.__getitem__(self, id)
+        if type(value) is list:
+            value = Task.from_list(value)
+            dict.__setitem__(self, id, value)
+        return value
+
+    def get(self, id, default=None):
+        value = dict.get(self, id, default)
+        if type(value) is list:
+            value = Task.from_list(value)
+            dict.__setitem__(self, id, value)
+        return value
+
+    def pop(self, id, *default):
+        value = dict.pop(self, id, *default)
+        return Task.from_list(value) if type(value) is list else value
+
+    def __iter__(self):
+        # Not dict's own iterator, so dict(lazy) copies through __getitem__ instead of the raw rows.
+        return dict.__iter__(self)
+
+    def items(self):
+        return ((id, self[id]) for id in list(dict.__iter__(self)))
+
+    def values(self):
+        return (self[id] for id in list(dict.__iter__(self)))
+
+    def rows(self):
+        """Returns {id: legacy list} (see Task.to_list()) for writing, unread rows as they were read."""
+        return {id: value if type(value) is list else value.to_list() for id, value in dict.items(self)}
+
+
+def max_task_id(tasks_dict):
+    """The function returns the highest numeric task ID, 0 for an empty list."""
+    return max((int(id) for id in tasks_dict if str(id).isdigit()), default=0)
+
+
+def task_id_key(id):
+    """The function returns a sort key that orders numeric task IDs by value."""
+    return (len(id), id)
+
+
+class StatusIndex:
+    """Per-status {id: description length} maps kept next to a task dictionary.
+
+    Filtered lists use it to find, count and size their rows while looking
+    only at the tasks with that status.
+    """
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses if statuses is not None else {}
+
+    @classmethod
+    def build(cls, tasks_dict):
+        index = cls()
+        for id, task in (tasks_dict or {}).items():
+            index.add(id, task)
+        return index
+
+    def add(self, id, task):
+        self.statuses.setdefault(task.status, {})[str(id)] = display_width(task.description)
+
+    def remove(self, id):
+        for status, ids in list(self.statuses.items()):
+            if ids.pop(str(id), None) is not None and not ids:
+                del self.statuses[status]
+
+    def ids(self, status):
+        # task_id_key order from two C-level sorts (the second one is stable), no key tuples.
+        return sorted(sorted(self.statuses.get(status, {})), key=len)
+
+    def count(self, status):
+        return len(self.statuses.get(status, {}))
+
+    def max_width(self, status=None):
+        if status is None:
+            return max((self.max_width(status) for status in self.statuses), default=0)
+        return max(self.statuses.get(status, {}).values(), default=0)
+
+
+class TimeIndex:
+    """Created and updated timestamps kept as sorted parallel lists.
+
+    Every field maps to [timestamps, ids] sorted by timestamp and then ID, so
+    range queries are two bisects plus the k matching IDs, and tasks sharing
+    a timestamp (a bulk import) are still found by bisect on change. Legacy
+    timestamps that are not epoch seconds are left out.
+    """
+
+    FIELDS = ("created", "updated")
+
+    def __init__(self, fields=None):
+        self.fields = fields if fields is not None else {field: [[], []] for field in self.FIELDS}
+
+    @classmethod
+    def build(cls, tasks_dict):
+        fields = {}
+        for field in cls.FIELDS:
+            entries = sorted(
+                ((getattr(task, field), id) for id, task in (tasks_dict or {}).items()
+                 if isinstance(getattr(task, field), int)),
+                key=lambda entry: (entry[0], task_id_key(entry[1])),
+            )
+            fields[field] = [[stamp for stamp, _ in entries], [id for _, id in entries]]
+        return cls(fields)
+
+    def _position(self, field, stamp, id):
+        stamps, ids = self.fields[field]
+        low = bisect_left(stamps, stamp)
+        high = bisect_right(stamps, stamp, low)
+        return bisect_left(ids, task_id_key(id), low, high, key=task_id_key)
+
+    def _insert(self, field, stamp, id):
+        if isinstance(stamp, int):
+            stamps, ids = self.fields[field]
+            if not stamps or (stamps[-1], task_id_key(ids[-1])) < (stamp, task_id_key(id)):
+                # The usual case: a new task is the newest one.
+                stamps.append(stamp)
+                ids.append(id)
+                return
+            position = self._position(field, stamp, id)
+            stamps.insert(position, stamp)
+            ids.insert(position, id)
+
+    def _delete(self, field, stamp, id):
+        if isinstance(stamp, int):
+            stamps, ids = self.fields[field]
+            position = self._position(field, stamp, id)
+            if position < len(ids) and stamps[position] == stamp and ids[position] == id:
+                del stamps[position]
+                del ids[position]
+
+    def add(self, id, task):
+        for field in self.FIELDS:
+            self._insert(field, getattr(task, field), str(id))
+
+    def remove(self, id, task):
+        for field in self.FIELDS:
+            self._delete(field, getattr(task, field), str(id))
+
+    def replace(self, id, old, task):
+        """Moves the entries of a changed task, leaving unchanged timestamps alone."""
+        for field in self.FIELDS:
+            if getattr(old, field) != getattr(task, field):
+                self._delete(field, getattr(old, field), str(id))
+                self._insert(field, getattr(task, field), str(id))
+
+    def ids_between(self, field, since=None, until=None):
+        """Returns the IDs whose field lies in [since, until], None meaning open."""
+        stamps, ids = self.fields[field]
+        low = 0 if since is None else bisect_left(stamps, since)
+        high = len(stamps) if until is None else bisect_right(stamps, until)
+        return ids[low:high]
+
+    def walk(self, field, after=None, descending=False):
+        """Yields the IDs in (field, ID) order, or the reverse, that come after the
+        (timestamp, ID) key after; None starts from the beginning."""
+        stamps, ids = self.fields[field]
+        if after is None:
+            position = len(ids) if descending else 0
         else:
-            if id in tasks_dict.keys():
-                key_exists = True
-            else:
-                key_exists = False
-            
-            if key_exists:
-                tasks_dict[id][1] = status
-            else:
-                 crush_program("You can't mark this task because it's not on the to-do list.")
-    
-    with open(filename, 'w') as file:
-        json.dump(tasks_dict, file)
+            stamp, id = after
+            position = self._position(field, stamp, id)
+            if not descending and position < len(ids) and stamps[position] == stamp and ids[position] == id:
+                position += 1
+        if descending:
+            for position in range(position - 1, -1, -1):
+                yield ids[position]
+        else:
+            for position in range(position, len(ids)):
+                yield ids[position]
 
 
-def show_full_list(filename):
-    """The function displays a list of all tasks."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
-        try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            crush_program("You can't see this list because the to-do list is empty now.")
+def in_period(task, since=None, until=None, updated_since=None):
+    """The function checks a task against created [since, until] and updated >= updated_since."""
+    if since is not None or until is not None:
+        if not isinstance(task.created, int):
+            return False
+        if since is not None and task.created < since:
+            return False
+        if until is not None and task.created > until:
+            return False
+    if updated_since is not None:
+        return isinstance(task.updated, int) and task.updated >= updated_since
+    return True
+
+
+WORD = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """The function returns the set of lowercase words of a text, as the search index stores them."""
+    return set(WORD.findall(text.lower()))
+
+
+def parse_query(query):
+    """The function turns a search query into groups of terms: "a b OR c*" is [["a", "b"], ["c*"]].
+
+    Terms of a group must all match (AND), any group may match (OR). A term
+    ending with "*" matches every word that starts with it.
+    """
+    groups = [[]]
+    for word in query.split():
+        if word == "OR":
+            groups.append([])
+            continue
+        tokens = WORD.findall(word.lower())
+        if tokens and word.endswith("*"):
+            tokens[-1] += "*"
+        groups[-1].extend(tokens)
+    return [group for group in groups if group]
+
+
+@lru_cache(maxsize=4096)
+def _blob_tokens(filename, digest):
+    text = BlobStore(filename).get(digest)
+    return None if text is None else frozenset(tokenize(text))
+
+
+def task_tokens(task, filename=None):
+    """The function returns the words search finds a task by: those of its whole description,
+    read from the blob store of filename for long ones (their preview if it is missing)."""
+    if task.blob is None or filename is None:
+        return tokenize(task.description)
+    return _blob_tokens(store_filename(filename), task.blob) or tokenize(task.description)
+
+
+def may_match(text, groups):
+    """The function checks that every term of some query group occurs in text at all: a word of a
+    description is part of its text, so this cheap check rules most tasks out before tokenizing."""
+    text = text.lower()
+    return any(all(term.rstrip("*") in text for term in group) for group in groups)
+
+
+def matches_query(task, groups, filename=None):
+    """The function checks a task description against parsed query groups without an index."""
+    if (task.blob is None or filename is None) and not may_match(task.description, groups):
+        return False
+    tokens = task_tokens(task, filename)
+    def matches(term):
+        if term.endswith("*"):
+            return any(token.startswith(term[:-1]) for token in tokens)
+        return term in tokens
+    return any(all(matches(term) for term in group) for group in groups)
+
+
+class SearchIndex:
+    """Inverted index from description words to the IDs of the tasks that contain them.
+
+    Exact terms are one dictionary lookup; prefix terms bisect a sorted word
+    list that is rebuilt only after a word was added or dropped. Long
+    descriptions are indexed with their whole text from the blob store of
+    filename (see task_tokens()).
+    """
+
+    def __init__(self, postings=None, filename=None):
+        self.postings = {token: set(ids) for token, ids in (postings or {}).items()}
+        self.filename = filename
+        self.sorted_tokens = None
+
+    @classmethod
+    def build(cls, tasks_dict, filename=None):
+        index = cls(filename=filename)
+        for id, task in (tasks_dict or {}).items():
+            index.add(id, task)
+        return index
+
+    def add(self, id, task):
+        for token in task_tokens(task, self.filename):
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                self.sorted_tokens = None
+            ids.add(str(id))
+
+    def remove(self, id, task):
+        for token in task_tokens(task, self.filename):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(str(id))
+                if not ids:
+                    del self.postings[token]
+                    self.sorted_tokens = None
+
+    def matches(self, term):
+        """Returns the IDs of the tasks containing a word, or any word starting with "prefix*"."""
+        if not term.endswith("*"):
+            return self.postings.get(term, set())
+        if self.sorted_tokens is None:
+            self.sorted_tokens = sorted(self.postings)
+        prefix = term[:-1]
+        ids = set()
+        for position in range(bisect_left(self.sorted_tokens, prefix), len(self.sorted_tokens)):
+            token = self.sorted_tokens[position]
+            if not token.startswith(prefix):
+                break
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, groups):
+        """Returns the set of IDs matching parsed query groups, see parse_query."""
+        found = set()
+        for group in groups:
+            # Intersecting from the rarest term keeps the intermediate sets small.
+            postings = sorted((self.matches(term) for term in group), key=len)
+            ids = postings[0]
+            for other in postings[1:]:
+                ids = ids & other
+                if not ids:
+                    break
+            found |= ids
+        return found
+
+    def to_json(self):
+        return {token: list(ids) for token, ids in self.postings.items()}
+
+
+@lru_cache(maxsize=65536)
+def _local_day(quarter):
+    return time.strftime("%Y-%m-%d", time.localtime(quarter * 900))
+
+
+def local_day(timestamp):
+    """The function returns the local day ("YYYY-MM-DD") of an epoch timestamp."""
+    # Time zones are whole quarter hours off UTC, so a quarter hour never spans two days.
+    return _local_day(timestamp // 900)
+
+
+class TaskStats:
+    """Aggregates of a task list that every put and delete keeps up to date, so
+    "stats" reads them instead of the tasks.
+
+    counts    - tasks per status
+    created   - tasks created per local day ("YYYY-MM-DD")
+    completed - done tasks per day they were finished (completed_at())
+    lead      - seconds from creation to done in a log-bucketed sketch:
+                a lead time v counts in bucket ceil(log(v) / log(GAMMA)), so
+                percentiles are within STATS_ACCURACY of the true value, and
+                a task that is marked todo again or deleted is taken out exactly
+    Tasks with legacy text timestamps only count per status.
+    """
+
+    GAMMA = (1 + STATS_ACCURACY) / (1 - STATS_ACCURACY)
+
+    def __init__(self, data=None):
+        data = data or {}
+        self.counts = data.get("counts", {})
+        self.created = data.get("created", {})
+        self.completed = data.get("completed", {})
+        self.lead = {int(bucket): count for bucket, count in data.get("lead", {}).items()}
+
+    @classmethod
+    def build(cls, rows):
+        stats = cls()
+        for _, task in rows:
+            stats.change(None, task)
+        return stats
+
+    @staticmethod
+    def _bump(counts, key, step):
+        count = counts.get(key, 0) + step
+        if count:
+            counts[key] = count
         else:
+            counts.pop(key, None)
 
-            if not tasks_dict:
-                print("Nothing to display.")
-                return
+    def _count(self, task, step):
+        self._bump(self.counts, task.status, step)
+        if isinstance(task.created, int):
+            self._bump(self.created, local_day(task.created), step)
+        done = completed_at(task) if task.status == "done" else None
+        if isinstance(done, int):
+            self._bump(self.completed, local_day(done), step)
+            if isinstance(task.created, int):
+                self._bump(self.lead, self.bucket(done - task.created), step)
+
+    def change(self, old, new):
+        """Counts a task that was old and is new now, either of them None if missing."""
+        if old is not None:
+            self._count(old, -1)
+        if new is not None:
+            self._count(new, 1)
+
+    def merged(self, other):
+        """Returns the stats of both task sets together."""
+        stats = TaskStats()
+        for part in (self, other):
+            for name in ("counts", "created", "completed", "lead"):
+                for key, count in getattr(part, name).items():
+                    self._bump(getattr(stats, name), key, count)
+        return stats
+
+    @classmethod
+    def bucket(cls, seconds):
+        return -1 if seconds < 1 else math.ceil(math.log(seconds) / math.log(cls.GAMMA))
 
-            max_task_len = max(len(value[0]) for value in tasks_dict.values())
-
-            print("\n")
-            header = f"{'ID':<3} | {'Task':<{max_task_len}} | {'Status':<12} | {'Created':<20} | {'Updated':<19}"
-            print(header)
-            print("-" * len(header))
-
-            for key, value in tasks_dict.items():
-                status = get_colored_status(value[1])
-                created_at = value[2]
-                updated_at = value[3] 
-                line = (
-                    f"{key:<3} | "
-                    f"{value[0]:<{max_task_len}} | "
-                    f"{status:<{12 + len(status) - len(value[1])}} | " 
-                    f"{created_at:<20} | "
-                    f"{updated_at:<19}"
-                )
-                print(line)
-            print("\n")
-
-
-def show_done_list(filename):
-    """The function displays a list of done tasks."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
+    def percentile(self, fraction):
+        """Returns the lead time in seconds that fraction of the done tasks stayed within, None without any."""
+        total = sum(self.lead.values())
+        if not total:
+            return None
+        rank = fraction * (total - 1)
+        seen = 0
+        for bucket in sorted(self.lead):
+            seen += self.lead[bucket]
+            if seen > rank:
+                return 0 if bucket < 0 else 2 * self.GAMMA ** bucket / (self.GAMMA + 1)
+
+    def to_json(self):
+        return {"counts": self.counts, "created": self.created, "completed": self.completed,
+                "lead": {str(bucket): count for bucket, count in self.lead.items()}}
+
+
+def stats_filename(filename):
+    """The function returns the file the TaskStats of a task file are saved in."""
+    return store_filename(filename) + ".stats"
+
+
+def read_stats(filename):
+    """The function returns the TaskStats saved next to a task file, None if there are none
+    or the task file changed after they were saved (an older tasker, an edit by hand)."""
+    try:
+        with open(stats_filename(filename), 'r') as file:
+            data = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+    if data.get("signature") != file_signature([store_filename(filename)]):
+        return None
+    return TaskStats(data)
+
+
+def restamp_stats(filename, signature):
+    """The function re-stamps the saved TaskStats of a task file that was rewritten without
+    changing its tasks (journal compaction), if they were of the file at signature."""
+    try:
+        with open(stats_filename(filename), 'r') as file:
+            data = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return
+    if data.get("signature") == signature:
+        data["signature"] = file_signature([filename])
+        write_file(stats_filename(filename), json.dumps(data))
+
+
+def write_stats(filename, stats):
+    """The function saves TaskStats next to a task file, stamped with the file's mtime and size."""
+    write_file(stats_filename(filename),
+               json.dumps({"signature": file_signature([store_filename(filename)]), **stats.to_json()}))
+
+
+class FileLock:
+    """Advisory lock on "<file>.lock" held around every read-modify-write of a task file.
+
+    fcntl.flock keeps other processes out and an RLock other threads of
+    this one. Both are reentrant within a thread, so nested backends on the
+    same file don't deadlock. Use get_file_lock() to share one per file.
+    """
+
+    def __init__(self, filename):
+        self.path = str(filename) + ".lock"
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+    def acquire(self):
+        self.thread_lock.acquire()
+        if self.depth == 0:
+            self.file = open(self.path, 'a')
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.depth += 1
+
+    def release(self):
+        self.depth -= 1
+        if self.depth == 0:
+            if fcntl is not None:
+                fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+            self.file = None
+        self.thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.release()
+
+
+_file_locks = {}
+
+
+def get_file_lock(filename):
+    """The function returns the shared lock object for a task file."""
+    key = os.path.abspath(str(filename))
+    if key not in _file_locks:
+        _file_locks[key] = FileLock(key)
+    return _file_locks[key]
+
+
+class Journal:
+    """Append-only task log folded into a snapshot by compaction.
+
+    Every mutation appends one JSON line ({"seq", "op", "id", "task"}) to the
+    journal file, tasks stored as Task.to_row() lists. The snapshot next to it ("<journal>.snapshot") holds the
+    whole task dictionary, its status, time and search indexes, the next free task
+    ID and the sequence number of the last record folded into it, so records
+    left over by an interrupted compaction are skipped on replay.
+    """
+
+    def __init__(self, filename, max_records=JOURNAL_MAX_RECORDS, max_bytes=JOURNAL_MAX_BYTES):
+        self.filename = str(filename)
+        self.snapshot_filename = self.filename + ".snapshot"
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.next_id = 1
+        self.index = StatusIndex()
+        self.times = TimeIndex()
+        self.terms = SearchIndex(filename=filename)
+        self.records = 0
+        self.size = 0
+        self.snapshot_signature = None
+        self._compactor = None
+
+    def _read_snapshot(self):
         try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            crush_program("You can't see this list because the to-do list is empty now.")
+            with open(self.snapshot_filename, 'r') as file:
+                snapshot = json.load(file)
+        except FileNotFoundError:
+            return {"seq": 0, "next_id": 1, "tasks": None, "index": StatusIndex(), "times": TimeIndex(),
+                    "terms": SearchIndex(filename=self.filename)}
+        snapshot["tasks"] = tasks_from_lists(snapshot["tasks"])
+        snapshot.setdefault("next_id", max_task_id(snapshot["tasks"]) + 1)
+        if "index" in snapshot:
+            snapshot["index"] = StatusIndex(snapshot["index"])
         else:
-            has_done_tasks = any(value[1] == "done" for value in tasks_dict.values())
-            if not has_done_tasks:
-                 print("Nothing to display.")
-            else:
-                max_task_len = max(len(value[0]) for value in tasks_dict.values())
-
-                print("\n")
-                header = f"{'ID':<3} | {'Task':<{max_task_len}} | {'Status':<12} | {'Created':<20} | {'Updated':<19}"
-                print(header)
-                print("-" * len(header))
-
-                for key, value in ((k, v) for k, v in tasks_dict.items() if v[1] == "done"):
-                    status = get_colored_status(value[1])
-                    created_at = value[2]
-                    updated_at = value[3] 
-                    line = (
-                        f"{key:<3} | "
-                        f"{value[0]:<{max_task_len}} | "
-                        f"{status:<{12 + len(status) - len(value[1])}} | " 
-                        f"{created_at:<20} | "
-                        f"{updated_at:<19}"
-                    )
-                    print(line)
-                print("\n")
-                    
-            
-def show_progress_list(filename):
-    """The function displays a list of in-progress tasks."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
-        try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            crush_program("You can't see this list because the to-do list is empty now.")
+            snapshot["index"] = StatusIndex.build(snapshot["tasks"])
+        if "times" in snapshot:
+            snapshot["times"] = TimeIndex(snapshot["times"])
         else:
-            has_progress_tasks = any(value[1] == "in-progress" for value in tasks_dict.values())
-            if not has_progress_tasks:
-                 print("Nothing to display.")
-            else:
-                max_task_len = max(len(value[0]) for value in tasks_dict.values())
-
-                print("\n")
-                header = f"{'ID':<3} | {'Task':<{max_task_len}} | {'Status':<12} | {'Created':<20} | {'Updated':<19}"
-                print(header)
-                print("-" * len(header))
-
-                for key, value in ((k, v) for k, v in tasks_dict.items() if v[1] == "in-progress"):
-                    status = get_colored_status(value[1])
-                    created_at = value[2]
-                    updated_at = value[3] 
-                    line = (
-                        f"{key:<3} | "
-                        f"{value[0]:<{max_task_len}} | "
-                        f"{status:<{12 + len(status) - len(value[1])}} | " 
-                        f"{created_at:<20} | "
-                        f"{updated_at:<19}"
-                    )
-                    print(line)
-                print("\n")
-                 
-
-def show_todo_list(filename):
-    """The function displays a list of todo tasks."""
-    tasks_dict = {}
-    with open(filename, 'r') as file:
-        try:
-            tasks_dict = json.load(file)
-        except json.decoder.JSONDecodeError:
-            crush_program("You can't see this list because the to-do list is empty now.")
+            snapshot["times"] = TimeIndex.build(snapshot["tasks"])
+        if "terms" in snapshot and snapshot.get("terms_version") == SEARCH_INDEX_VERSION:
+            snapshot["terms"] = SearchIndex(snapshot["terms"], self.filename)
         else:
-            has_todo_tasks = any(value[1] == "todo" for value in tasks_dict.values())
-            if not has_todo_tasks:
-                 print("Nothing to display.")
-            else:
-                max_task_len = max(len(value[0]) for value in tasks_dict.values())
-
-                print("\n")
-                header = f"{'ID':<3} | {'Task':<{max_task_len}} | {'Status':<12} | {'Created':<20} | {'Updated':<19}"
-                print(header)
-                print("-" * len(header))
-
-                for key, value in ((k, v) for k, v in tasks_dict.items() if v[1] == "todo"):
-                    status = get_colored_status(value[1])
-                    created_at = value[2]
-                    updated_at = value[3] 
-                    line = (
-                        f"{key:<3} | "
-                        f"{value[0]:<{max_task_len}} | "
-                        f"{status:<{12 + len(status) - len(value[1])}} | " 
-                        f"{created_at:<20} | "
-                        f"{updated_at:<19}"
-                    )
-                    print(line)
-                print("\n")
-                 
-
-def main():
-    """Main function."""
-    check_file(filename)
-    print("Welcome to \"Tasker\"! Type \"help\" to see available commands. Type \"exit\" to quit.\n")
+            snapshot["terms"] = SearchIndex.build(snapshot["tasks"], self.filename)
+        return snapshot
 
-    while True:
+    def _write_snapshot(self, snapshot):
+        with profile_phase("serialize"):
+            tasks = {id: task.to_row() for id, task in snapshot["tasks"].items()}
+            text = json.dumps({**snapshot, "tasks": tasks, "index": snapshot["index"].statuses,
+                               "times": snapshot["times"].fields, "terms": snapshot["terms"].to_json(),
+                               "terms_version": SEARCH_INDEX_VERSION})
+        with profile_phase("write"):
+            tmp_filename = self.snapshot_filename + ".tmp"
+            with open(tmp_filename, 'w') as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_filename, self.snapshot_filename)
+
+    def _replay(self, snapshot):
+        """Applies log records newer than the snapshot to it, returns (records, good_size)."""
+        records = 0
+        good_size = 0
         try:
-            users_input = input("tasker>> ")
-        except (KeyboardInterrupt, EOFError):
-            print("\nExiting Tasker.")
-            break
+            file = open(self.filename, 'rb')
+        except FileNotFoundError:
+            return records, good_size
 
-        if users_input.strip().lower() in {"exit", "quit"}:
-            print("Goodbye!")
-            break
-        if users_input.strip().lower() == "help":
-            print("""Available commands:
-                    1. add "task description"
-                    2. delete <id>
-                    3. update <id> "new task description"
-                    4. mark-in-progress <id>
-                    5. mark-done <id>
-                    6. list [all|done|in-progress|todo]
-                    7. exit / quit
-                """)
-            continue
+        with file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A torn last line from an interrupted append.
+                    break
+                good_size += len(line)
+                records += 1
+                if record["seq"] <= snapshot["seq"]:
+                    continue
+                if snapshot["tasks"] is None:
+                    snapshot["tasks"] = {}
+                snapshot["index"].remove(record["id"])
+                old = snapshot["tasks"].get(record["id"])
+                if old is not None:
+                    snapshot["times"].remove(record["id"], old)
+                    snapshot["terms"].remove(record["id"], old)
+                if record["op"] == "put":
+                    task = Task.from_list(record["task"])
+                    snapshot["tasks"][record["id"]] = task
+                    snapshot["index"].add(record["id"], task)
+                    snapshot["times"].add(record["id"], task)
+                    snapshot["terms"].add(record["id"], task)
+                    snapshot["next_id"] = max(snapshot["next_id"], int(record["id"]) + 1)
+                elif record["op"] == "del":
+                    snapshot["tasks"].pop(record["id"], None)
+                snapshot["seq"] = record["seq"]
+        return records, good_size
 
-        parts = parse_input(users_input)
+    def load(self):
+        """Rebuilds the task dictionary from the snapshot and the log tail.
 
-        match len(parts):
-            case 1: 
-                command = parts[0]
-                id, description = None, None
-            case 2:
-                try:
-                    int(parts[1])
-                except:
-                    command = parts[0]
-                    id = None
-                    description = parts[1]
-                else:
-                    command = parts[0]
-                    id = parts[1]
-                    description = None
-            case 3:
-                command = parts[0]
-                id = parts[1]
-                description = parts[2]
-            case _:
-                command = "error"
-
-        match command.lower():
-            case "add":
-                if description:
-                    add_task(description, filename)
-                elif id:
-                    crush_program("Incorrect arguments for \"add\" command.")
-            case "delete":
-                if id:
-                    delete_task(id, filename)
-                else:
-                    crush_program("Incorrect arguments for \"delete\" command.")
-            case "update":
-                if id and description:
-                    update_task(id, description, filename)
-                else:
-                    crush_program("Incorrect arguments for \"update\" command.")
-            case "mark-in-progress":
-                if id:
-                    status = "in-progress"
-                    update_status(id, status, filename)
-                else:
-                    crush_program("Incorrect arguments for \"mark-in-progress\" command.")
-            case "mark-done":
-                if id:
-                    status = "done"
-                    update_status(id, status, filename)
-                else:
-                    crush_program("Incorrect arguments for \"mark-done\" command.")
-            case "list":
-                if not description or description == "all":
-                    show_full_list(filename)
-                elif description == "done":
-                    show_done_list(filename)
-                elif description == "in-progress":
-                    show_progress_list(filename)
-                elif description == "todo":
-                    show_todo_list(filename)
-                else:
-                    crush_program("Unknown list filter.")
-            case "error":
-                crush_program("Wrong command. Please, try again.")
-            case _:
-                crush_program("Wrong command. Please, try again.")
+        Returns None when neither the snapshot nor the log holds anything.
+        """
+        with get_file_lock(self.filename), self.lock, profile_phase("load"):
+            snapshot = self._read_snapshot()
+            records, good_size = self._replay(snapshot)
+            profile_count("tasks_scanned", len(snapshot["tasks"] or ()))
+            if os.path.exists(self.filename) and os.path.getsize(self.filename) > good_size:
+                with open(self.filename, 'r+b') as file:
+                    file.truncate(good_size)
+            self.seq = snapshot["seq"]
+            self.next_id = snapshot["next_id"]
+            self.index = snapshot["index"]
+            self.times = snapshot["times"]
+            self.terms = snapshot["terms"]
+            self.records = records
+            self.size = good_size
+            self.snapshot_signature = file_signature([self.snapshot_filename])
+        return snapshot["tasks"]
+
+    def tail(self, mark):
+        """Reads the records appended after mark, a (snapshot signature, log size, seq, next ID)
+        tuple, and returns them as (op, id, task) changes with the mark after them; None if
+        a compaction or reset rewrote the snapshot since."""
+        snapshot_signature, size, seq, next_id = mark
+        with get_file_lock(self.filename), self.lock:
+            if file_signature([self.snapshot_filename]) != snapshot_signature:
+                return None
+            try:
+                file = open(self.filename, 'rb')
+            except FileNotFoundError:
+                return None
+            changes = []
+            with file:
+                if os.fstat(file.fileno()).st_size < size:
+                    return None
+                file.seek(size)
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    size += len(line)
+                    if record["seq"] <= seq:
+                        continue
+                    seq = record["seq"]
+                    task = Task.from_list(record["task"]) if record["op"] == "put" else None
+                    if task is not None:
+                        next_id = max(next_id, int(record["id"]) + 1)
+                    changes.append((record["op"], record["id"], task))
+        return changes, (snapshot_signature, size, seq, next_id)
+
+    def append(self, op, id, task=None):
+        """Appends one mutation record and compacts once the log is too big."""
+        self.append_many([(op, id, task)])
+
+    def append_many(self, changes):
+        """Appends (op, id, task) mutation records with one open of the log."""
+        with get_file_lock(self.filename), self.lock, profile_phase("write"):
+            with open(self.filename, 'a') as file:
+                for op, id, task in changes:
+                    record = {"op": op, "id": str(id)}
+                    if task is not None:
+                        record["task"] = task.to_row()
+                    self.seq += 1
+                    record["seq"] = self.seq
+                    line = json.dumps(record, separators=(',', ':')) + "\n"
+                    file.write(line)
+                    self.records += 1
+                    self.size += len(line.encode())
+            needs_compaction = self.records >= self.max_records or self.size >= self.max_bytes
+
+        if needs_compaction:
+            self.compact_in_background()
+
+    def compact(self):
+        """Folds the whole log into a new snapshot and starts an empty log.
+
+        Runs under the file lock, so other processes wait instead of
+        appending to a log that is about to be replaced.
+        """
+        with get_file_lock(self.filename):
+            signature = file_signature([self.filename])
+            snapshot = self._read_snapshot()
+            self._replay(snapshot)
+            snapshot["tasks"] = snapshot["tasks"] or {}
+            self._write_snapshot(snapshot)
+            with self.lock:
+                with open(self.filename, 'w'):
+                    pass
+                self.records = self.size = 0
+            restamp_stats(self.filename, signature)
+
+    def reset(self, tasks_dict):
+        """Replaces the snapshot with tasks_dict and starts an empty log."""
+        with get_file_lock(self.filename), self.lock:
+            self.next_id = max_task_id(tasks_dict) + 1
+            self.index = StatusIndex.build(tasks_dict)
+            self.times = TimeIndex.build(tasks_dict)
+            self.terms = SearchIndex.build(tasks_dict, self.filename)
+            # seq keeps growing, it is the version other processes compare.
+            self.seq += 1
+            self._write_snapshot({"seq": self.seq, "next_id": self.next_id, "tasks": tasks_dict,
+                                  "index": self.index, "times": self.times, "terms": self.terms})
+            with open(self.filename, 'w'):
+                pass
+            self.records = self.size = 0
+
+    def compact_in_background(self):
+        """Starts a compaction thread unless one is already running."""
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self.compact, name="tasker-compact")
+        self._compactor.start()
+
+    def wait(self):
+        """Waits for a running background compaction to finish."""
+        if self._compactor is not None:
+            self._compactor.join()
+
+
+_journals = {}
+
+
+def get_journal(filename):
+    """The function returns the shared journal object for a file."""
+    key = os.path.abspath(str(filename))
+    if key not in _journals:
+        _journals[key] = Journal(filename)
+    return _journals[key]
+
+
+JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+class JsonObjectReader:
+    """Reads the top-level {key: value} pairs of a JSON object file one at a time.
+
+    Only the current chunk and the value being decoded are held in memory,
+    so huge task files can be listed without loading them. Reading ends
+    before the value of the key stop, if given. Raises ValueError if the file
+    is empty or not a JSON object.
+    """
+
+    def __init__(self, file, chunk_size=1 << 16, stop=None):
+        self.file = file
+        self.stop = stop
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        chunk = self.file.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        self.eof = not chunk
+
+    def _next_char(self):
+        while True:
+            self.pos = JSON_WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if self.eof:
+                raise ValueError("Unexpected end of JSON file")
+            self._fill()
+
+    def _expect(self, chars):
+        char = self._next_char()
+        if char not in chars:
+            raise ValueError(f"Unexpected {char!r} in JSON file")
+        self.pos += 1
+        return char
+
+    def _decode(self):
+        if self.pos >= len(self.buffer) or self.buffer[self.pos] in " \t\r\n":
+            self._next_char()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise
+            else:
+                # A number cut by the chunk boundary decodes too early.
+                if end < len(self.buffer) or self.eof:
+                    self.pos = end
+                    return value
+            self._fill()
+
+    def __iter__(self):
+        self._expect("{")
+        if self._next_char() == "}":
+            return
+        while True:
+            key = self._decode()
+            if key == self.stop:
+                return
+            self._expect(":")
+            yield key, self._decode()
+            if self._expect(",}") == "}":
+                return
+
+
+def read_json_header(filename, stop="index"):
+    """The function reads the small keys of a JSON header file, stopping at the key stop."""
+    header = {}
+    try:
+        with open(filename, 'r') as file:
+            for key, value in JsonObjectReader(file, stop=stop):
+                header[key] = value
+    except (FileNotFoundError, ValueError):
+        return {}
+    return header
+
+
+class StorageBackend:
+    """Base class for task storage.
+
+    Backends hold Task records keyed by string IDs. Changes made through put() and delete() become
+    durable on commit(); the data functions never touch files directly. File backends hold the
+    file lock (see FileLock) from opening to close(), so one unit of work is atomic across processes.
+    """
+
+    def __init__(self, filename):
+        self.filename = str(filename)
+        self.task_stats = None
+        self.stats_changed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.commit()
+        self.close()
+
+    @classmethod
+    def create(cls, filename):
+        """Makes sure the storage of filename exists on disk, without reading it."""
+        check_file(filename)
+
+    def is_empty(self):
+        """Returns True if the storage was never initialized with a task list."""
+        raise NotImplementedError
+
+    def get(self, id):
+        raise NotImplementedError
+
+    def put(self, id, task):
+        raise NotImplementedError
+
+    def delete(self, id):
+        raise NotImplementedError
+
+    def next_id(self):
+        """Allocates a new task ID; IDs are never reused, even after deletes."""
+        raise NotImplementedError
+
+    def peek_next_id(self):
+        """Returns the ID next_id() would allocate, without allocating it."""
+        raise NotImplementedError
+
+    def advance_next_id(self, next_id):
+        """Makes sure IDs below next_id are never handed out again."""
+        raise NotImplementedError
+
+    def add_many(self, tasks):
+        """Stores new tasks under one block of fresh IDs, returns the IDs."""
+        first = self.peek_next_id()
+        ids = [str(id) for id in range(first, first + len(tasks))]
+        for id, task in zip(ids, tasks):
+            self.put(id, task)
+        self.advance_next_id(first + len(tasks))
+        return ids
+
+    def files(self):
+        """Returns the paths this backend keeps its data in."""
+        return [self.filename]
+
+    def version(self):
+        """Returns the counter bumped by every commit that changed something,
+        None if it is unknown and the data must be assumed changed."""
+        return None
+
+    def change_mark(self):
+        """Returns what read_changes() needs to tell later commits apart from the data
+        read now, None if the backend can't tell."""
+        return None
+
+    @classmethod
+    def read_changes(cls, filename, mark):
+        """Returns what was committed to filename since mark (see change_mark()) as a dict:
+        the ("put"|"del", id, task) "changes" and the new "mark", "version", "next_id",
+        "files" and their "signature". None means the backend can't tell and everything
+        has to be read again."""
+        return None
+
+    def tasks(self, status=None):
+        """Yields (id, task) pairs in ID order, optionally only one status."""
+        raise NotImplementedError
+
+    def find(self, status=None, since=None, until=None, updated_since=None):
+        """Yields (id, task) pairs of one status (or all) created within [since, until]
+        and updated at or after updated_since, in ID order. None leaves a limit open."""
+        for id, task in self.tasks(status):
+            if in_period(task, since, until, updated_since):
+                yield id, task
+
+    def search(self, groups, status=None):
+        """Yields (id, task) pairs of one status (or all) matching parsed query groups
+        (see parse_query), in ID order."""
+        for id, task in self.tasks(status):
+            if matches_query(task, groups, self.filename):
+                yield id, task
+
+    def count(self, status=None):
+        return sum(1 for _ in self.tasks(status))
+
+    def max_description_len(self, status=None):
+        """Returns the width of the Task column for a list of one status or all tasks."""
+        return max((display_width(task.description) for _, task in self.tasks(status)), default=0)
+
+    def replace_all(self, tasks_dict):
+        """Replaces the whole content of the storage with tasks_dict."""
+        raise NotImplementedError
+
+    def renumber(self, first=1):
+        """Gives the tasks dense IDs from first, keeping their order."""
+        tasks = [task for _, task in self.tasks()]
+        self.replace_all({str(id): task for id, task in enumerate(tasks, first)})
+
+    def stats(self):
+        """Returns the TaskStats of the tasks, the saved ones if they are of the file as it
+        is (see read_stats()), otherwise counted from the tasks."""
+        if self.task_stats is None:
+            self.task_stats = read_stats(self.filename) or TaskStats.build(self.tasks())
+        return self.task_stats
+
+    def count_change(self, old, new):
+        """Updates the stats for a task that was old and becomes new (None if missing);
+        put() and delete() call it before they change anything."""
+        self.stats().change(old, new)
+        self.stats_changed = True
+
+    def reset_stats(self, rows):
+        """Counts the stats again from (id, task) rows, after replace_all() or for "stats --rebuild"."""
+        self.task_stats = TaskStats.build(rows)
+        self.stats_changed = True
+
+    def save_stats(self):
+        """Saves changed stats next to the task file, last thing in commit()."""
+        if self.stats_changed:
+            write_stats(self.filename, self.task_stats)
+            self.stats_changed = False
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class IndexedTasks:
+    """Task dictionary held in memory together with its status, time and search indexes."""
+
+    def build_indexes(self):
+        self.index = StatusIndex.build(self.tasks_dict)
+        self.times = TimeIndex.build(self.tasks_dict)
+        # The search index is built by the first search (see search_index()).
+        self.terms = None
+
+    def search_index(self):
+        if self.terms is None:
+            self.terms = SearchIndex.build(self.tasks_dict, self.filename)
+        return self.terms
+
+    # A JSON file loads without status and time indexes, these build them when first asked.
+    def status_index(self):
+        if self.index is None:
+            self.index = StatusIndex.build(self.tasks_dict)
+        return self.index
+
+    def time_index(self):
+        if self.times is None:
+            self.times = TimeIndex.build(self.tasks_dict)
+        return self.times
+
+    def put_task(self, id, task):
+        if self.tasks_dict is None:
+            self.tasks_dict = {}
+        old = self.tasks_dict.get(id)
+        self.count_change(old, task)
+        if self.times is not None:
+            if old is None:
+                self.times.add(id, task)
+            else:
+                self.times.replace(id, old, task)
+        if old is not None and old.description != task.description and self.terms is not None:
+            self.terms.remove(id, old)
+        self.tasks_dict[id] = task
+        if self.index is not None:
+            self.index.remove(id)
+            self.index.add(id, task)
+        if (old is None or old.description != task.description) and self.terms is not None:
+            self.terms.add(id, task)
+
+    def delete_task(self, id):
+        old = self.tasks_dict.get(id)
+        if old is not None:
+            self.count_change(old, None)
+            del self.tasks_dict[id]
+            if self.index is not None:
+                self.index.remove(id)
+            if self.times is not None:
+                self.times.remove(id, old)
+            if self.terms is not None:
+                self.terms.remove(id, old)
+
+    def get(self, id):
+        if self.tasks_dict is None:
+            return None
+        return self.tasks_dict.get(str(id))
+
+    def tasks(self, status=None):
+        if status is None:
+            # Only the keys are copied (the dict may change while rows are shown), so a
+            # short page of a big list costs no tuple per task.
+            for id in list(self.tasks_dict or ()):
+                task = self.tasks_dict.get(id)
+                if task is not None:
+                    yield id, task
+            return
+        for id in self.status_index().ids(status):
+            yield id, self.tasks_dict[id]
+
+    def find(self, status=None, since=None, until=None, updated_since=None):
+        candidates = None
+        if since is not None or until is not None:
+            candidates = set(self.time_index().ids_between("created", since, until))
+        if updated_since is not None:
+            updated = self.time_index().ids_between("updated", updated_since)
+            candidates = set(updated) if candidates is None else candidates.intersection(updated)
+        if candidates is None:
+            yield from self.tasks(status)
+            return
+        for id in sorted(candidates, key=task_id_key):
+            task = self.tasks_dict[id]
+            if status is None or task.status == status:
+                yield id, task
+
+    def search(self, groups, status=None):
+        for id in sorted(self.search_index().search(groups), key=task_id_key):
+            task = self.tasks_dict[id]
+            if status is None or task.status == status:
+                yield id, task
+
+    def count(self, status=None):
+        if status is None:
+            return len(self.tasks_dict or {})
+        return self.status_index().count(status)
+
+    def max_description_len(self, status=None):
+        return self.status_index().max_width(status)
+
+
+class DictBackend(IndexedTasks, StorageBackend):
+    """Backend that keeps the task dictionary in memory between load and commit."""
+
+    # Set by load() if the header was written with the tasks as loaded
+    header_valid = False
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.file_lock = get_file_lock(self.filename)
+        self.file_lock.acquire()
+        self.header = {}
+        self.index = None
+        self.times = None
+        self.terms = None
+        with profile_phase("load"):
+            self.tasks_dict = self.load()
+            # Files without a header that vouches for them go on after their highest ID.
+            if not self.header_valid or "next_id" not in self.header:
+                self.advance_next_id(max_task_id(self.tasks_dict or {}) + 1)
+
+    def load(self):
+        """Returns the task dictionary (None if empty), fills self.header and,
+        if it has valid stored ones, self.index, self.times and self.terms
+        (left None, they are built when first needed, see IndexedTasks)."""
+        raise NotImplementedError
+
+    def is_empty(self):
+        return self.tasks_dict is None
+
+    def put(self, id, task):
+        self.put_task(str(id), task)
+        if str(id).isdigit() and int(id) >= self.header["next_id"]:
+            self.header["next_id"] = int(id) + 1
+
+    def delete(self, id):
+        self.delete_task(str(id))
+
+    def next_id(self):
+        id = self.peek_next_id()
+        self.header["next_id"] = id + 1
+        return str(id)
+
+    def peek_next_id(self):
+        return self.header["next_id"]
+
+    def advance_next_id(self, next_id):
+        self.header["next_id"] = max(self.header.get("next_id", 1), next_id)
+
+    def close(self):
+        if self.file_lock is not None:
+            self.file_lock.release()
+            self.file_lock = None
+
+
+class JsonBackend(DictBackend):
+    """The original single JSON file, rewritten as a whole on every commit.
+
+    The file keeps the plain {id: task} layout, so its header (the next free
+    ID and the Task column width of every status) lives next to it in
+    "<file>.meta". The header remembers mtime and size of the file it was
+    written with; widths of a file changed by someone else are measured
+    again. Both files are replaced by rename, so readers that don't take the
+    lock never see half a file. The header also counts commits in "version".
+    No index is stored: the status and time indexes are built from the
+    tasks when a command first needs them, and search scans the tasks,
+    which costs less than building a search index that one command would
+    throw away (a TaskStore builds and keeps one). Without a status index,
+    put() only widens the stored widths, so they stay an upper bound until
+    a commit that has the index measures them again.
+    """
+
+    def __init__(self, filename):
+        self.meta_filename = str(filename) + ".meta"
+        super().__init__(filename)
+        self.dirty = False
+
+    def load(self):
+        try:
+            with open(self.meta_filename, 'r') as file:
+                self.header = json.load(file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            self.header = {}
+        self.header_valid = False
+
+        try:
+            with open(self.filename, 'r') as file:
+                tasks_dict = LazyTasks(json.load(file))
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+        profile_count("tasks_scanned", len(tasks_dict))
+
+        self.header_valid = self.header.get("signature") == file_signature([self.filename])
+        if not self.header_valid:
+            self.header.pop("widths", None)
+        return tasks_dict
+
+    def next_id(self):
+        self.dirty = True
+        return super().next_id()
+
+    def advance_next_id(self, next_id):
+        self.dirty = True
+        super().advance_next_id(next_id)
+
+    def files(self):
+        return [self.filename, self.meta_filename]
+
+    def version(self):
+        # A header left behind by a change of the file alone can't vouch for it.
+        return self.header.get("version", 0) if self.header_valid else None
+
+    def put(self, id, task):
+        super().put(id, task)
+        if self.index is None and "widths" in self.header:
+            widths = self.header["widths"]
+            widths[task.status] = max(widths.get(task.status, 0), display_width(task.description))
+        self.dirty = True
+
+    def delete(self, id):
+        super().delete(id)
+        self.dirty = True
+
+    def search(self, groups, status=None):
+        # Rows still as read are checked before they become Tasks, see may_match().
+        for id, row in list(dict.items(self.tasks_dict or {})):
+            if type(row) is list:
+                if status is not None and row[1] != status:
+                    continue
+                if (len(row) < 5 or row[4] is None) and not may_match(row[0], groups):
+                    continue
+            task = self.tasks_dict[id]
+            if (status is None or task.status == status) and matches_query(task, groups, self.filename):
+                yield id, task
+
+    def replace_all(self, tasks_dict):
+        self.tasks_dict = dict(tasks_dict)
+        self.build_indexes()
+        self.reset_stats(self.tasks_dict.items())
+        self.header["next_id"] = max_task_id(self.tasks_dict) + 1
+        self.dirty = True
+
+    def commit(self):
+        if self.dirty:
+            # json.dumps uses the C encoder, json.dump to a file does not.
+            with profile_phase("serialize"):
+                text = json.dumps(LazyTasks.rows(self.tasks_dict))
+            write_file(self.filename, text)
+            self.header["version"] = self.header.get("version", 0) + 1
+            self.header.pop("index", None)
+            self.header.pop("times", None)
+            self.header.pop("terms", None)
+            self.header.pop("terms_version", None)
+            self.header["signature"] = file_signature([self.filename])
+            if self.index is not None or "widths" not in self.header:
+                index = self.status_index()
+                self.header["widths"] = {status: index.max_width(status) for status in index.statuses}
+            with profile_phase("serialize"):
+                text = json.dumps(self.header)
+            write_file(self.meta_filename, text)
+            self.header_valid = True
+            self.dirty = False
+        self.save_stats()
+
+    @staticmethod
+    def stream(filename, status=None):
+        """Returns a generator of (id, task) pairs read from disk, None if the to-do list is empty."""
+        try:
+            with open(filename, 'r') as file:
+                JsonObjectReader(file)._expect("{")
+        except (FileNotFoundError, ValueError):
+            return None
+
+        def rows():
+            scanned = 0
+            with open(filename, 'r') as file:
+                try:
+                    for id, values in JsonObjectReader(file):
+                        scanned += 1
+                        if status is None or values[1] == status:
+                            yield id, Task.from_list(values)
+                except ValueError:
+                    crush_program("You can't see this list because the to-do list is empty now.")
+                finally:
+                    profile_count("tasks_scanned", scanned)
+
+        return rows()
+
+    @staticmethod
+    def read(filename, status=None):
+        """Returns a generator of (id, task) pairs of the whole file decoded by json.load,
+        None if the to-do list is empty."""
+        try:
+            with open(filename, 'r') as file:
+                tasks_dict = json.load(file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return None
+        profile_count("tasks_scanned", len(tasks_dict))
+        return ((id, Task.from_list(values)) for id, values in tasks_dict.items()
+                if status is None or values[1] == status)
+
+    @classmethod
+    def reader(cls, filename, limit=None):
+        """Returns stream if limit can stop reading a big file early, otherwise read:
+        the C decoder behind json.load is faster than JsonObjectReader on a whole file."""
+        try:
+            if limit is not None and os.path.getsize(filename) >= JSON_STREAM_BYTES:
+                return cls.stream
+        except OSError:
+            pass
+        return cls.read
+
+    @classmethod
+    def scan(cls, filename, status=None, limit=None):
+        """Reads (id, task) pairs from disk, streamed with constant memory when limit allows (see reader()).
+
+        Returns (Task column width, rows), or None if the to-do list is empty.
+        The width comes from the header; if the header is stale it is taken
+        from the first limit rows, or from all rows.
+        """
+        filename = str(filename)
+        if cls.stream(filename) is None:
+            return None
+        read = cls.reader(filename, limit)
+
+        def rows():
+            tasks = read(filename, status)
+            if tasks is None:
+                crush_program("You can't see this list because the to-do list is empty now.")
+            return tasks
+
+        header = read_json_header(filename + ".meta")
+        if header.get("signature") == file_signature([filename]) and "widths" in header:
+            widths = header["widths"]
+            if status is None:
+                return max(widths.values(), default=0), rows()
+            return widths.get(status, 0), rows()
+        page = list(islice(rows(), limit))
+        return max((display_width(task.description) for _, task in page), default=0), iter(page)
+
+
+class JournalBackend(DictBackend):
+    """Append-only journal storage, see Journal."""
+
+    def __init__(self, filename):
+        self.journal = get_journal(filename)
+        self.pending = []
+        super().__init__(filename)
+
+    def load(self):
+        tasks_dict = self.journal.load()
+        self.header = {"next_id": self.journal.next_id}
+        self.header_valid = True
+        self.index = self.journal.index
+        self.times = self.journal.times
+        self.terms = self.journal.terms
+        return tasks_dict
+
+    def files(self):
+        return [self.filename, self.journal.snapshot_filename]
+
+    def version(self):
+        return self.journal.seq
+
+    def change_mark(self):
+        return self.journal.snapshot_signature, self.journal.size, self.journal.seq, self.peek_next_id()
+
+    @classmethod
+    def read_changes(cls, filename, mark):
+        # Only the log records after mark are read, the snapshot is left alone.
+        journal = get_journal(filename)
+        with get_file_lock(filename):
+            tail = journal.tail(mark)
+            if tail is None:
+                return None
+            changes, mark = tail
+            files = [journal.filename, journal.snapshot_filename]
+            return {"changes": changes, "mark": mark, "version": mark[2], "next_id": mark[3],
+                    "files": files, "signature": file_signature(files)}
+
+    def put(self, id, task):
+        super().put(id, task)
+        self.pending.append(("put", str(id), task))
+
+    def delete(self, id):
+        super().delete(id)
+        self.pending.append(("del", str(id), None))
+
+    def replace_all(self, tasks_dict):
+        self.tasks_dict = dict(tasks_dict)
+        self.pending = []
+        self.reset_stats(self.tasks_dict.items())
+        self.journal.reset(self.tasks_dict)
+        self.header = {"next_id": self.journal.next_id}
+        self.index = self.journal.index
+        self.times = self.journal.times
+        self.terms = self.journal.terms
+
+    def commit(self):
+        if self.pending:
+            self.journal.append_many(self.pending)
+        self.pending = []
+        self.save_stats()
+
+
+class SqliteBackend(StorageBackend):
+    """SQLite storage with one row per task, indexes on status, creation and update time,
+    a (word, id) table for search and a (version, id) log of the IDs each of the last
+    SQLITE_CHANGE_LOG commits changed."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            created_ts INTEGER,
+            updated_ts INTEGER,
+            blob TEXT,
+            completed_ts INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id);
+        CREATE INDEX IF NOT EXISTS tasks_created ON tasks (created_ts);
+        CREATE INDEX IF NOT EXISTS tasks_updated ON tasks (updated_ts);
+        CREATE TABLE IF NOT EXISTS terms (
+            token TEXT NOT NULL,
+            id INTEGER NOT NULL,
+            PRIMARY KEY (token, id)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS terms_id ON terms (id);
+        CREATE TABLE IF NOT EXISTS changes (
+            version INTEGER NOT NULL,
+            id INTEGER NOT NULL,
+            PRIMARY KEY (version, id)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value
+        );
+    """
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.file_lock = get_file_lock(self.filename)
+        self.file_lock.acquire()
+        self.changed = False
+        # IDs put or deleted since the last commit; None after replace_all(), which logs nothing
+        self.touched = set()
+        self.connection = sqlite3.connect(self.filename)
+        self.initialized = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks'"
+        ).fetchone() is not None
+        if self.initialized:
+            # Upgrades files created before a column, table or index was added.
+            self._add_updated_ts()
+            self._add_blob()
+            self._add_terms()
+            self._add_blob_terms()
+            self._add_changes()
+            self.connection.executescript(self.SCHEMA)
+
+    def _add_updated_ts(self):
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(tasks)")]
+        if "updated_ts" in columns:
+            return
+        self.connection.execute("ALTER TABLE tasks ADD COLUMN updated_ts INTEGER")
+        rows = self.connection.execute("SELECT id, updated_at FROM tasks WHERE updated_at != 'N/A'").fetchall()
+        self.connection.executemany(
+            "UPDATE tasks SET updated_ts = ? WHERE id = ?",
+            ((parse_timestamp(updated_at), id) for id, updated_at in rows),
+        )
+        self.connection.commit()
+
+    def _add_blob(self):
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(tasks)")]
+        if "blob" not in columns:
+            self.connection.execute("ALTER TABLE tasks ADD COLUMN blob TEXT")
+        if "completed_ts" not in columns:
+            self.connection.execute("ALTER TABLE tasks ADD COLUMN completed_ts INTEGER")
+        self.connection.commit()
+
+    def _add_terms(self):
+        if self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'terms'"
+        ).fetchone() is not None:
+            return
+        self.connection.executescript(self.SCHEMA)
+        rows = self.connection.execute("SELECT id, description, blob FROM tasks").fetchall()
+        self.connection.executemany("INSERT INTO terms VALUES (?, ?)",
+                                    self._terms((id, Task(description, "", None, None, blob))
+                                                for id, description, blob in rows))
+        self.set_meta("terms_version", SEARCH_INDEX_VERSION)
+        self.connection.commit()
+
+    def _add_blob_terms(self):
+        # Earlier versions indexed the preview of long descriptions only.
+        if self.get_meta("terms_version") == SEARCH_INDEX_VERSION:
+            return
+        rows = self.connection.execute("SELECT id, description, blob FROM tasks WHERE blob IS NOT NULL").fetchall()
+        self.connection.executemany("DELETE FROM terms WHERE id = ?", ((id,) for id, _, _ in rows))
+        self.connection.executemany("INSERT INTO terms VALUES (?, ?)",
+                                    self._terms((id, Task(description, "", None, None, blob))
+                                                for id, description, blob in rows))
+        self.set_meta("terms_version", SEARCH_INDEX_VERSION)
+        self.connection.commit()
+
+    def _add_changes(self):
+        if self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'changes'"
+        ).fetchone() is not None:
+            return
+        self.connection.executescript(self.SCHEMA)
+        # Earlier commits were never logged.
+        self.set_meta("log_since", self.version())
+        self.connection.commit()
+
+    def _terms(self, rows):
+        return ((token, int(id)) for id, task in rows for token in task_tokens(task, self.filename))
+
+    def _initialize(self):
+        if not self.initialized:
+            self.connection.executescript(self.SCHEMA)
+            self.set_meta("terms_version", SEARCH_INDEX_VERSION)
+            self.initialized = True
+
+    def get_meta(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        self.connection.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def is_empty(self):
+        return not self.initialized
+
+    def get(self, id):
+        if not self.initialized or not str(id).isdigit():
+            return None
+        row = self.connection.execute(
+            "SELECT description, status, COALESCE(created_ts, created_at), COALESCE(updated_ts, updated_at), blob, "
+            "completed_ts FROM tasks WHERE id = ?",
+            (int(id),),
+        ).fetchone()
+        return Task.from_list(row) if row else None
+
+    INSERT = """
+        INSERT OR REPLACE INTO tasks (id, description, status, created_at, updated_at, created_ts, updated_ts, blob,
+                                      completed_ts)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+
+    @staticmethod
+    def _row(id, task):
+        return (int(id), task.description, task.status, format_timestamp(task.created),
+                format_timestamp(task.updated), task.created if isinstance(task.created, int) else None,
+                task.updated if isinstance(task.updated, int) else None, task.blob,
+                task.completed if isinstance(task.completed, int) else None)
+
+    def put(self, id, task):
+        self._initialize()
+        self.changed = True
+        self._touch([id])
+        old = self.get(id)
+        self.count_change(old, task)
+        self.connection.execute(self.INSERT, self._row(id, task))
+        if old is None or (old.description, old.blob) != (task.description, task.blob):
+            self.connection.execute("DELETE FROM terms WHERE id = ?", (int(id),))
+            self.connection.executemany("INSERT INTO terms VALUES (?, ?)", self._terms([(id, task)]))
+
+    def delete(self, id):
+        self.changed = True
+        self._touch([id])
+        old = self.get(id)
+        if old is not None:
+            self.count_change(old, None)
+        self.connection.execute("DELETE FROM tasks WHERE id = ?", (int(id),))
+        self.connection.execute("DELETE FROM terms WHERE id = ?", (int(id),))
+
+    def add_many(self, tasks):
+        self.changed = True
+        first = self.peek_next_id()
+        ids = [str(id) for id in range(first, first + len(tasks))]
+        self._touch(ids)
+        for task in tasks:
+            self.count_change(None, task)
+        self.connection.executemany(self.INSERT, (self._row(id, task) for id, task in zip(ids, tasks)))
+        self.connection.executemany(
+            "INSERT INTO terms VALUES (?, ?)",
+            self._terms(zip(ids, tasks)),
+        )
+        self.set_meta("next_id", first + len(tasks))
+        return ids
+
+    def next_id(self):
+        id = self.peek_next_id()
+        self.set_meta("next_id", id + 1)
+        return str(id)
+
+    def peek_next_id(self):
+        self._initialize()
+        top = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM tasks").fetchone()[0]
+        return max(self.get_meta("next_id", 1), top + 1)
+
+    def advance_next_id(self, next_id):
+        self._initialize()
+        self.set_meta("next_id", max(self.get_meta("next_id", 1), next_id))
+
+    def tasks(self, status=None):
+        return self.find(status)
+
+    def find(self, status=None, since=None, until=None, updated_since=None):
+        if not self.initialized:
+            return
+        conditions, parameters = [], []
+        for condition, value in (("status = ?", status), ("created_ts >= ?", since),
+                                 ("created_ts <= ?", until), ("updated_ts >= ?", updated_since)):
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        query = ("SELECT id, description, status, COALESCE(created_ts, created_at), COALESCE(updated_ts, updated_at), "
+                 "blob, completed_ts FROM tasks")
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        scanned = 0
+        try:
+            for id, *task in self.connection.execute(query + " ORDER BY id", parameters):
+                scanned += 1
+                yield str(id), Task.from_list(task)
+        finally:
+            profile_count("tasks_scanned", scanned)
+
+    def search(self, groups, status=None):
+        if not self.initialized:
+            return
+        selects, parameters = [], []
+        for group in groups:
+            # GLOB "prefix*" is answered from the (token, id) primary key like "=".
+            selects.append("SELECT id FROM (" + " INTERSECT ".join(
+                "SELECT id FROM terms WHERE token " + ("GLOB ?" if term.endswith("*") else "= ?")
+                for term in group
+            ) + ")")
+            parameters.extend(group)
+        query = ("SELECT id, description, status, COALESCE(created_ts, created_at), COALESCE(updated_ts, updated_at), "
+                 "blob, completed_ts FROM tasks WHERE id IN (" + " UNION ".join(selects) + ")")
+        if status is not None:
+            query += " AND status = ?"
+            parameters.append(status)
+        scanned = 0
+        try:
+            for id, *task in self.connection.execute(query + " ORDER BY id", parameters):
+                scanned += 1
+                yield str(id), Task.from_list(task)
+        finally:
+            profile_count("tasks_scanned", scanned)
+
+    def count(self, status=None):
+        if not self.initialized:
+            return 0
+        if status is None:
+            return self.connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+        return self.connection.execute("SELECT COUNT(*) FROM tasks WHERE status = ?", (status,)).fetchone()[0]
+
+    def max_description_len(self, status=None):
+        if not self.initialized:
+            return 0
+        if status is None:
+            return self.connection.execute("SELECT COALESCE(MAX(LENGTH(description)), 0) FROM tasks").fetchone()[0]
+        return self.connection.execute(
+            "SELECT COALESCE(MAX(LENGTH(description)), 0) FROM tasks WHERE status = ?", (status,)
+        ).fetchone()[0]
+
+    def _touch(self, ids):
+        if self.touched is not None:
+            self.touched.update(int(id) for id in ids)
+
+    def replace_all(self, tasks_dict):
+        self._initialize()
+        self.changed = True
+        self.touched = None
+        self.reset_stats(tasks_dict.items())
+        self.connection.execute("DELETE FROM tasks")
+        self.connection.execute("DELETE FROM terms")
+        self.connection.executemany(self.INSERT, (self._row(id, task) for id, task in tasks_dict.items()))
+        self.connection.executemany(
+            "INSERT INTO terms VALUES (?, ?)",
+            self._terms(tasks_dict.items()),
+        )
+        self.set_meta("next_id", max_task_id(tasks_dict) + 1)
+
+    def version(self):
+        return self.get_meta("version", 0) if self.initialized else 0
+
+    def change_mark(self):
+        return self.version() if self.initialized else None
+
+    @classmethod
+    def read_changes(cls, filename, mark):
+        """Reads the rows of the IDs the change log lists after version mark; None if the log
+        doesn't reach back that far (or a replace_all() came in between)."""
+        with cls(filename) as backend:
+            if not backend.initialized:
+                return None
+            version = backend.version()
+            if mark < backend.get_meta("log_since", 0) or mark < version - SQLITE_CHANGE_LOG:
+                return None
+            changes = []
+            for (id,) in backend.connection.execute("SELECT DISTINCT id FROM changes WHERE version > ?", (mark,)):
+                task = backend.get(id)
+                changes.append(("del", str(id), None) if task is None else ("put", str(id), task))
+            return {"changes": changes, "mark": version, "version": version, "next_id": backend.peek_next_id(),
+                    "files": backend.files(), "signature": file_signature(backend.files())}
+
+    def commit(self):
+        if self.changed:
+            version = self.version() + 1
+            self.set_meta("version", version)
+            if self.touched is None:
+                self.set_meta("log_since", version)
+            else:
+                self.connection.executemany("INSERT OR IGNORE INTO changes VALUES (?, ?)",
+                                            ((version, id) for id in self.touched))
+            self.connection.execute("DELETE FROM changes WHERE version <= ?", (version - SQLITE_CHANGE_LOG,))
+            self.changed = False
+            self.touched = set()
+        with profile_phase("write"):
+            self.connection.commit()
+        self.save_stats()
+
+    def close(self):
+        self.connection.close()
+        if self.file_lock is not None:
+            self.file_lock.release()
+            self.file_lock = None
+
+
+class BinaryBackend(StorageBackend):
+    """Fixed-width binary storage, read and written in place through mmap.
+
+    The task file is a HEADER followed by one RECORD per ID, the record of
+    task id at HEADER.size + (id - 1) * RECORD.size:
+        status      - 1 todo, 2 in-progress, 3 done, 0 for a free slot
+        flags       - which of created, updated, completed and blob are set
+        width       - display width of the description (the Task column width)
+        length      - bytes of the description in the string heap
+        offset      - where the description starts in the string heap
+        created, updated, completed - epoch seconds
+        blob        - the raw SHA-256 of a description in the BlobStore
+    Descriptions are UTF-8 in an append-only heap file ("<file>.heap.N").
+    Marking a task or changing a timestamp overwrites its record and
+    nothing else; only a new description appends to the heap. Both are
+    staged in memory until commit(), so a command that fails halfway
+    leaves the files as they were. Lists, time
+    ranges and counts look at the records alone and read the heap only for
+    the tasks they show. Once BINARY_HEAP_GARBAGE bytes of the heap belong
+    to replaced or deleted descriptions, commit() writes both files anew
+    under the next heap generation N, switching over with one rename.
+
+    Legacy timestamps that don't parse have no fixed-width form and are
+    stored as unset.
+    """
+
+    MAGIC = b"TASKBIN1"
+    # magic, record size, -, heap generation, used slots, next ID, version, unused heap bytes
+    HEADER = struct.Struct("<8sHHIQQQQ")
+    RECORD = struct.Struct("<BBHIQqqq32s")
+    STATUSES = [None, "todo", "in-progress", "done"]
+    STATUS_CODES = {status: code for code, status in enumerate(STATUSES) if status}
+    CREATED, UPDATED, COMPLETED, BLOB = 1, 2, 4, 8
+
+    def __init__(self, filename):
+        super().__init__(filename)
+        self.file_lock = get_file_lock(self.filename)
+        self.file_lock.acquire()
+        self.changed = False
+        with profile_phase("load"):
+            self._open()
+
+    def _open(self):
+        self.fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self.fd).st_size
+        self.map = mmap.mmap(self.fd, size) if size else None
+        self.heap_fd = None
+        self.heap_map = None
+        # Records (by ID) and heap text not written yet, see commit()
+        self.staged = {}
+        self.heap_staged = bytearray()
+        if self.map is None:
+            self.generation, self.slots, self.next, self.version_value, self.garbage = 0, 0, 1, 0, 0
+            return
+        magic, record_size, _, self.generation, self.slots, self.next, self.version_value, self.garbage = \
+            self.HEADER.unpack_from(self.map)
+        if magic != self.MAGIC or record_size != self.RECORD.size:
+            crush_program(f"\"{self.filename}\" is not a tasker binary file.")
+        self.heap_fd = os.open(self._heap_path(self.generation), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+        self.heap_size = os.fstat(self.heap_fd).st_size
+
+    def _close(self):
+        for resource in (self.map, self.heap_map):
+            if resource is not None:
+                resource.close()
+        for fd in (self.fd, self.heap_fd):
+            if fd is not None:
+                os.close(fd)
+        self.map = self.heap_map = self.fd = self.heap_fd = None
+
+    def _heap_path(self, generation):
+        return f"{self.filename}.heap.{generation}"
+
+    def _initialize(self):
+        if self.map is None:
+            self._rewrite([])
+
+    def _grow(self, slots):
+        capacity = (len(self.map) - self.HEADER.size) // self.RECORD.size
+        if slots > capacity:
+            self.map.close()
+            os.ftruncate(self.fd, self.HEADER.size + max(slots, capacity * 2, 64) * self.RECORD.size)
+            self.map = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+
+    def _text(self, record):
+        offset, length = record[4], record[3]
+        written = self.heap_size - len(self.heap_staged)
+        if offset >= written:
+            return self.heap_staged[offset - written:offset - written + length].decode('utf-8')
+        if self.heap_map is None or len(self.heap_map) < offset + length:
+            if self.heap_map is not None:
+                self.heap_map.close()
+            self.heap_map = mmap.mmap(self.heap_fd, written, access=mmap.ACCESS_READ)
+        return self.heap_map[offset:offset + length].decode('utf-8')
+
+    def _task(self, record):
+        status, flags, _, _, _, created, updated, completed, blob = record
+        return Task(self._text(record), self.STATUSES[status],
+                    created if flags & self.CREATED else None,
+                    updated if flags & self.UPDATED else None,
+                    blob.hex() if flags & self.BLOB else None,
+                    completed if flags & self.COMPLETED else None)
+
+    def _pack(self, task, offset, length):
+        if task.status not in self.STATUS_CODES:
+            crush_program(f"Unknown status \"{task.status}\".")
+        flags = 0
+        stamps = []
+        for flag, value in ((self.CREATED, task.created), (self.UPDATED, task.updated),
+                            (self.COMPLETED, task.completed)):
+            if isinstance(value, int):
+                flags |= flag
+            stamps.append(value if isinstance(value, int) else 0)
+        blob = b""
+        if task.blob is not None:
+            flags |= self.BLOB
+            blob = bytes.fromhex(task.blob)
+        return self.RECORD.pack(self.STATUS_CODES[task.status], flags, min(display_width(task.description), 0xFFFF),
+                                length, offset, *stamps, blob)
+
+    def _position(self, id):
+        return self.HEADER.size + (int(id) - 1) * self.RECORD.size
+
+    def _record(self, id):
+        if self.map is None or not str(id).isdigit() or not 0 < int(id) <= self.slots:
+            return None
+        staged = self.staged.get(int(id))
+        record = self.RECORD.unpack(staged) if staged else self.RECORD.unpack_from(self.map, self._position(id))
+        return record if record[0] else None
+
+    def _records(self, status=None):
+        """Yields (id, record) of the used slots, optionally of one status, from a copy of the record area."""
+        if self.map is None:
+            return
+        code = None if status is None else self.STATUS_CODES.get(status, -1)
+        data = self.map[self.HEADER.size:self.HEADER.size + self.slots * self.RECORD.size]
+        if self.staged:
+            data = bytearray(data)
+            for id, record in self.staged.items():
+                data[(id - 1) * self.RECORD.size:id * self.RECORD.size] = record
+        scanned = 0
+        try:
+            for id, record in enumerate(self.RECORD.iter_unpack(data), 1):
+                if record[0] and (code is None or record[0] == code):
+                    scanned += 1
+                    yield str(id), record
+        finally:
+            profile_count("tasks_scanned", scanned)
+
+    def _rewrite(self, tasks):
+        """Writes (id, task) pairs as a new file and heap generation, then switches to them."""
+        generation = self.generation + 1
+        records = {}
+        with profile_phase("serialize"):
+            heap = io.BytesIO()
+            for id, task in tasks:
+                data = task.description.encode('utf-8')
+                records[int(id)] = self._pack(task, heap.tell(), len(data))
+                heap.write(data)
+            slots = max(records, default=0)
+            body = bytearray(slots * self.RECORD.size)
+            for id, record in records.items():
+                body[(id - 1) * self.RECORD.size:id * self.RECORD.size] = record
+            header = self.HEADER.pack(self.MAGIC, self.RECORD.size, 0, generation, slots,
+                                      max(self.next, slots + 1), self.version_value, 0)
+        with profile_phase("write"):
+            with open(self._heap_path(generation), 'wb') as file:
+                file.write(heap.getvalue())
+            with open(f"{self.filename}.tmp", 'wb') as file:
+                file.write(header + body)
+            self._close()
+            os.replace(f"{self.filename}.tmp", self.filename)
+            for old in range(generation):
+                if os.path.exists(self._heap_path(old)):
+                    os.remove(self._heap_path(old))
+        self._open()
+
+    def files(self):
+        return [self.filename, self._heap_path(self.generation)]
+
+    def is_empty(self):
+        return self.map is None
+
+    def get(self, id):
+        record = self._record(id)
+        return self._task(record) if record else None
+
+    def put(self, id, task):
+        self._initialize()
+        self.changed = True
+        old = self._record(id)
+        self.count_change(old and self._task(old), task)
+        data = task.description.encode('utf-8')
+        if old is not None and old[3] == len(data) and self._text(old) == task.description:
+            offset = old[4]
+        else:
+            if old is not None:
+                self.garbage += old[3]
+            offset = self.heap_size
+            self.heap_staged += data
+            self.heap_size += len(data)
+        self._grow(int(id))
+        self.staged[int(id)] = self._pack(task, offset, len(data))
+        self.slots = max(self.slots, int(id))
+        self.next = max(self.next, int(id) + 1)
+
+    def delete(self, id):
+        old = self._record(id)
+        if old is None:
+            return
+        self.changed = True
+        self.count_change(self._task(old), None)
+        self.garbage += old[3]
+        self.staged[int(id)] = bytes(self.RECORD.size)
+
+    def next_id(self):
+        self._initialize()
+        self.changed = True
+        id = self.next
+        self.next += 1
+        return str(id)
+
+    def peek_next_id(self):
+        return self.next
+
+    def advance_next_id(self, next_id):
+        if next_id > self.next:
+            self._initialize()
+            self.changed = True
+            self.next = next_id
+
+    def version(self):
+        return self.version_value
+
+    def change_mark(self):
+        if self.map is None:
+            return self.generation, b""
+        return self.generation, self.map[self.HEADER.size:self.HEADER.size + self.slots * self.RECORD.size]
+
+    @classmethod
+    def read_changes(cls, filename, mark):
+        """Compares the record area with the copy in mark, 64 KiB at a time, and reads only
+        the records that differ; a new heap generation moved every description, so then
+        everything is read again."""
+        generation, before = mark
+        with cls(filename) as backend:
+            if backend.generation != generation:
+                return None
+            mark = backend.change_mark()
+            after = mark[1]
+            size = cls.RECORD.size
+            block = 65536 // size * size
+            end = max(len(before), len(after))
+            changes = []
+            for start in range(0, end, block):
+                if before[start:start + block] == after[start:start + block]:
+                    continue
+                for position in range(start, min(start + block, end), size):
+                    record = after[position:position + size]
+                    if record == before[position:position + size]:
+                        continue
+                    id = str(position // size + 1)
+                    if record and record[0]:
+                        changes.append(("put", id, backend._task(cls.RECORD.unpack(record))))
+                    else:
+                        changes.append(("del", id, None))
+            return {"changes": changes, "mark": mark, "version": backend.version(),
+                    "next_id": backend.peek_next_id(), "files": backend.files(),
+                    "signature": file_signature(backend.files())}
+
+    def tasks(self, status=None):
+        for id, record in self._records(status):
+            yield id, self._task(record)
+
+    def find(self, status=None, since=None, until=None, updated_since=None):
+        for id, record in self._records(status):
+            _, flags, _, _, _, created, updated, _, _ = record
+            if since is not None or until is not None:
+                if not flags & self.CREATED or (since is not None and created < since) or \
+                        (until is not None and created > until):
+                    continue
+            if updated_since is not None and (not flags & self.UPDATED or updated < updated_since):
+                continue
+            yield id, self._task(record)
+
+    def count(self, status=None):
+        return sum(1 for _ in self._records(status))
+
+    def max_description_len(self, status=None):
+        return max((record[2] for _, record in self._records(status)), default=0)
+
+    def replace_all(self, tasks_dict):
+        self.changed = True
+        self.reset_stats(tasks_dict.items())
+        self.version_value += 1
+        self.next = max_task_id(tasks_dict) + 1
+        self._rewrite(sorted(tasks_dict.items(), key=lambda item: task_id_key(item[0])))
+
+    def commit(self):
+        if self.changed:
+            self.changed = False
+            self.version_value += 1
+            if self.garbage >= BINARY_HEAP_GARBAGE and self.garbage * 2 >= self.heap_size:
+                self._rewrite(list(self.tasks()))
+            else:
+                with profile_phase("write"):
+                    # The heap first, so no record on disk points past its end.
+                    if self.heap_staged:
+                        os.write(self.heap_fd, self.heap_staged)
+                        self.heap_staged = bytearray()
+                    for id, record in self.staged.items():
+                        self.map[self._position(id):self._position(id) + self.RECORD.size] = record
+                    self.staged = {}
+                    self.HEADER.pack_into(self.map, 0, self.MAGIC, self.RECORD.size, 0, self.generation, self.slots,
+                                          self.next, self.version_value, self.garbage)
+                    self.map.flush()
+        self.save_stats()
+
+    def close(self):
+        self._close()
+        if self.file_lock is not None:
+            self.file_lock.release()
+            self.file_lock = None
+
+
+# Storage backends by file suffix, anything else is a plain JSON file
+BACKENDS = {
+    JOURNAL_SUFFIX: JournalBackend,
+    BINARY_SUFFIX: BinaryBackend,
+    ".db": SqliteBackend,
+    ".sqlite": SqliteBackend,
+    ".sqlite3": SqliteBackend,
+}
+
+
+def register_backend(suffix, backend_class):
+    """The function registers a storage backend for files ending with suffix."""
+    BACKENDS[suffix] = backend_class
+
+
+def backend_class_for(filename):
+    """The function returns the storage backend class that matches the file suffix."""
+    for suffix, backend_class in BACKENDS.items():
+        if str(filename).endswith(suffix):
+            return backend_class
+    return JsonBackend
+
+
+def open_backend(filename):
+    """The function opens the storage backend for a file, an open TaskStore is used as is."""
+    if isinstance(filename, TaskStore):
+        return filename
+    return backend_class_for(filename)(filename)
+
+
+def file_signature(paths):
+    """The function returns (mtime, size) of every path, None for missing ones."""
+    signature = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            signature.append(None)
+        else:
+            signature.append([stat.st_mtime_ns, stat.st_size])
+    return signature
+
+
+class TaskStore(IndexedTasks, StorageBackend):
+    """Task set loaded once per session and served from memory.
+
+    Mutations are kept in a pending list and written to the underlying
+    backend by a write-behind policy:
+        "immediate" - after every command
+        "ops:N"     - after every N changed tasks
+        "ms:T"      - at most T milliseconds after the first unsaved change
+        "exit"      - only by flush(), which main() calls when leaving
+    Before serving a command the store compares mtime/size of the backend
+    files with what it last saw and reloads if someone else changed them,
+    replaying its own unsaved changes on top.
+
+    Writing is optimistic: flush() takes the file lock and compares the
+    backend version with the one the store loaded. On a conflict it retries
+    the pending changes on top of the newer data instead: tasks created
+    here move to fresh IDs if theirs were taken meanwhile, edits only
+    overwrite the fields they changed, and tasks deleted elsewhere stay
+    deleted.
+    """
+
+    def __init__(self, filename, policy="immediate"):
+        super().__init__(filename)
+        self.backend_class = backend_class_for(filename)
+        self.every_ops = None
+        self.every_ms = None
+        if policy.startswith("ops:"):
+            self.every_ops = int(policy[4:])
+        elif policy.startswith("ms:"):
+            self.every_ms = int(policy[3:])
+        elif policy not in {"immediate", "exit"}:
+            crush_program(f"Unknown flush policy \"{policy}\".")
+        self.policy = policy
+        self.lock = threading.RLock()
+        self.pending = []
+        self.created = set()
+        self.timer = None
+        self.reload()
+
+    def reload(self):
+        """Reads the whole task set from the backend."""
+        with self.lock, profile_phase("load"):
+            with self.backend_class(self.filename) as backend:
+                if isinstance(backend, DictBackend):
+                    self.tasks_dict = backend.tasks_dict
+                    self.index = backend.index
+                    self.times = backend.times
+                    self.terms = backend.terms
+                else:
+                    self.tasks_dict = None if backend.is_empty() else dict(backend.tasks())
+                    self.build_indexes()
+                self.next_id_value = backend.peek_next_id()
+                self.version = backend.version()
+                self.task_stats = None
+                self.mark = backend.change_mark()
+                self.signature = file_signature(backend.files())
+                self.paths = backend.files()
+            for op, id, task, _ in self.pending:
+                self._apply(op, id, task)
+
+    def _apply(self, op, id, task):
+        if op == "put":
+            self.put_task(id, task)
+            self.next_id_value = max(self.next_id_value, int(id) + 1)
+        elif op == "del":
+            self.delete_task(id)
+
+    def refresh(self, changed=False):
+        """Reloads the task set if the backend files were changed from outside, reading only
+        the changes where the backend can tell them (see catch_up()). changed says the
+        caller knows the files were written, even if mtime and size look the same."""
+        with self.lock:
+            if file_signature(self.paths) != self.signature:
+                if not self.catch_up():
+                    self.reload()
+            elif changed and self.mark is not None and not self.catch_up():
+                self.reload()
+
+    def catch_up(self):
+        """Applies the changes committed from outside since the last read, as told by
+        StorageBackend.read_changes(); returns False if they have to be reloaded instead."""
+        if self.pending or self.mark is None or self.tasks_dict is None:
+            return False
+        with profile_phase("load"):
+            state = self.backend_class.read_changes(self.filename, self.mark)
+        if state is None:
+            return False
+        for op, id, task in state["changes"]:
+            self._apply(op, id, task)
+        profile_count("tasks_scanned", len(state["changes"]))
+        self.advance_next_id(state["next_id"])
+        self.mark = state["mark"]
+        self.version = state["version"]
+        self.paths = state["files"]
+        self.signature = state["signature"]
+        return True
+
+    def _change(self, op, id, task=None):
+        with self.lock:
+            before = self.tasks_dict.get(id) if self.tasks_dict else None
+            self._apply(op, id, task)
+            self.pending.append((op, id, task, before))
+
+    def is_empty(self):
+        self.refresh()
+        return self.tasks_dict is None
+
+    def put(self, id, task):
+        self._change("put", str(id), task)
+
+    def delete(self, id):
+        self._change("del", str(id))
+
+    def next_id(self):
+        self.refresh()
+        with self.lock:
+            id = self.next_id_value
+            self.next_id_value += 1
+            self.created.add(str(id))
+            return str(id)
+
+    def peek_next_id(self):
+        return self.next_id_value
+
+    def advance_next_id(self, next_id):
+        self.next_id_value = max(self.next_id_value, next_id)
+
+    def replace_all(self, tasks_dict):
+        # Whole-set changes go straight to the backend, after the pending ones.
+        self.flush()
+        with self.lock:
+            with self.backend_class(self.filename) as backend:
+                backend.replace_all(tasks_dict)
+            self.reload()
+
+    def renumber(self, first=1):
+        self.flush()
+        with self.lock:
+            with self.backend_class(self.filename) as backend:
+                backend.renumber(first)
+            self.reload()
+
+    def files(self):
+        return self.paths
+
+    def stats(self):
+        # Saved stats only count if they are of the file exactly as loaded, without unsaved changes on top.
+        if self.task_stats is None:
+            saved = None
+            if not self.pending and file_signature([self.filename]) == self.signature[:1]:
+                saved = read_stats(self.filename)
+            self.task_stats = saved or TaskStats.build(self.tasks())
+        return self.task_stats
+
+    def count_change(self, old, new):
+        # Stats not counted yet will be counted from the tasks as they are then; the backends save theirs.
+        if self.task_stats is not None:
+            self.task_stats.change(old, new)
+
+    def flush(self):
+        """Writes all pending changes to the backend in one commit, see the class
+        docstring for what happens if another process committed first."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return
+            with self.backend_class(self.filename) as backend:
+                version = backend.version()
+                conflict = version is None or version != self.version
+                if conflict:
+                    self._rebase(backend)
+                else:
+                    for op, id, task, _ in self.pending:
+                        if op == "put":
+                            backend.put(id, task)
+                        elif op == "del" and backend.get(id) is not None:
+                            backend.delete(id)
+                    backend.advance_next_id(self.next_id_value)
+                backend.commit()
+                self.version = backend.version()
+                self.mark = backend.change_mark()
+            self.pending = []
+            self.created = set()
+            if conflict:
+                self.reload()
+            else:
+                self.signature = file_signature(self.paths)
+
+    def _rebase(self, backend):
+        moved = {}
+        for op, id, task, before in self.pending:
+            if id in self.created:
+                if id not in moved:
+                    taken = backend.get(id) is not None
+                    moved[id] = backend.next_id() if taken else id
+                id = moved[id]
+            else:
+                current = backend.get(id)
+                if current is None:
+                    continue
+                if op == "put" and before is not None:
+                    task = merge_task(current, before, task)
+            if op == "put":
+                backend.put(id, task)
+            elif op == "del" and backend.get(id) is not None:
+                backend.delete(id)
+
+    def commit(self):
+        """Called at the end of every command, flushes according to the policy."""
+        with self.lock:
+            if not self.pending:
+                return
+            if self.policy == "immediate":
+                self.flush()
+            elif self.every_ops is not None and len(self.pending) >= self.every_ops:
+                self.flush()
+            elif self.every_ms is not None and self.timer is None:
+                self.timer = threading.Timer(self.every_ms / 1000, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def close(self):
+        # The store outlives single commands, flush() ends the session.
+        pass
+
+
+def merge_task(current, before, ours):
+    """The function applies the fields changed from before to ours on top of current."""
+    return Task(*(
+        mine if mine != base else theirs
+        for theirs, base, mine in zip(*([getattr(task, slot) for slot in Task.__slots__]
+                                        for task in (current, before, ours)))
+    ))
+
+
+LIST_NAME = re.compile(r'[\w.-]+')
+
+
+class Catalog:
+    """Named task lists, kept in CATALOG_FILE as {"lists": {name: file}, "current": name}.
+
+    "default" is always the TASKER_FILE list. A new list gets a file next
+    to the catalog, named after the list with the default list's suffix;
+    names whose file would be the catalog or another list's are refused.
+    "current" is the list commands use without --list; `use` sets it, so
+    it holds for later shell commands too. The file is read again only
+    when it changed.
+    """
+
+    def __init__(self, path=None, default=None):
+        self.path = os.path.abspath(path or CATALOG_FILE)
+        self.default = os.path.abspath(default or filename)
+        self.signature = None
+        self.data = None
+
+    def read(self):
+        signature = file_signature([self.path])
+        if self.data is None or signature != self.signature:
+            try:
+                with open(self.path, 'r') as file:
+                    data = json.load(file)
+            except (FileNotFoundError, json.decoder.JSONDecodeError):
+                data = {}
+            self.data = {"lists": data.get("lists", {}), "current": data.get("current", DEFAULT_LIST)}
+            self.signature = signature
+        return self.data
+
+    def write(self):
+        write_file(self.path, json.dumps(self.data, indent=4))
+        self.signature = file_signature([self.path])
+
+    def names(self):
+        return [DEFAULT_LIST, *sorted(self.read()["lists"])]
+
+    def current(self):
+        name = self.read()["current"]
+        return name if name in self.names() else DEFAULT_LIST
+
+    def path_of(self, name):
+        if name == DEFAULT_LIST:
+            return self.default
+        path = self.read()["lists"].get(name)
+        if path is None:
+            crush_program(f"There is no list \"{name}\", \"use {name}\" creates it.")
+        return os.path.join(os.path.dirname(self.path), path)
+
+    def use(self, name):
+        """Makes name the current list, adding it to the catalog if it is new. Returns True if it was."""
+        if not LIST_NAME.fullmatch(name):
+            crush_program(f"Wrong list name \"{name}\", use letters, digits, \".\", \"-\" and \"_\".")
+        data = self.read()
+        created = name not in self.names()
+        if created:
+            file = f"{name}{os.path.splitext(self.default)[1] or '.json'}"
+            taken = {self.path, self.default, *(self.path_of(other) for other in data["lists"])}
+            if os.path.join(os.path.dirname(self.path), file) in taken:
+                crush_program(f"The list \"{name}\" would use \"{file}\", which is already the catalog "
+                              f"or another list, pick another name.")
+            data["lists"][name] = file
+        data["current"] = name
+        self.write()
+        return created
+
+
+class StoreCache:
+    """Loaded TaskStores by task file, least recently used first.
+
+    When the estimated memory of the loaded lists (TASK_MEMORY per task)
+    goes over budget, the least recently used ones are flushed and dropped;
+    the list in use always stays. A cached store still reloads by itself
+    when another process changed its file.
+    """
+
+    def __init__(self, policy="immediate", budget=CACHE_BUDGET):
+        self.policy = policy
+        self.budget = budget
+        self.stores = {}
+
+    def get(self, path):
+        store = self.stores.pop(path, None)
+        if store is None:
+            backend_class_for(path).create(path)
+            store = TaskStore(path, self.policy)
+        # Dicts keep insertion order, so the last one is the most recently used.
+        self.stores[path] = store
+        self.evict()
+        return store
+
+    def memory(self):
+        return sum(TASK_MEMORY * len(store.tasks_dict or ()) for store in self.stores.values())
+
+    def evict(self):
+        while len(self.stores) > 1 and self.memory() > self.budget:
+            self.stores.pop(next(iter(self.stores))).flush()
+
+    def flush(self):
+        for store in list(self.stores.values()):
+            store.flush()
+
+
+class Workspace:
+    """The named lists of one session (see Catalog) and the StoreCache holding them.
+
+    Commands run against a Workspace use its current list or the lists
+    named by --list; going back to a list still in the cache needs no
+    reload from disk. With direct=True (one shell command) a list is just
+    its task file: commands open its backend themselves and read only what
+    they need, nothing is loaded into a TaskStore.
+    """
+
+    def __init__(self, catalog=None, policy="immediate", budget=CACHE_BUDGET, direct=False):
+        self.catalog = catalog or Catalog()
+        self.cache = StoreCache(policy, budget)
+        self.direct = direct
+
+    @property
+    def filename(self):
+        return self.catalog.path_of(self.catalog.current())
+
+    def store(self, name=None):
+        path = self.catalog.path_of(name or self.catalog.current())
+        if self.direct:
+            backend_class_for(path).create(path)
+            return path
+        return self.cache.get(path)
+
+    def stores(self, names):
+        """Yields (name, store) for "name,name,..." or "*" (every list)."""
+        for name in (self.catalog.names() if names == "*" else names.split(",")):
+            yield name, self.store(name)
+
+    def flush(self):
+        self.cache.flush()
+
+
+# Compression of archive segments: file suffix, compress, decompress
+ARCHIVE_CODECS = {
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+    "zlib": (".zz", lambda data: zlib.compress(data, 9), zlib.decompress),
+}
+
+
+class Archive:
+    """Cold tier of a task file: done tasks moved out of it by archive_tasks().
+
+    Tasks live in append-only segments ("<file>.archive/000001.xz"), each one
+    a compressed block of JSON lines [id, Task.to_row()] sorted by ID and
+    never rewritten. manifest.json lists the segments with their task count,
+    ID range, widest description and TaskStats, so lists can size their
+    columns, `show` can pick the segment and "stats" can count archived
+    tasks without decompressing the others. Segments
+    are only read when a list, search or export asks for done tasks.
+    """
+
+    def __init__(self, filename):
+        self.filename = store_filename(filename)
+        self.directory = f"{self.filename}.archive"
+        self.manifest_filename = os.path.join(self.directory, "manifest.json")
+        self._manifest = None
+
+    def manifest(self):
+        if self._manifest is None:
+            try:
+                with open(self.manifest_filename, 'r') as file:
+                    self._manifest = json.load(file)
+            except (FileNotFoundError, json.decoder.JSONDecodeError):
+                self._manifest = {"segments": [], "next": 1}
+        return self._manifest
+
+    def count(self):
+        return sum(segment["count"] for segment in self.manifest()["segments"])
+
+    def width(self):
+        return max((segment["width"] for segment in self.manifest()["segments"]), default=0)
+
+    def max_id(self):
+        return max((segment["max_id"] for segment in self.manifest()["segments"]), default=0)
+
+    def add(self, rows):
+        """Writes (id, task) pairs as new segments, then records them in the manifest."""
+        suffix, compress, _ = ARCHIVE_CODECS[ARCHIVE_COMPRESSION]
+        manifest = self.manifest()
+        rows = sorted(rows, key=lambda row: task_id_key(row[0]))
+        os.makedirs(self.directory, exist_ok=True)
+        for start in range(0, len(rows), ARCHIVE_SEGMENT_TASKS):
+            chunk = rows[start:start + ARCHIVE_SEGMENT_TASKS]
+            name = f"{manifest['next']:06d}{suffix}"
+            text = "".join(json.dumps([id, task.to_row()], ensure_ascii=False) + "\n" for id, task in chunk)
+            path = os.path.join(self.directory, name)
+            with open(path + ".tmp", 'wb') as file:
+                file.write(compress(text.encode('utf-8')))
+            os.replace(path + ".tmp", path)
+            manifest["segments"].append({
+                "file": name, "count": len(chunk), "min_id": int(chunk[0][0]), "max_id": int(chunk[-1][0]),
+                "width": max(display_width(task.description) for _, task in chunk),
+                "stats": TaskStats.build(chunk).to_json(),
+            })
+            manifest["next"] += 1
+        write_file(self.manifest_filename, json.dumps(manifest))
+
+    def stats(self, rebuild=False):
+        """Returns the TaskStats of the archived tasks, counting the segments again for rebuild
+        and those archived before the manifest kept their stats."""
+        manifest = self.manifest()
+        stats = TaskStats()
+        counted = False
+        for segment in manifest["segments"]:
+            if rebuild or "stats" not in segment:
+                segment["stats"] = TaskStats.build(self._read(segment)).to_json()
+                counted = True
+            stats = stats.merged(TaskStats(segment["stats"]))
+        if counted:
+            write_file(self.manifest_filename, json.dumps(manifest))
+        return stats
+
+    def _read(self, segment):
+        _, _, decompress = next(codec for codec in ARCHIVE_CODECS.values()
+                                if segment["file"].endswith(codec[0]))
+        with open(os.path.join(self.directory, segment["file"]), 'rb') as file:
+            data = decompress(file.read())
+        scanned = 0
+        try:
+            for line in data.decode('utf-8').splitlines():
+                id, row = json.loads(line)
+                scanned += 1
+                yield id, Task.from_list(row)
+        finally:
+            profile_count("tasks_scanned", scanned)
+
+    def tasks(self, status=None):
+        """Yields the archived (id, task) pairs, segment by segment; all of them are done."""
+        if status not in {None, "done"}:
+            return
+        for segment in self.manifest()["segments"]:
+            yield from self._read(segment)
+
+    def find(self, since=None, until=None, updated_since=None):
+        if (since, until, updated_since) == (None, None, None):
+            yield from self.tasks()
+            return
+        for id, task in self.tasks():
+            if in_period(task, since, until, updated_since):
+                yield id, task
+
+    def search(self, groups, status=None):
+        for id, task in self.tasks(status):
+            if matches_query(task, groups, self.filename):
+                yield id, task
+
+    def get(self, id):
+        if not str(id).isdigit():
+            return None
+        for segment in self.manifest()["segments"]:
+            if segment["min_id"] <= int(id) <= segment["max_id"]:
+                for archived_id, task in self._read(segment):
+                    if archived_id == str(id):
+                        return task
+        return None
+
+
+def completed_at(task):
+    """The function returns when a done task was finished: its completion time, or its last
+    update or creation for tasks marked done before completion times were kept."""
+    return task.completed or task.updated or task.created
+
+
+def archive_tasks(filename, days=ARCHIVE_DAYS, now=None):
+    """The function moves tasks done for more than days days into the archive, returns their number.
+
+    The segments and the manifest are written before the tasks leave the
+    hot file, so an interruption can at worst leave a task in both places,
+    never in neither.
+    """
+    cutoff = (now or now_timestamp()) - days * 24 * 60 * 60
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            return 0
+        rows = [(id, task) for id, task in backend.tasks("done")
+                if isinstance(completed_at(task), int) and completed_at(task) <= cutoff]
+        if not rows:
+            return 0
+        archive = Archive(filename)
+        archive.add(rows)
+        with profile_phase("mutate"):
+            for id, _ in rows:
+                backend.delete(id)
+        backend.advance_next_id(archive.max_id() + 1)
+    return len(rows)
+
+
+def with_archived(rows, archived):
+    """The function merges hot and archived (id, task) rows by ID."""
+    return merge(rows, archived, key=lambda row: task_id_key(row[0]))
+
+
+def import_json(json_filename, target_filename):
+    """The function migrates an existing JSON task file into another storage backend."""
+    with open(json_filename, 'r') as file:
+        try:
+            tasks_dict = tasks_from_lists(json.load(file))
+        except json.decoder.JSONDecodeError:
+            tasks_dict = {}
+
+    # Long descriptions move from the JSON file's blob store to the target's.
+    source, target = BlobStore(json_filename), BlobStore(target_filename)
+    for task in tasks_dict.values():
+        if task.blob is not None and source.directory != target.directory:
+            target.put(full_description(json_filename, task))
+
+    with open_backend(target_filename) as backend:
+        backend.replace_all(tasks_dict)
+    return len(tasks_dict)
+
+
+def convert_tasks(source_filename, target_filename):
+    """The function copies a task list with its IDs into a file of another storage format, picked by
+    the suffix (tasks.json -> tasks.tbin and back), returns the number of tasks.
+
+    Long descriptions and archived tasks are copied along; the target file is replaced.
+    """
+    with open_backend(source_filename) as source:
+        tasks_dict = dict(source.tasks())
+        next_id = source.peek_next_id()
+
+    source_blobs, target_blobs = BlobStore(source_filename), BlobStore(target_filename)
+    for task in tasks_dict.values():
+        if task.blob is not None and source_blobs.directory != target_blobs.directory:
+            target_blobs.put(full_description(source_filename, task))
+    source_archive, target_archive = Archive(source_filename), Archive(target_filename)
+    if os.path.isdir(source_archive.directory) and not os.path.exists(target_archive.directory):
+        shutil.copytree(source_archive.directory, target_archive.directory)
+
+    with open_backend(target_filename) as target:
+        target.replace_all(tasks_dict)
+        target.advance_next_id(next_id)
+    return len(tasks_dict)
+
+
+# Columns of exported tasks; imports need only "description"
+TRANSFER_FIELDS = ["id", "description", "status", "created", "updated"]
+TRANSFER_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+# Rows read and stored at a time by import_tasks
+IMPORT_CHUNK = 10000
+
+
+def transfer_format(path, format=None):
+    """The function returns "ndjson" or "csv" for an import/export file, from format or the file suffix."""
+    if format is None:
+        format = TRANSFER_FORMATS.get(os.path.splitext(str(path))[1].lower())
+    if format not in {"ndjson", "csv"}:
+        crush_program("Unknown file format, use a .ndjson, .jsonl or .csv file or --format ndjson|csv.")
+    return format
+
+
+def open_transfer_file(path, mode):
+    """The function opens an import/export file, "-" being stdin or stdout."""
+    if path == "-":
+        return nullcontext(sys.stdin if mode == 'r' else sys.stdout)
+    try:
+        return open(path, mode, newline='', encoding='utf-8')
+    except OSError:
+        crush_program(f"Can't open the file \"{path}\".")
+
+
+def read_transfer_rows(file, format):
+    """The function yields (row number, {field: value}) pairs of an NDJSON or CSV file."""
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        if not isinstance(row, dict):
+            crush_program(f"Row {number} is not a JSON object.")
+        yield number, row
+
+
+def task_from_row(number, row, now, filename):
+    """The function builds a new Task from an imported row, created defaults to now.
+
+    Long descriptions go into the blob store of the task file filename.
+    """
+    description = row.get("description")
+    if not description:
+        crush_program(f"Row {number} has no description.")
+    status = row.get("status") or "todo"
+    if status not in STATUS_COLORS:
+        crush_program(f"Row {number} has an unknown status \"{status}\".")
+    task = Task.from_list([str(description), status, row.get("created") or now, row.get("updated") or "N/A"])
+    return new_task(filename, task.description, task.status, task.created, task.updated)
+
+
+def import_tasks(path, filename, format=None):
+    """The function streams NDJSON or CSV rows into the task list as new tasks, returns their number.
+
+    Rows are stored IMPORT_CHUNK at a time, each chunk under one block of
+    fresh IDs, and the whole import is committed once: a bad row leaves the
+    list untouched.
+    """
+    format = transfer_format(path, format)
+    now = now_timestamp()
+    count = 0
+    with open_transfer_file(path, 'r') as file, open_backend(filename) as backend:
+        rows = read_transfer_rows(file, format)
+        while True:
+            chunk = [task_from_row(number, row, now, filename) for number, row in islice(rows, IMPORT_CHUNK)]
+            if not chunk:
+                break
+            backend.add_many(chunk)
+            count += len(chunk)
+    return count
+
+
+def iter_tasks(filename, status=None):
+    """The function yields (id, task) pairs of one status or all, JSON files are streamed from disk."""
+    if not isinstance(filename, TaskStore) and backend_class_for(filename) is JsonBackend:
+        yield from JsonBackend.stream(filename, status) or ()
+        return
+    backend = open_backend(filename)
+    try:
+        yield from backend.tasks(status)
+    finally:
+        backend.close()
+
+
+def export_tasks(filename, path, format=None, status=None):
+    """The function streams the tasks (optionally of one status), archived ones included,
+    into an NDJSON or CSV file, returns their number."""
+    format = transfer_format(path, format)
+    count = 0
+    with open_transfer_file(path, 'w') as file:
+        if format == "csv":
+            writer = csv.writer(file)
+            writer.writerow(TRANSFER_FIELDS)
+        for id, task in with_archived(iter_tasks(filename, status), Archive(filename).tasks(status)):
+            row = [id, full_description(filename, task), task.status, format_timestamp(task.created),
+                   format_timestamp(task.updated)]
+            if format == "csv":
+                writer.writerow(row)
+            else:
+                file.write(json.dumps(dict(zip(TRANSFER_FIELDS, row)), ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def scan_tasks(filename, status=None, limit=None, since=None, until=None, updated_since=None):
+    """The function returns (Task column width, rows) for a list, or None if it is empty.
+
+    JSON files are read from disk, streamed when a limit can stop early
+    (see JsonBackend.reader()); so is the JSON file of a TaskStore with a
+    limit and no unsaved changes. Other backends are iterated in place.
+    A time range (see StorageBackend.find) is answered from the time index
+    and sizes the Task column from the matching rows only.
+    """
+    period = (since, until, updated_since)
+    if isinstance(filename, TaskStore) and filename.backend_class is JsonBackend and limit is not None:
+        with filename.lock:
+            if not filename.pending:
+                filename = filename.filename
+    if not isinstance(filename, TaskStore) and backend_class_for(filename) is JsonBackend:
+        if period == (None, None, None):
+            return JsonBackend.scan(filename, status, limit)
+        rows = JsonBackend.reader(filename, limit)(filename, status)
+        if rows is None:
+            return None
+        page = list(islice(((id, task) for id, task in rows if in_period(task, *period)), limit))
+        return max((display_width(task.description) for _, task in page), default=0), iter(page)
+
+    backend = open_backend(filename)
+    if backend.is_empty():
+        backend.close()
+        return None
+
+    if period != (None, None, None):
+        page = list(islice(backend.find(status, *period), limit))
+        backend.close()
+        return max((display_width(task.description) for _, task in page), default=0), iter(page)
+
+    def rows():
+        try:
+            yield from backend.tasks(status)
+        finally:
+            backend.close()
+
+    return backend.max_description_len(status), rows()
+
+
+def load_tasks(filename):
+    """The function reads the task dictionary in the legacy list layout, None if the to-do list is empty."""
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            return None
+        return {id: task.to_list() for id, task in backend.tasks()}
+
+
+def add_task(data, filename):
+    """The function adds a new task to our dictionary."""
+    with open_backend(filename) as backend:
+        with profile_phase("mutate"):
+            id = backend.next_id()
+            backend.put(id, new_task(backend.filename, data, "todo", now_timestamp()))
+
+
+def check_not_archived(id, filename, verb):
+    """The function stops with an error when the task was moved to the archive, whose segments
+    are never rewritten: archived tasks can be shown but not updated, marked or deleted."""
+    if Archive(filename).get(id) is not None:
+        crush_program(f"You can't {verb} this task because it's archived.")
+
+
+def delete_task(id, filename):
+    """The function delete a task to our dictionary."""
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            check_not_archived(id, filename, "delete")
+            crush_program("You can't delete the task because the to-do list is empty now.")
+
+        if backend.get(id) is not None:
+            with profile_phase("mutate"):
+                backend.delete(id)
+        else:
+            check_not_archived(id, filename, "delete")
+            crush_program("You can't delete this task because it's not on the to-do list.")
+
+
+def update_task(id, data, filename):
+    """The function update a current task to our dictionary."""
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            check_not_archived(id, filename, "update")
+            crush_program("You can't update the task because the to-do list is empty now.")
+
+        task = backend.get(id)
+        if task is not None:
+            with profile_phase("mutate"):
+                backend.put(id, new_task(backend.filename, data, task.status, task.created, now_timestamp()))
+        else:
+            check_not_archived(id, filename, "update")
+            crush_program("You can't update this task because it's not on the to-do list.")
+
+
+def update_status(id, status, filename):
+    """The function update a current status for task to our dictionary."""
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            check_not_archived(id, filename, "mark")
+            crush_program("You can't mark this task because the to-do list is empty now.")
+
+        task = backend.get(id)
+        if task is not None:
+            with profile_phase("mutate"):
+                backend.put(id, with_status(task, status))
+        else:
+            check_not_archived(id, filename, "mark")
+            crush_program("You can't mark this task because it's not on the to-do list.")
+
+
+def with_status(task, status):
+    """The function returns a task with another status, keeping its completion time while it stays done."""
+    completed = (task.completed or now_timestamp()) if status == "done" else None
+    return Task(task.description, status, task.created, task.updated, task.blob, completed)
+
+
+def parse_id_ranges(value):
+    """The function converts "10-500,730" into sorted, merged [(first, last)] ID ranges, None if malformed."""
+    ranges = []
+    for part in value.split(","):
+        first, dash, last = part.partition("-")
+        last = last if dash else first
+        if not (first.isdigit() and last.isdigit()) or int(first) > int(last):
+            return None
+        ranges.append((int(first), int(last)))
+    merged = []
+    for first, last in sorted(ranges):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def in_id_ranges(id, ranges):
+    """The function checks an ID against ranges from parse_id_ranges()."""
+    position = bisect_right(ranges, (int(id), math.inf)) - 1
+    return position >= 0 and ranges[position][1] >= int(id)
+
+
+# --where condition: field, operator (= equal, != not equal, ~ contains, case-insensitive), value
+WHERE_CONDITION = re.compile(r'\s*(status|desc)\s*(!=|=|~)(.*)', re.IGNORECASE)
+# "and" between --where conditions, unless it is inside a double-quoted value
+WHERE_AND = re.compile(r'\s+and\s+(?=(?:[^"]*"[^"]*")*[^"]*$)', re.IGNORECASE)
+
+
+def parse_where_option(value):
+    """The function converts a --where value ('status=todo and desc~"rock and roll"') into
+    [(field, operator, value)]; double quotes keep " and " inside a value."""
+    conditions = []
+    for text in WHERE_AND.split(value.strip()):
+        match = WHERE_CONDITION.fullmatch(text)
+        if match is None:
+            crush_program(f"Wrong condition \"{text}\", use status=S, status!=S, desc=TEXT, desc!=TEXT or desc~TEXT.")
+        field, operator, wanted = match.group(1).lower(), match.group(2), match.group(3).strip()
+        if len(wanted) > 1 and wanted[0] == wanted[-1] == '"':
+            wanted = wanted[1:-1]
+        if field == "status" and (operator == "~" or wanted not in STATUS_COLORS):
+            crush_program(f"Wrong condition \"{text}\", status takes = or != and todo, in-progress or done.")
+        conditions.append((field, operator, wanted if field == "status" else wanted.casefold()))
+    return conditions
+
+
+def matches_where(task, conditions, filename=None):
+    """The function checks a task against parsed --where conditions, all of which must hold;
+    desc conditions see the whole description, from the blob store of filename for long ones."""
+    for field, operator, wanted in conditions:
+        if field == "status":
+            value = task.status
+        elif task.blob is not None and filename is not None:
+            value = (BlobStore(filename).get(task.blob) or task.description).casefold()
+        else:
+            value = task.description.casefold()
+        if operator == "~":
+            found = wanted in value
+        else:
+            found = (value == wanted) == (operator == "=")
+        if not found:
+            return False
+    return True
+
+
+def select_tasks(backend, ranges=None, where=(), since=None, until=None, updated_since=None):
+    """The function returns the (id, task) rows with an ID in ranges (None for any) that match the --where
+    conditions and were created within [since, until] and updated at or after updated_since."""
+    status = next((wanted for field, operator, wanted in where if field == "status" and operator == "="), None)
+    if ranges is not None and sum(last - first + 1 for first, last in ranges) <= BULK_LOOKUP_IDS:
+        rows = ((str(id), backend.get(str(id))) for first, last in ranges for id in range(first, last + 1))
+        rows = ((id, task) for id, task in rows
+                if task is not None and in_period(task, since, until, updated_since))
+    else:
+        rows = backend.find(status, since, until, updated_since)
+        if ranges is not None:
+            rows = ((id, task) for id, task in rows if in_id_ranges(id, ranges))
+    selected = [(id, task) for id, task in rows if matches_where(task, where, backend.filename)]
+    profile_count("tasks_scanned", len(selected))
+    return selected
+
+
+def change_tasks(filename, action, ranges=None, where=(), since=None, until=None, updated_since=None,
+                 dry_run=False):
+    """The function marks ("done", "in-progress") or deletes ("delete") every task picked by select_tasks()
+    in one pass and one commit, and returns how many there were; tasks that already have
+    the status are left alone. With dry_run it only counts them."""
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            verb = "delete" if action == "delete" else "mark"
+            crush_program(f"You can't {verb} the tasks because the to-do list is empty now.")
+        with profile_phase("load"):
+            rows = select_tasks(backend, ranges, where, since, until, updated_since)
+        if action != "delete":
+            rows = [(id, task) for id, task in rows if task.status != action]
+        if not dry_run:
+            with profile_phase("mutate"):
+                for id, task in rows:
+                    if action == "delete":
+                        backend.delete(id)
+                    else:
+                        backend.put(id, with_status(task, action))
+    return len(rows)
+
+
+def show_task(id, filename):
+    """The function displays one task with its whole description."""
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            crush_program("You can't show the task because the to-do list is empty now.")
+        task = backend.get(id) or Archive(filename).get(id)
+        if task is None:
+            crush_program("You can't show this task because it's not on the to-do list.")
+
+    print("\n")
+    print(f"ID:      {id}")
+    print(f"Status:  {get_colored_status(task.status)}")
+    print(f"Created: {format_timestamp(task.created)}")
+    print(f"Updated: {format_timestamp(task.updated)}")
+    print()
+    print(full_description(filename, task))
+    print("\n")
+
+
+def renumber_tasks(filename):
+    """The function gives the tasks dense IDs from 1 again, keeping their order;
+    archived tasks keep theirs, so numbering starts after the last one."""
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            crush_program("You can't renumber the tasks because the to-do list is empty now.")
+        backend.renumber(Archive(filename).max_id() + 1)
+
+
+# Output formats of lists and search; all but table and plain skip colors and padding
+RENDER_FORMATS = ("table", "plain", "json", "ndjson", "csv", "tsv")
+# Rows formatted before each write to stdout
+RENDER_CHUNK = 1024
+# Columns of the Task table other than the description: "ID  | ", " | Status ... Updated"
+TABLE_FIXED_WIDTH = 6 + 3 + 12 + 3 + 20 + 3 + 19
+
+
+def check_format(format):
+    """The function checks the value of --format for lists and search."""
+    if format not in RENDER_FORMATS:
+        crush_program(f"\"--format\" needs one of {', '.join(RENDER_FORMATS)}.")
+    return format
+
+
+def fit_text(text, width):
+    """The function pads text to width terminal columns, cutting it with "…" if it is wider."""
+    if text.isascii() and len(text) <= width:
+        return f"{text:<{width}}"
+    text_width = display_width(text)
+    if text_width <= width:
+        return text + " " * (width - text_width)
+    cut, used = [], 0
+    for char in text:
+        char_width = display_width(char)
+        if used + char_width > width - 1:
+            break
+        cut.append(char)
+        used += char_width
+    return "".join(cut) + "…" + " " * (width - 1 - used)
+
+
+def table_width_limit():
+    """The function returns the widest Task column that fits the terminal, None if stdout is no terminal."""
+    if not sys.stdout.isatty():
+        return None
+    return max(20, shutil.get_terminal_size().columns - TABLE_FIXED_WIDTH)
+
+
+def render_tasks(rows, format="table", width=None, names=False, filename=None):
+    """The function writes (id, task) rows, or (list name, id, task) rows if names, to stdout
+    in one of RENDER_FORMATS and returns their number.
+
+    table pads the columns and colors the status, plain is the same table
+    without colors. width is the Task column width if the caller knows it
+    (from an index), so rows stream; otherwise it is measured first.
+    Columns count terminal cells (display_width), and descriptions wider
+    than the column, or than the terminal leaves for it, are cut with "…".
+    json, ndjson, csv and tsv write the fields of `export` per row without
+    any padding or colors, long descriptions with their whole text from the
+    blob store of filename (for named rows a function of the list name).
+    Rows are formatted in chunks of RENDER_CHUNK
+    and each chunk goes out in one write.
+    """
+    check_format(format)
+    write = sys.stdout.write
+    count = 0
+    if format in {"table", "plain"}:
+        if width is None or names:
+            rows = list(rows)
+            if width is None:
+                width = max((display_width(row[-1].description) for row in rows), default=0)
+        rows = iter(rows)
+        first = next(rows, None)
+        if first is None:
+            print("Nothing to display.")
+            return 0
+        limit = table_width_limit()
+        width = max(min(width, limit) if limit else width, len("Task"))
+        if names:
+            rows = list(chain([first], rows))
+            name_width = max(4, max(display_width(row[0]) for row in rows))
+            prefix = f"{'List':<{name_width}} | "
+        else:
+            rows = chain([first], rows)
+            prefix = ""
+        color = format == "table"
+        header = f"{prefix}{'ID':<3} | {'Task':<{width}} | {'Status':<12} | {'Created':<20} | {'Updated':<19}"
+        chunk = ["\n\n", header, "\n", "-" * len(header), "\n"]
+        for row in rows:
+            key, task = row[-2], row[-1]
+            status = get_colored_status(task.status) if color else task.status
+            chunk.append(
+                (fit_text(row[0], name_width) + " | " if names else "")
+                + f"{key:<3} | "
+                f"{fit_text(task.description, width)} | "
+                f"{status:<{12 + len(status) - len(task.status)}} | "
+                f"{format_timestamp(task.created):<20} | "
+                f"{format_timestamp(task.updated):<19}\n"
+            )
+            count += 1
+            if count % RENDER_CHUNK == 0:
+                write("".join(chunk))
+                chunk = []
+        chunk.append("\n\n")
+        write("".join(chunk))
+        return count
+
+    fields = ["list", *TRANSFER_FIELDS] if names else TRANSFER_FIELDS
+    # Every value is a string, so objects are joined from encoded strings without json.dumps.
+    keys = [json.dumps(field) + ": " for field in fields]
+    encode = json.encoder.encode_basestring
+    buffer = io.StringIO()
+    writer = None
+    if format in {"csv", "tsv"}:
+        writer = csv.writer(buffer, delimiter="," if format == "csv" else "\t", lineterminator="\n")
+        writer.writerow(fields)
+    elif format == "json":
+        buffer.write("[")
+    for row in rows:
+        task = row[-1]
+        description = task.description
+        if task.blob is not None and filename is not None:
+            description = full_description(filename(row[0]) if names else filename, task)
+        values = [*row[:-1], description, task.status, format_timestamp(task.created),
+                  format_timestamp(task.updated)]
+        if writer is not None:
+            writer.writerow(values)
+        else:
+            if format == "json":
+                buffer.write(",\n" if count else "\n")
+            buffer.write("{" + ", ".join([key + encode(value) for key, value in zip(keys, values)]) + "}")
+            if format == "ndjson":
+                buffer.write("\n")
+        count += 1
+        if count % RENDER_CHUNK == 0:
+            write(buffer.getvalue())
+            buffer.seek(0)
+            buffer.truncate()
+    if format == "json":
+        buffer.write("\n]\n" if count else "]\n")
+    write(buffer.getvalue())
+    return count
+
+
+def show_list(filename, status=None, limit=None, since=None, until=None, updated_since=None, format="table"):
+    """The function displays the tasks of one status (None for all), at most limit of them, optionally
+    only those created in [since, until] or updated at or after updated_since. Done lists
+    include archived tasks."""
+    archive = Archive(filename) if status == "done" else None
+    with profile_phase("load"):
+        scan = scan_tasks(filename, status, limit, since, until, updated_since)
+    if scan is None and not (archive and archive.count()):
+        crush_program("You can't see this list because the to-do list is empty now.")
+
+    max_task_len, rows = scan or (0, iter(()))
+    if archive is not None:
+        max_task_len = max(max_task_len, archive.width())
+        rows = with_archived(rows, archive.find(since, until, updated_since))
+    render_tasks(profile_rows(islice(rows, limit)), format, max_task_len, filename=filename)
+
+
+def show_full_list(filename, limit=None, since=None, until=None, updated_since=None, format="table"):
+    """The function displays a list of all tasks, at most limit of them, optionally
+    only those created in [since, until] or updated at or after updated_since."""
+    show_list(filename, None, limit, since, until, updated_since, format)
+
+
+def show_done_list(filename, limit=None, since=None, until=None, updated_since=None, format="table"):
+    """The function displays a list of done tasks, archived ones included, at most limit of them,
+    optionally only those created in [since, until] or updated at or after updated_since."""
+    show_list(filename, "done", limit, since, until, updated_since, format)
+
+
+def show_progress_list(filename, limit=None, since=None, until=None, updated_since=None, format="table"):
+    """The function displays a list of in-progress tasks, at most limit of them, optionally
+    only those created in [since, until] or updated at or after updated_since."""
+    show_list(filename, "in-progress", limit, since, until, updated_since, format)
+
+
+def show_todo_list(filename, limit=None, since=None, until=None, updated_since=None, format="table"):
+    """The function displays a list of todo tasks, at most limit of them, optionally
+    only those created in [since, until] or updated at or after updated_since."""
+    show_list(filename, "todo", limit, since, until, updated_since, format)
+
+
+# --sort field -> sort value of a task; a missing or legacy timestamp sorts as the oldest
+SORT_FIELDS = {
+    "id": lambda task: 0,
+    "created": lambda task: task.created if isinstance(task.created, int) else -1,
+    "updated": lambda task: task.updated if isinstance(task.updated, int) else -1,
+    "status": lambda task: list(STATUS_COLORS).index(task.status) if task.status in STATUS_COLORS else -1,
+    "desc": lambda task: task.description.casefold(),
+}
+
+
+def sort_key(sort):
+    """The function returns the key of (id, task) rows for a --sort value ("-field" is descending):
+    the field's value, then the ID, so equal values keep a stable order for cursors."""
+    value = SORT_FIELDS[sort.lstrip("-")]
+    return lambda row: (value(row[1]), task_id_key(row[0]))
+
+
+def encode_cursor(sort, row):
+    """The function returns the --after cursor that continues a list after row."""
+    value, _ = sort_key(sort)(row)
+    text = json.dumps([sort, value, row[0]], ensure_ascii=False)
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii').rstrip("=")
+
+
+def decode_cursor(cursor):
+    """The function returns (sort, key) of an --after cursor."""
+    try:
+        sort, value, id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        crush_program("Wrong cursor, use the one printed after the previous page.")
+    if sort.lstrip("-") not in SORT_FIELDS:
+        crush_program("Wrong cursor, use the one printed after the previous page.")
+    return sort, (value, task_id_key(str(id)))
+
+
+def time_order(store, field, after=None, descending=False):
+    """The function yields the IDs of an in-memory task set in (field, ID) order, or the
+    reverse, after the sort key after.
+
+    Tasks with an epoch field come from the time index; the others (sort
+    value -1, e.g. never updated) come first ascending and last descending,
+    and are only looked for when a page reaches them.
+    """
+    def missing():
+        ids = sorted((id for id, task in (store.tasks_dict or {}).items()
+                      if not isinstance(getattr(task, field), int)), key=task_id_key, reverse=descending)
+        if after is not None and after[0] == -1:
+            ids = [id for id in ids if (task_id_key(id) < after[1] if descending else task_id_key(id) > after[1])]
+        return ids
+
+    in_missing = after is not None and after[0] == -1
+    walk_after = None if after is None or in_missing else (after[0], after[1][1])
+    if descending:
+        if not in_missing:
+            yield from store.time_index().walk(field, walk_after, True)
+        yield from missing()
+    else:
+        if after is None or in_missing:
+            yield from missing()
+        yield from store.time_index().walk(field, walk_after)
+
+
+def sorted_page(store, filter="all", sort="id", limit=None, after=None, since=None, until=None,
+                updated_since=None):
+    """The function returns the "list" rows of one page: at most limit of them in sort order,
+    starting after the key of the cursor after (see decode_cursor).
+
+    A limit keeps the best rows in a heap of that size (heapq.nsmallest),
+    so time grows with n log(limit) and memory with the page. ID order
+    and, on in-memory task sets, created/updated order need no heap: they
+    are walked from the cursor (see time_order) and stop after limit
+    matching rows.
+    """
+    descending = sort.startswith("-")
+    field = sort.lstrip("-")
+    status = None if filter == "all" else filter
+    archived = status in {None, "done"} and Archive(store).count()
+
+    if field in TimeIndex.FIELDS and isinstance(store, IndexedTasks) and not archived:
+        rows = ((id, store.tasks_dict[id]) for id in time_order(store, field, after, descending))
+        rows = ((id, task) for id, task in rows
+                if (status is None or task.status == status) and in_period(task, since, until, updated_since))
+        return list(islice(rows, limit))
+
+    key = sort_key(sort)
+    rows = list_rows(store, filter, since=since, until=until, updated_since=updated_since)
+    if after is not None:
+        rows = (row for row in rows if (key(row) < after if descending else key(row) > after))
+    if field == "id" and not descending:
+        return list(islice(rows, limit))
+    if limit is None:
+        return sorted(rows, key=key, reverse=descending)
+    return (nlargest if descending else nsmallest)(limit, rows, key=key)
+
+
+def show_sorted_list(filename, filter="all", sort=None, limit=None, after=None, since=None, until=None,
+                     updated_since=None, format="table"):
+    """The function displays one page of a list in --sort order and, if more may follow, the
+    cursor of the next page; sort defaults to the order the cursor after was made for."""
+    if after is not None:
+        cursor_sort, after = decode_cursor(after)
+        if sort is not None and sort != cursor_sort:
+            crush_program("The cursor belongs to another --sort order.")
+        sort = cursor_sort
+    sort = sort or "id"
+    with open_backend(filename) as backend:
+        if backend.is_empty() and not Archive(filename).count():
+            crush_program("You can't see this list because the to-do list is empty now.")
+        with profile_phase("load"):
+            rows = sorted_page(backend, filter, sort, limit, after, since, until, updated_since)
+    profile_count("tasks_emitted", len(rows))
+
+    render_tasks(rows, format, filename=filename)
+    if limit is not None and len(rows) == limit:
+        # Machine-readable output stays parseable, the cursor goes to stderr.
+        print(f"Next page: --after {encode_cursor(sort, rows[-1])}",
+              file=sys.stdout if format in {"table", "plain"} else sys.stderr)
+
+
+def show_search_results(query, filename, status=None, limit=None, format="table"):
+    """The function displays the tasks whose descriptions match a search query, archived
+    ones included, optionally only one status and at most limit of them."""
+    groups = parse_query(query)
+    if not groups:
+        crush_program("Nothing to search for.")
+
+    with open_backend(filename) as backend:
+        if backend.is_empty():
+            crush_program("You can't search because the to-do list is empty now.")
+        with profile_phase("load"):
+            archived = Archive(filename).search(groups, status)
+            rows = list(islice(with_archived(backend.search(groups, status), archived), limit))
+    profile_count("tasks_emitted", len(rows))
+    render_tasks(rows, format, filename=filename)
+
+
+def show_lists_rows(rows, limit=None, format="table", filename=None):
+    """The function displays (list name, id, task) rows of several lists in one table, at most limit
+    of them; filename(name) is the task file of a list."""
+    with profile_phase("load"):
+        rows = list(islice(rows, limit))
+    profile_count("tasks_emitted", len(rows))
+    render_tasks(rows, format, names=True, filename=filename)
+
+
+def show_profile_stats(metrics_file, last=20):
+    """The function displays per-command averages of the last profiled commands."""
+    records = read_metrics(metrics_file, last)
+    if not records:
+        print("No profiled commands yet, run one with --profile or TASKER_PROFILE=1.")
+        return
+
+    commands = {}
+    for record in records:
+        commands.setdefault(record["command"], []).append(record)
+
+    print("\n")
+    print(f"Last {len(records)} profiled commands ({metrics_file}), mean milliseconds:")
+    header = (f"{'Command':<16} | {'Runs':>4} | {'Total':>9} | {'Max':>9} | "
+              + " | ".join(f"{phase:>9}" for phase in PROFILE_PHASES)
+              + f" | {'Read KiB':>9} | {'Wrote KiB':>9} | {'Scanned':>9} | {'Emitted':>9}")
+    print(header)
+    print("-" * len(header))
+    def mean(values):
+        values = [value for value in values if value is not None]
+        return sum(values) / len(values) if values else 0
+
+    for command, runs in commands.items():
+        phases = " | ".join(f"{mean(run['phases_ms'].get(phase, 0) for run in runs):>9.1f}"
+                            for phase in PROFILE_PHASES)
+        print(f"{command:<16} | {len(runs):>4} | {mean(run['total_ms'] for run in runs):>9.1f} | "
+              f"{max(run['total_ms'] for run in runs):>9.1f} | {phases} | "
+              f"{mean(run['bytes_read'] for run in runs) / 1024:>9.1f} | "
+              f"{mean(run['bytes_written'] for run in runs) / 1024:>9.1f} | "
+              f"{mean(run['tasks_scanned'] for run in runs):>9.0f} | "
+              f"{mean(run['tasks_emitted'] for run in runs):>9.0f}")
+    print("\n")
+
+
+def format_duration(seconds):
+    """The function renders a duration as its two largest units ("3d 4h", "25m 10s")."""
+    seconds = round(seconds)
+    parts = []
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60), ("s", 1)):
+        if seconds >= size or (unit == "s" and not parts):
+            parts.append(f"{seconds // size}{unit}")
+            seconds %= size
+    return " ".join(parts[:2])
+
+
+def show_task_stats(stats, archived=None, days=STATS_DAYS, now=None):
+    """The function displays TaskStats: tasks per status (archived ones counted as done), tasks
+    created and done on each of the last days days, and percentiles of the time to done."""
+    archived_count = sum(archived.counts.values()) if archived else 0
+    if archived:
+        stats = stats.merged(archived)
+    total = sum(stats.counts.values())
+
+    print("\n")
+    print(f"Tasks: {total}" + (f" ({archived_count} archived)" if archived_count else ""))
+    for status in list(STATUS_COLORS) + sorted(set(stats.counts) - set(STATUS_COLORS)):
+        colored = get_colored_status(status)
+        print(f"  {colored}{' ' * (12 - len(status))}{stats.counts.get(status, 0):>8}")
+
+    if days:
+        today = datetime.fromtimestamp(now or now_timestamp()).date()
+        print(f"\n{'Day':<10} | {'Created':>7} | {'Done':>7}")
+        print("-" * 30)
+        for back in range(days - 1, -1, -1):
+            day = today - timedelta(days=back)
+            key = day.isoformat()
+            print(f"{day.strftime('%d.%m.%Y')} | {stats.created.get(key, 0):>7} | {stats.completed.get(key, 0):>7}")
+
+    lead = [stats.percentile(fraction) for fraction in (0.5, 0.9, 0.99)]
+    if lead[0] is None:
+        print("\nLead time to done: no done tasks with creation times yet.")
+    else:
+        print("\nLead time to done: " + ", ".join(f"p{label} {format_duration(value)}"
+                                                  for label, value in zip((50, 90, 99), lead)))
+    print("\n")
+
+
+def main(argv=None):
+    """Main function.
+
+    Without arguments it runs the interactive prompt, otherwise one command
+    (tasker add "Buy milk", tasker list done) or a batch script
+    (tasker batch FILE|- [--every N]). Returns the exit status. --profile
+    (or TASKER_PROFILE=1) profiles every command, see profiled().
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    argv = list(argv)
+    profile = pop_flag(argv, "--profile") or PROFILE
+
+    if argv and argv[0] == "serve":
+        return run_server(argv[1:])
+    if argv and argv[0] == "watch":
+        return run_watch(argv[1:])
+    if argv and forwardable(argv):
+        # A running daemon answers from memory; without one we go on directly.
+        reply = send_command(socket_filename(filename), argv + ["--profile"] * profile)
+        if reply is not None:
+            sys.stdout.write(reply["output"])
+            sys.stderr.write(reply["stderr"])
+            if reply["error"] is not None:
+                raise SystemExit(reply["error"])
+            return 0
+
+    backend_class_for(filename).create(filename)
+
+    if argv and argv[0] == "batch":
+        every = pop_option(argv, "--every")
+        if every is not None and not (every.isdigit() and int(every) > 0):
+            crush_program("\"--every\" needs a positive number.")
+        if len(argv) != 2:
+            crush_program("Incorrect arguments for \"batch\" command.")
+        store = profiled("startup", filename, open_workspace, "exit", enabled=profile)
+        try:
+            if argv[1] == "-":
+                failed = run_batch(sys.stdin, store, every and int(every), profile)
+            else:
+                try:
+                    file = open(argv[1], 'r')
+                except OSError:
+                    crush_program(f"Can't read the batch file \"{argv[1]}\".")
+                with file:
+                    failed = run_batch(file, store, every and int(every), profile)
+        finally:
+            profiled("flush", filename, store.flush, enabled=profile)
+        return 1 if failed else 0
+
+    if argv:
+        # Loading and saving the list are part of a single command's profile.
+        profiled(argv[0].lower(), filename, run_single_command, argv, enabled=profile)
+        return 0
+
+    store = profiled("startup", filename, open_workspace, FLUSH_POLICY, enabled=profile)
+    try:
+        run_repl(store, profile)
+    finally:
+        profiled("flush", filename, store.flush, enabled=profile)
+    return 0
+
+
+def open_workspace(policy):
+    """The function opens the named lists of the catalog with the current one loaded."""
+    workspace = Workspace(policy=policy)
+    workspace.store()
+    return workspace
+
+
+def socket_filename(task_filename):
+    """The function returns the Unix socket of the daemon serving a task file."""
+    return SOCKET_FILE or os.path.abspath(task_filename) + ".sock"
+
+
+def forwardable(argv):
+    """The function tells whether a shell command can be sent to the daemon: batch scripts
+    and imports from stdin read the client's input and run directly."""
+    if argv[0] == "batch":
+        return False
+    return not (argv[0] in {"import", "import-json"} and "-" in argv[1:])
+
+
+def send_command(path, argv):
+    """The function runs argv in the daemon listening on path.
+
+    Returns its reply ({"output", "stderr", "error"}), or None if no daemon
+    is running there.
+    """
+    return send_request(path, {"argv": argv, "cwd": os.getcwd()})
+
+
+def run_remote_command(argv, cwd, store):
+    """The function runs one command sent by a client and returns the reply with its captured output.
+
+    Commands run one at a time on the event loop, so redirecting stdout
+    and changing to the client's directory can't mix up two clients.
+    """
+    output, errors = io.StringIO(), io.StringIO()
+    error = None
+    previous = os.getcwd()
+    try:
+        if cwd:
+            os.chdir(cwd)
+        with redirect_stdout(output), redirect_stderr(errors):
+            for parts in split_arguments(argv):
+                run_profiled_command(parts, store)
+    except SystemExit as exit:
+        error = None if exit.code in {None, 0} else str(exit.code)
+    except Exception as exception:
+        error = f"Error: {exception.__class__.__name__}: {exception}"
+        print(f"tasker serve: {argv!r} failed: {error}", file=sys.stderr)
+    finally:
+        os.chdir(previous)
+    return {"output": output.getvalue(), "stderr": errors.getvalue(), "error": error}
+
+
+async def serve_tasks(store, path, started=None):
+    """The function serves commands for store on the Unix socket path until a client sends
+    {"shutdown": true} or the process gets SIGINT/SIGTERM.
+
+    Each connection sends JSON lines {"argv": [...], "cwd": "..."} and gets one
+    JSON line reply per request. started, if given, is called once the
+    socket is listening.
+    """
+    import asyncio
+    import signal
+
+    stop = asyncio.Event()
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                argv = request.get("argv", []) if isinstance(request, dict) else None
+                if not (isinstance(argv, list) and all(isinstance(word, str) for word in argv)):
+                    request = {}
+                    reply = {"output": "", "stderr": "", "error": "Error: Bad request."}
+                elif request.get("shutdown"):
+                    reply = {"output": "", "stderr": "", "error": None}
+                else:
+                    reply = run_remote_command(argv, request.get("cwd"), store)
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+                if request.get("shutdown"):
+                    stop.set()
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            # A client gone away, or still connected when the daemon stops.
+            pass
+        finally:
+            writer.close()
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop.set)
+        except (NotImplementedError, RuntimeError, ValueError):
+            # Not the main thread (tests) or no signal support.
+            pass
+    # Long descriptions make long request lines.
+    server = await asyncio.start_unix_server(handle, path=path, limit=64 * 1024 * 1024)
+    try:
+        if started is not None:
+            started()
+        async with server:
+            await stop.wait()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_server(arguments):
+    """The function runs "tasker serve [--socket PATH] [--flush POLICY]" or stops a daemon with "--stop"."""
+    arguments = list(arguments)
+    path = pop_option(arguments, "--socket") or socket_filename(filename)
+    policy = pop_option(arguments, "--flush") or SERVE_FLUSH_POLICY
+    stop = pop_flag(arguments, "--stop")
+    if arguments:
+        crush_program("Incorrect arguments for \"serve\" command.")
+
+    if stop:
+        if send_request(path, {"shutdown": True}) is None:
+            crush_program("No tasker daemon is running.")
+        print("Daemon stopped.")
+        return 0
+    if send_request(path, {"argv": ["help"]}) is not None:
+        crush_program(f"A tasker daemon is already listening on \"{path}\".")
+    if os.path.exists(path):
+        os.remove(path)
+
+    import asyncio
+
+    store = open_workspace(policy)
+    try:
+        asyncio.run(serve_tasks(store, path, lambda: print(f"Serving {store.filename} on {path}.", flush=True)))
+    finally:
+        store.flush()
+    return 0
+
+
+def send_request(path, request):
+    """The function sends one request line to the daemon on path, returns its reply or None if none runs."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(path)
+            connection.sendall(json.dumps(request).encode() + b"\n")
+            with connection.makefile('rb') as replies:
+                line = replies.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Left behind by a daemon that didn't shut down cleanly.
+        return None
+    if not line:
+        crush_program("The tasker daemon closed the connection.")
+    return json.loads(line)
+
+
+class FileWatcher:
+    """Waits until one of a few files may have changed.
+
+    On Linux it asks inotify (through ctypes) about the directories of the
+    files, so waiting takes no CPU and a commit wakes it at once; a file
+    replaced by rename is still seen because the directory is watched, not
+    the old inode. Elsewhere, or if inotify refuses, it compares their
+    mtime and size every interval seconds.
+    """
+
+    # IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    MASK = 0x002 | 0x004 | 0x008 | 0x040 | 0x080 | 0x100 | 0x200
+    IN_Q_OVERFLOW = 0x4000
+    # wd, mask, cookie, name length; the name follows
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, paths, interval=WATCH_INTERVAL, inotify=True):
+        self.interval = interval
+        self.watch(paths)
+        self.fd = self._inotify() if inotify else None
+
+    def watch(self, paths):
+        """Switches to another set of files in the same directories (a new heap generation)."""
+        self.paths = list(paths)
+        self.names = {os.path.basename(path) for path in self.paths}
+        self.signature = file_signature(self.paths)
+
+    def _inotify(self):
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, TypeError, AttributeError):
+            return None
+        if fd < 0:
+            return None
+        for directory in {os.path.dirname(os.path.abspath(path)) for path in self.paths}:
+            if libc.inotify_add_watch(fd, os.fsencode(directory), self.MASK) < 0:
+                os.close(fd)
+                return None
+        return fd
+
+    def _events(self):
+        """Reads the queued inotify events, True if one of them is about the watched files."""
+        changed = False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                changed = changed or bool(mask & self.IN_Q_OVERFLOW) or name in self.names
+
+    def wait(self, timeout=None):
+        """Blocks until one of the files may have changed (True) or timeout seconds passed (False)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            remaining = None if deadline is None else max(0, deadline - time.monotonic())
+            if self.fd is None:
+                time.sleep(self.interval if remaining is None else min(self.interval, remaining))
+                signature = file_signature(self.paths)
+                if signature != self.signature:
+                    self.signature = signature
+                    return True
+            elif select.select([self.fd], [], [], remaining)[0] and self._events():
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class WatchScreen:
+    """The lines watch last drew on the terminal; draw() rewrites only those that differ."""
+
+    def __init__(self, file=None):
+        self.file = file or sys.stdout
+        self.lines = None
+
+    def draw(self, lines):
+        """Shows lines from the top left corner and returns how many of them were written."""
+        parts = []
+        before = self.lines
+        if before is None:
+            parts.append("\033[H\033[2J")
+            before = []
+        for number, line in enumerate(lines, 1):
+            if number > len(before) or before[number - 1] != line:
+                parts.append(f"\033[{number};1H{line}\033[K")
+        written = len(parts) - (self.lines is None)
+        if len(lines) < len(before):
+            parts.append(f"\033[{len(lines) + 1};1H\033[J")
+        self.lines = list(lines)
+        if parts:
+            # The cursor waits below the table.
+            parts.append(f"\033[{len(lines) + 1};1H")
+            self.file.write("".join(parts))
+            self.file.flush()
+        return written
+
+
+def watch_lines(store, filter="all", sort=None, limit=None, width_limit=None):
+    """The function returns the lines "watch" shows: a title and the rows of "list"
+    as render_tasks() draws them, with descriptions cut at width_limit columns."""
+    status = None if filter == "all" else filter
+    title = f"Watching {filter} tasks of {store.filename} (Ctrl-C quits)"
+    if store.is_empty():
+        return [title, "", "Nothing to display."]
+    rows = sorted_page(store, filter, sort or "id", limit)
+    width = max((display_width(task.description) for _, task in rows), default=0)
+    if width_limit is not None:
+        width = min(width, width_limit)
+    with redirect_stdout(io.StringIO()) as output:
+        render_tasks(rows, "table", width)
+    count = store.count(status) + (Archive(store).count() if status == "done" else 0)
+    return [f"{title}: {count}", ""] + output.getvalue().strip("\n").splitlines()
+
+
+def watch_tasks(store, filter="all", sort=None, limit=None, watcher=None, screen=None, stop=None):
+    """The function shows a list and redraws it whenever its task file changes, until
+    Ctrl-C or until the threading.Event stop is set.
+
+    It sleeps in FileWatcher.wait() between changes, then reads what
+    changed (TaskStore.refresh()) and has the WatchScreen rewrite only
+    the lines that differ. Without a terminal every change prints the
+    whole list instead.
+    """
+    watcher = watcher or FileWatcher(store.files())
+    terminal = screen is not None or sys.stdout.isatty()
+    screen = screen or WatchScreen()
+    if limit is None and terminal:
+        # Title, blank line, header and separator above the rows, the cursor below.
+        limit = max(1, shutil.get_terminal_size().lines - 5)
+    shown = None
+    try:
+        while stop is None or not stop.is_set():
+            lines = watch_lines(store, filter, sort, limit, table_width_limit() if terminal else None)
+            if terminal:
+                screen.draw(lines)
+            elif lines != shown:
+                print("\n".join(lines) + "\n", flush=True)
+            shown = lines
+            while not watcher.wait(None if stop is None else watcher.interval):
+                if stop is not None and stop.is_set():
+                    return
+            store.refresh(changed=True)
+            watcher.watch(store.files())
+    except KeyboardInterrupt:
+        print()
+    finally:
+        watcher.close()
+
+
+def run_watch(arguments):
+    """The function runs "tasker watch [all|done|in-progress|todo] [--sort S] [--limit N]
+    [--list NAME] [--interval MS]"."""
+    arguments = list(arguments)
+    limit = pop_option(arguments, "--limit")
+    sort = pop_option(arguments, "--sort")
+    name = pop_option(arguments, "--list")
+    interval = pop_option(arguments, "--interval")
+    if len(arguments) > 1:
+        crush_program("Incorrect arguments for \"watch\" command.")
+    if interval is not None and not (interval.isdigit() and int(interval) > 0):
+        crush_program("\"--interval\" needs a positive number of milliseconds.")
+    filter = parse_list_filter(arguments[0]) if arguments else "all"
+    sort = None if sort is None else parse_sort_option(sort)
+    limit = None if limit is None else parse_limit_option(limit)
+    store = Workspace(policy="exit").store(name)
+    watch_tasks(store, filter, sort, limit,
+                FileWatcher(store.files(), WATCH_INTERVAL if interval is None else int(interval) / 1000))
+    return 0
+
+
+def split_arguments(argv):
+    """The function splits shell arguments into commands at ";" arguments (tasker add x \\; list)."""
+    commands = [[]]
+    for argument in argv:
+        if argument == ";":
+            commands.append([])
+        else:
+            commands[-1].append(argument)
+    return [parts for parts in commands if parts]
+
+
+def run_single_command(argv):
+    """The function runs the command(s) given on the shell command line on the task files themselves,
+    each command opening the backend it needs (see Workspace)."""
+    store = Workspace(direct=True)
+    try:
+        for parts in split_arguments(argv):
+            run_command(parts, store)
+    finally:
+        store.flush()
+
+
+def run_profiled_command(parts, store, profile=None):
+    """The function runs one parsed command, profiled if profile (default PROFILE) or a --profile flag says so."""
+    parts = list(parts)
+    if pop_flag(parts, "--profile"):
+        profile = True
+    command = parts[0].lower() if parts else ""
+    profiled(command, store.filename, run_command, parts, store, enabled=profile)
+
+
+def run_batch(lines, store, every=None, profile=None):
+    """The function runs the commands of each line against one task store, returns the number of failed commands.
+
+    A line may hold several commands separated by ";". A failing command is
+    reported with its line number and the run goes on. Changes are flushed
+    every `every` commands if given, and at the end. Blank lines and lines
+    starting with "#" are skipped, "exit" ends the script.
+    """
+    commands = failed = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        for parts in parse_commands(line):
+            if len(parts) == 1 and parts[0].lower() in {"exit", "quit"}:
+                store.flush()
+                print(f"Batch done: {commands} commands, {failed} failed.")
+                return failed
+            try:
+                run_profiled_command(parts, store, profile)
+            except SystemExit as error:
+                failed += 1
+                print(f"Line {number}: {error}", file=sys.stderr)
+            commands += 1
+            if every and commands % every == 0:
+                store.flush()
+    store.flush()
+    print(f"Batch done: {commands} commands, {failed} failed.")
+    return failed
+
+
+def pop_option(parts, name):
+    """The function removes "name value" from the command parts and returns value, None if absent."""
+    if name not in parts:
+        return None
+    position = parts.index(name)
+    if position + 1 >= len(parts):
+        crush_program(f"\"{name}\" needs a value.")
+    value = parts[position + 1]
+    del parts[position:position + 2]
+    return value
+
+
+def pop_flag(parts, name):
+    """The function removes a flag from the command parts and returns whether it was there."""
+    if name not in parts:
+        return False
+    parts.remove(name)
+    return True
+
+
+def parse_date_option(value, end_of_day=False):
+    """The function converts a 'dd.mm.YYYY' or 'dd.mm.YYYY HH:MM:SS' option into epoch seconds.
+
+    A bare date means the start of that day, or its last second if end_of_day.
+    """
+    if value is None:
+        return None
+    timestamp = parse_timestamp(value)
+    if timestamp is None:
+        try:
+            day = datetime.strptime(value, '%d.%m.%Y')
+        except ValueError:
+            crush_program(f"Wrong date \"{value}\", use dd.mm.YYYY or \"dd.mm.YYYY HH:MM:SS\".")
+        timestamp = int(day.timestamp())
+        if end_of_day:
+            timestamp = int(day.replace(hour=23, minute=59, second=59).timestamp())
+    return timestamp
+
+
+def run_repl(store, profile=None):
+    """The function runs the interactive command loop against one task store."""
+    print("Welcome to \"Tasker\"! Type \"help\" to see available commands. Type \"exit\" to quit.\n")
+
+    while True:
+        try:
+            users_input = input("tasker>> ")
+        except (KeyboardInterrupt, EOFError):
+            print("\nExiting Tasker.")
+            break
+
+        for parts in parse_commands(users_input):
+            if len(parts) == 1 and parts[0].lower() in {"exit", "quit"}:
+                print("Goodbye!")
+                return
+            run_profiled_command(parts, store, profile)
+
+
+class CommandSpec:
+    """One command of the grammar, see register_command().
+
+    arguments are the kinds of its words, checked and converted by
+    ARGUMENT_KINDS: "kind?" is optional and "kind..." takes all remaining
+    words joined by spaces. options are the --options it accepts (see
+    OPTIONS and FLAGS) besides the GLOBAL_OPTIONS. run(store, *arguments, **options)
+    does the work; with workspace=True it gets the Workspace instead of
+    one list. across(store, *arguments, **options), if given, yields the
+    (id, task) rows the command shows for one list, which lets it run on
+    several lists at once (--list a,b or --list "*").
+    """
+
+    __slots__ = ("name", "run", "arguments", "options", "usage", "aliases", "workspace", "across")
+
+    def __init__(self, name, run, arguments=(), options=(), usage="", aliases=(), workspace=False, across=None):
+        self.name = name
+        self.run = run
+        self.arguments = [(kind.rstrip("?."), kind.endswith("?"), kind.rstrip("?").endswith("..."))
+                          for kind in arguments]
+        self.options = set(options)
+        self.usage = usage
+        self.aliases = aliases
+        self.workspace = workspace
+        self.across = across
+
+    def bind(self, parts):
+        """Returns (arguments, options) for the words after the command name."""
+        words = []
+        options = {}
+        position = 0
+        while position < len(parts):
+            part = parts[position]
+            if part in FLAGS:
+                if part not in self.options:
+                    crush_program(f"\"{part}\" can't be used with \"{self.name}\" command.")
+                options[FLAGS[part]] = True
+                position += 1
+            elif part in OPTIONS:
+                if part not in self.options and part not in GLOBAL_OPTIONS:
+                    crush_program(f"\"{part}\" can't be used with \"{self.name}\" command.")
+                if position + 1 >= len(parts):
+                    crush_program(f"\"{part}\" needs a value.")
+                key, convert = OPTIONS[part]
+                options[key] = convert(parts[position + 1])
+                position += 2
+            else:
+                words.append(part)
+                position += 1
+
+        arguments = []
+        for kind, optional, rest in self.arguments:
+            if not words:
+                if optional:
+                    break
+                self.wrong_arguments()
+            if rest:
+                value, words = " ".join(words), []
+            else:
+                value = words.pop(0)
+            value = ARGUMENT_KINDS[kind](value)
+            if value is None:
+                self.wrong_arguments()
+            arguments.append(value)
+        if words:
+            self.wrong_arguments()
+        return arguments, options
+
+    def wrong_arguments(self):
+        crush_program(f"Incorrect arguments for \"{self.name}\" command.")
+
+
+# Command name or alias -> CommandSpec, in the order of the help text
+COMMANDS = {}
+
+
+def register_command(spec):
+    """The function adds a command (and its aliases) to the grammar."""
+    for name in (spec.name, *spec.aliases):
+        COMMANDS[name] = spec
+    return spec
+
+
+def parse_limit_option(value):
+    """The function converts the value of --limit."""
+    if not value.isdigit():
+        crush_program("\"--limit\" needs a number.")
+    return int(value)
+
+
+def parse_status_option(value):
+    """The function checks the value of --status."""
+    if value not in STATUS_COLORS:
+        crush_program("Unknown list filter.")
+    return value
+
+
+def parse_sort_option(value):
+    """The function checks the value of --sort."""
+    if value.lstrip("-") not in SORT_FIELDS:
+        crush_program("\"--sort\" needs one of id, created, updated, status, desc (-field sorts descending).")
+    return value
+
+
+# --option -> (keyword argument, converter of its value)
+OPTIONS = {
+    "--limit": ("limit", parse_limit_option),
+    "--since": ("since", parse_date_option),
+    "--until": ("until", lambda value: parse_date_option(value, end_of_day=True)),
+    "--updated-since": ("updated_since", parse_date_option),
+    "--status": ("status", parse_status_option),
+    "--format": ("format", str),
+    "--days": ("days", lambda value: int(value) if value.isdigit() else crush_program("Wrong number of days.")),
+    "--list": ("list", str),
+    "--sort": ("sort", parse_sort_option),
+    "--after": ("after", str),
+    "--where": ("where", parse_where_option),
+    "--created-before": ("created_before", lambda value: parse_date_option(value) - 1),
+}
+# --flag -> keyword argument set to True, for options without a value
+FLAGS = {
+    "--rebuild": "rebuild",
+    "--dry-run": "dry_run",
+}
+# Options every command accepts
+GLOBAL_OPTIONS = {"--list"}
+
+LIST_VIEWS = {
+    "all": show_full_list,
+    "done": show_done_list,
+    "in-progress": show_progress_list,
+    "todo": show_todo_list,
+}
+
+
+def parse_list_filter(value):
+    """The function checks the filter of "list"."""
+    if value not in LIST_VIEWS:
+        crush_program("Unknown list filter.")
+    return value
+
+
+# Argument kind -> converter, None rejects the word
+ARGUMENT_KINDS = {
+    "id": lambda value: value if value.isdigit() else None,
+    "text": lambda value: value or None,
+    "filter": parse_list_filter,
+    "count": lambda value: int(value) if value.isdigit() else None,
+    "ids": parse_id_ranges,
+    "stats": lambda value: value if value == "profile" else None,
+    "name": lambda value: value if LIST_NAME.fullmatch(value) else None,
+}
+
+
+def run_list(store, filter="all", limit=None, since=None, until=None, updated_since=None, sort=None, after=None,
+             format="table"):
+    check_format(format)
+    # Reading the rows is timed as "load" inside, the rest is rendering.
+    with profile_phase("render"):
+        if sort is not None or after is not None:
+            show_sorted_list(store, filter, sort, limit, after, since, until, updated_since, format)
+        else:
+            LIST_VIEWS[filter](store, limit, since, until, updated_since, format)
+
+
+def run_search(store, query="", status=None, limit=None, format="table"):
+    check_format(format)
+    with profile_phase("render"):
+        show_search_results(query, store, status, limit, format)
+
+
+def list_rows(store, filter="all", limit=None, since=None, until=None, updated_since=None, sort=None, after=None,
+              format=None):
+    """The function yields the (id, task) rows "list" shows for one list."""
+    if sort is not None or after is not None:
+        crush_program("\"--sort\" and \"--after\" work on one list at a time.")
+    status = None if filter == "all" else filter
+    rows = store.find(status, since, until, updated_since)
+    if status == "done":
+        rows = with_archived(rows, Archive(store).find(since, until, updated_since))
+    return rows
+
+
+def search_rows(store, query="", status=None, limit=None, format=None):
+    """The function yields the (id, task) rows "search" shows for one list."""
+    groups = parse_query(query)
+    if not groups:
+        crush_program("Nothing to search for.")
+    return with_archived(store.search(groups, status), Archive(store).search(groups, status))
+
+
+def run_change(store, ids=None, action="done", where=None, since=None, until=None, updated_since=None,
+               created_before=None, dry_run=False):
+    name = "delete" if action == "delete" else f"mark-{action}"
+    # --created-before and --until both end the creation period, the earlier one wins.
+    if created_before is not None:
+        until = created_before if until is None else min(until, created_before)
+    filtered = (where, since, until, updated_since) != (None, None, None, None)
+    if ids is None and not filtered:
+        crush_program(f"Incorrect arguments for \"{name}\" command.")
+    # One plain ID keeps the one-task command and its errors.
+    if ids is not None and len(ids) == 1 and ids[0][0] == ids[0][1] and not filtered and not dry_run:
+        if action == "delete":
+            delete_task(str(ids[0][0]), store)
+        else:
+            update_status(str(ids[0][0]), action, store)
+        return
+    count = change_tasks(store, action, ids, where or (), since, until, updated_since, dry_run)
+    done = {"delete": "Deleted", "done": "Marked", "in-progress": "Marked"}[action]
+    would = {"delete": "Would delete", "done": "Would mark", "in-progress": "Would mark"}[action]
+    what = "" if action == "delete" else f" as {action}"
+    print(f"{would if dry_run else done} {count} task{'' if count == 1 else 's'}{what}.")
+
+
+def run_use(workspace, name):
+    if workspace.catalog.use(name):
+        print(f"Created list \"{name}\".")
+    print(f"Using list \"{name}\".")
+
+
+def run_lists(workspace):
+    current = workspace.catalog.current()
+    names = workspace.catalog.names()
+    width = max(len(name) for name in names)
+    for name in names:
+        path = workspace.catalog.path_of(name)
+        loaded = " (loaded)" if path in workspace.cache.stores else ""
+        print(f"{'*' if name == current else ' '} {name:<{width}}  {os.path.relpath(path)}{loaded}")
+
+
+def run_stats(workspace, view=None, last=20, days=STATS_DAYS, rebuild=False, list=None):
+    path = workspace.filename if list is None else workspace.catalog.path_of(list)
+    if view == "profile":
+        show_profile_stats(metrics_filename(path), last)
+        return
+    # A list that is not loaded yet is only read if its saved stats are missing or outdated.
+    store = workspace.cache.stores.get(path)
+    if store is not None and not rebuild:
+        stats = store.stats()
+    else:
+        stats = None if rebuild else read_stats(path)
+        if stats is None:
+            if store is not None:
+                store.flush()
+            with open_backend(path) as backend:
+                backend.reset_stats(backend.tasks())
+                stats = backend.task_stats
+            if store is not None:
+                store.task_stats = None
+    with profile_phase("render"):
+        show_task_stats(stats, Archive(path).stats(rebuild), days)
+
+
+@contextmanager
+def whole_file(store, reload=True):
+    """The function gives commands that work on a whole task file its path: a TaskStore writes
+    its unsaved changes first and, if reload, reads the file again afterwards."""
+    if isinstance(store, TaskStore):
+        store.flush()
+    yield store_filename(store)
+    if reload and isinstance(store, TaskStore):
+        store.reload()
+
+
+def run_import_json(store, path):
+    if backend_class_for(store_filename(store)) is JsonBackend:
+        crush_program("\"import-json\" needs journal or SQLite storage (TASKER_FILE=*.journal|*.db).")
+    with whole_file(store) as filename:
+        count = import_json(path, filename)
+    print(f"Imported {count} tasks.")
+
+
+def run_convert(store, path):
+    if os.path.abspath(path) == os.path.abspath(store_filename(store)):
+        crush_program("A task file can't be converted into itself.")
+    with whole_file(store, reload=False) as filename:
+        count = convert_tasks(filename, path)
+    print(f"Converted {count} tasks into \"{path}\".")
+
+
+def run_import(store, path, format=None):
+    with whole_file(store) as filename:
+        count = import_tasks(path, filename, format)
+    print(f"Imported {count} tasks.")
+
+
+def run_export(store, path, format=None, status=None):
+    with whole_file(store, reload=False) as filename:
+        count = export_tasks(filename, path, format, status)
+    if path != "-":
+        print(f"Exported {count} tasks.")
+
+
+def run_archive(store, days=ARCHIVE_DAYS):
+    with whole_file(store) as filename:
+        count = archive_tasks(filename, days)
+    print(f"Archived {count} tasks.")
+
+
+TIME_OPTIONS = ("--limit", "--since", "--until", "--updated-since")
+# Options of the bulk forms of mark-done, mark-in-progress and delete
+CHANGE_OPTIONS = ("--where", "--created-before", "--since", "--until", "--updated-since", "--dry-run")
+CHANGE_USAGE = "{name} <id>|<ids> [--where COND] [--created-before dd.mm.YYYY] [--dry-run]"
+for spec in [
+    CommandSpec("add", lambda store, text: add_task(text, store), ["text..."], usage='add "task description"'),
+    CommandSpec("delete", lambda store, ids=None, **options: run_change(store, ids, "delete", **options), ["ids?"],
+                CHANGE_OPTIONS, usage=CHANGE_USAGE.format(name="delete")),
+    CommandSpec("update", lambda store, id, text: update_task(id, text, store), ["id", "text..."],
+                usage='update <id> "new task description"'),
+    CommandSpec("mark-in-progress", lambda store, ids=None, **options: run_change(store, ids, "in-progress", **options),
+                ["ids?"], CHANGE_OPTIONS,
+                usage=CHANGE_USAGE.format(name="mark-in-progress")),
+    CommandSpec("mark-done", lambda store, ids=None, **options: run_change(store, ids, "done", **options),
+                ["ids?"], CHANGE_OPTIONS, usage=CHANGE_USAGE.format(name="mark-done")),
+    CommandSpec("list", run_list, ["filter?"], TIME_OPTIONS + ("--sort", "--after", "--format"), across=list_rows,
+                usage="list [all|done|in-progress|todo] [--limit N]\n"
+                      "   [--since dd.mm.YYYY] [--until dd.mm.YYYY] [--updated-since dd.mm.YYYY]\n"
+                      "   [--sort [-]id|created|updated|status|desc] [--after CURSOR] (next page)\n"
+                      "   [--format table|plain|json|ndjson|csv|tsv]"),
+    CommandSpec("renumber", lambda store: renumber_tasks(store), aliases=["compact-ids"],
+                usage="renumber (alias: compact-ids)"),
+    CommandSpec("import-json", run_import_json, ["text"], usage='import-json "tasks.json" (journal and SQLite storage)'),
+    CommandSpec("convert", run_convert, ["text"],
+                usage='convert "tasks.tbin" (copies the list into the storage format of that file)'),
+    CommandSpec("search", run_search, ["text...?"], ["--status", "--limit", "--format"], across=search_rows,
+                usage="search word [word ...] [OR word ...] [--status done|in-progress|todo] [--limit N]\n"
+                      "   [--format table|plain|json|ndjson|csv|tsv]\n"
+                      "   (word* matches by prefix)"),
+    CommandSpec("import", run_import, ["text"], ["--format"],
+                usage='import "tasks.csv|tasks.ndjson" [--format csv|ndjson] (adds them as new tasks)'),
+    CommandSpec("export", run_export, ["text"], ["--format", "--status"],
+                usage='export "tasks.csv|tasks.ndjson" [--format csv|ndjson] [--status done|in-progress|todo]'),
+    CommandSpec("show", lambda store, id: show_task(id, store), ["id"], usage="show <id> (the whole description)"),
+    CommandSpec("archive", run_archive, options=["--days"],
+                usage=f"archive [--days N] (moves tasks done over N days ago, default {ARCHIVE_DAYS}, to the archive)"),
+    CommandSpec("stats", run_stats, ["stats?", "count?"], ["--days", "--rebuild", "--list"], workspace=True,
+                usage=f"stats [--days N] [--rebuild] (task counts, tasks created and done per day over the "
+                      f"last N days, default {STATS_DAYS}, and lead times)\n"
+                      f"stats profile [N] (averages of the last N profiled commands)"),
+    CommandSpec("use", run_use, ["name"], workspace=True,
+                usage="use <list> (switches to a named list, creating it if new)"),
+    CommandSpec("lists", run_lists, workspace=True, usage="lists (the named lists, * marks the one in use)"),
+    CommandSpec("help", lambda store: show_help(), usage="help"),
+]:
+    register_command(spec)
+
+
+def show_help():
+    """The function prints the list of available commands."""
+    specs = list(dict.fromkeys(COMMANDS.values()))
+    lines = ["Available commands:"]
+    for number, spec in enumerate(specs, 1):
+        first, *more = spec.usage.splitlines()
+        lines.append(f"                    {number}. {first}")
+        lines.extend(f"                    {line}" for line in more)
+    lines.append(f"                    {len(specs) + 1}. exit / quit")
+    print("\n".join(lines))
+    print("""                Every command also runs from the shell (tasker list done), and
+                tasker batch FILE|- [--every N] runs one command per line.
+                Separate several commands on one line with ";" (\\; and quotes keep it literal).
+                mark-done, mark-in-progress and delete take ID ranges and lists (10-500,730) and
+                --where conditions (status=todo, status!=done, desc=TEXT, desc~TEXT, joined with "and");
+                all matching tasks change in one pass and one save, --dry-run only counts them.
+                --list NAME runs a command on another named list; list and search also take
+                --list a,b or --list "*" (every list).
+                Add --profile (or set TASKER_PROFILE=1) to time each command's phases.
+                tasker serve keeps the list in memory for shell commands (tasker serve --stop ends it).
+                tasker watch [all|done|in-progress|todo] [--sort S] [--limit N] [--list NAME] shows a list
+                and redraws the rows that change whenever the task file is written.
+                """)
+
+
+def run_command(parts, store):
+    """The function runs one parsed command, as declared in COMMANDS, against a task store
+    or the list(s) of a Workspace picked by --list."""
+    spec = COMMANDS.get(parts[0].lower()) if parts else None
+    if spec is None:
+        crush_program("Wrong command. Please, try again.")
+    arguments, options = spec.bind(parts[1:])
+    names = options.pop("list", None)
+    if not isinstance(store, Workspace):
+        if spec.workspace or names is not None:
+            crush_program(f"\"{spec.name}\" needs named lists here.")
+        spec.run(store, *arguments, **options)
+    elif spec.workspace:
+        if names is not None and "--list" in spec.options:
+            options["list"] = names
+        spec.run(store, *arguments, **options)
+    elif names is not None and (names == "*" or "," in names):
+        if spec.across is None:
+            crush_program(f"\"{spec.name}\" runs on one list at a time.")
+        format = check_format(options.get("format", "table"))
+
+        def rows():
+            for name, list_store in store.stores(names):
+                with open_backend(list_store) as backend:
+                    if not backend.is_empty():
+                        for id, task in spec.across(backend, *arguments, **options):
+                            yield name, id, task
+
+        with profile_phase("render"):
+            show_lists_rows(rows(), options.get("limit"), format, store.catalog.path_of)
+    else:
+        spec.run(store.store(names), *arguments, **options)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
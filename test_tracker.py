@@ -11,8 +11,9 @@ def setup_function():
         json.dump({}, file)
 
 def teardown_function():
-    if os.path.exists(TEST_FILENAME):
-        os.remove(TEST_FILENAME)
+    for path in (TEST_FILENAME, TEST_FILENAME + ".meta", TEST_FILENAME + ".lock", TEST_FILENAME + ".stats"):
+        if os.path.exists(path):
+            os.remove(path)
 
 def test_add_task():
     add_task("Buy milk", filename=TEST_FILENAME)
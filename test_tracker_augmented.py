@@ -1,12 +1,24 @@
+import io
 import json
 import os
+import sqlite3
+import time
 import pytest
 from datetime import datetime
 from task_manager import (
     get_colored_status, check_file, crush_program, parse_input,
     add_task, delete_task, update_task, update_status,
     show_full_list, show_done_list, show_progress_list, show_todo_list, main,
-    STATUS_COLORS, COLOR_RESET
+    STATUS_COLORS, COLOR_RESET, Journal, load_tasks, import_json,
+    open_backend, SqliteBackend, JsonBackend, renumber_tasks, TaskStore,
+    StatusIndex, JsonObjectReader, read_json_header, scan_tasks, Task, parse_timestamp,
+    format_timestamp, TimeIndex, parse_date_option, SearchIndex, parse_query, run_batch,
+    import_tasks, export_tasks, BlobStore, BLOB_THRESHOLD, show_task, Profile, profiled,
+    profile_phase, read_metrics, serve_tasks, send_request, socket_filename, parse_commands,
+    run_command, register_command, CommandSpec, COMMANDS, Archive, archive_tasks, show_search_results,
+    BinaryBackend, convert_tasks, Workspace, Catalog, StoreCache, sorted_page,
+    render_tasks, display_width, fit_text, FileWatcher, WatchScreen, watch_tasks, watch_lines,
+    TaskStats, read_stats, stats_filename, show_task_stats, parse_id_ranges, parse_where_option, change_tasks
 )
 
 TEST_FILENAME = "test_user_tasks.json"
@@ -16,8 +28,9 @@ def setup_function():
         json.dump({}, file)
 
 def teardown_function():
-    if os.path.exists(TEST_FILENAME):
-        os.remove(TEST_FILENAME)
+    for path in (TEST_FILENAME, TEST_FILENAME + ".meta", TEST_FILENAME + ".lock", TEST_FILENAME + ".stats"):
+        if os.path.exists(path):
+            os.remove(path)
 
 def test_add_task():
     add_task("Buy milk", filename=TEST_FILENAME)
@@ -242,6 +255,7 @@ def run_main_with_inputs(monkeypatch, inputs):
         return next(it)
 
     monkeypatch.setattr("builtins.input", fake_input)
+    monkeypatch.setattr("sys.argv", ["tasker"])
     main()
 
 
@@ -345,9 +359,2111 @@ def test_main_keyboard_interrupt(monkeypatch, capsys, tmp_path):
     def fake_input(_):
         raise KeyboardInterrupt
     monkeypatch.setattr("builtins.input", fake_input)
+    monkeypatch.setattr("sys.argv", ["tasker"])
 
     # Executa main() — não deve levantar exceção
     main()
 
     captured = capsys.readouterr()
-    assert "Exiting Tasker." in captured.out
\ No newline at end of file
+    assert "Exiting Tasker." in captured.out
+
+# ---------- TESTES DE JOURNAL ----------
+
+def test_journal_appends_instead_of_rewriting(tmp_path):
+    file = tmp_path / "tasks.journal"
+    add_task("Task1", file)
+    add_task("Task2", file)
+    update_status("1", "done", file)
+    records = [json.loads(line) for line in file.read_text().splitlines()]
+    assert [r["op"] for r in records] == ["put", "put", "put"]
+    assert records[-1]["task"][1] == "done"
+    assert load_tasks(file)["1"][1] == "done"
+
+
+def test_journal_delete_keeps_ids(tmp_path):
+    file = tmp_path / "tasks.journal"
+    for name in ["Task1", "Task2", "Task3"]:
+        add_task(name, file)
+    delete_task("3", file)
+    add_task("Task4", file)
+    tasks = load_tasks(file)
+    assert {id: task[0] for id, task in tasks.items()} == {"1": "Task1", "2": "Task2", "4": "Task4"}
+
+
+def test_journal_empty_file_crushes(tmp_path):
+    file = tmp_path / "tasks.journal"
+    file.write_text("")
+    with pytest.raises(SystemExit, match="to-do list is empty"):
+        delete_task("1", file)
+
+
+def test_journal_compaction_folds_log_into_snapshot(tmp_path):
+    file = tmp_path / "tasks.journal"
+    journal = Journal(file, max_records=3)
+    journal.load()
+    for i in range(1, 5):
+        journal.append("put", i, Task(f"Task{i}", "todo", 1746546788))
+    journal.wait()
+    snapshot = json.loads((tmp_path / "tasks.journal.snapshot").read_text())
+    assert len(snapshot["tasks"]) >= 3
+    assert len(Journal(file).load()) == 4
+
+
+def test_journal_ignores_torn_last_line(tmp_path):
+    file = tmp_path / "tasks.journal"
+    add_task("Task1", file)
+    with file.open("a") as f:
+        f.write('{"seq": 2, "op": "put"')
+    assert len(load_tasks(file)) == 1
+    add_task("Task2", file)
+    assert len(load_tasks(file)) == 2
+
+
+def test_import_json_journal(tmp_path):
+    source = tmp_path / "tasks.json"
+    json.dump({"1": ["Task1", "todo", "2025", "N/A"]}, source.open("w"))
+    file = tmp_path / "tasks.journal"
+    assert import_json(source, file) == 1
+    add_task("Task2", file)
+    tasks = load_tasks(file)
+    assert tasks["1"][0] == "Task1"
+    assert tasks["2"][0] == "Task2"
+
+
+# ---------- TESTES DE BACKENDS ----------
+
+def test_open_backend_by_suffix(tmp_path):
+    json_file = tmp_path / "tasks.json"
+    json_file.write_text("")
+    with open_backend(json_file) as backend:
+        assert isinstance(backend, JsonBackend)
+    with open_backend(tmp_path / "tasks.db") as backend:
+        assert isinstance(backend, SqliteBackend)
+
+
+def test_sqlite_backend_commands(tmp_path, capsys):
+    file = tmp_path / "tasks.db"
+    add_task("Task1", file)
+    add_task("Task2", file)
+    update_task("2", "Task2 updated", file)
+    update_status("1", "done", file)
+    show_done_list(file)
+    captured = capsys.readouterr()
+    assert "Task1" in captured.out
+    assert "Task2" not in captured.out
+    assert load_tasks(file)["2"][0] == "Task2 updated"
+
+
+def test_sqlite_backend_delete_keeps_ids(tmp_path):
+    file = tmp_path / "tasks.db"
+    for name in ["Task1", "Task2", "Task3"]:
+        add_task(name, file)
+    delete_task("1", file)
+    delete_task("3", file)
+    add_task("Task4", file)
+    tasks = load_tasks(file)
+    assert {id: task[0] for id, task in tasks.items()} == {"2": "Task2", "4": "Task4"}
+
+
+def test_sqlite_backend_empty_and_missing(tmp_path):
+    file = tmp_path / "tasks.db"
+    with pytest.raises(SystemExit, match="to-do list is empty"):
+        update_status("1", "done", file)
+    add_task("Task1", file)
+    with pytest.raises(SystemExit, match="not on the to-do list"):
+        update_status("abc", "done", file)
+
+
+def test_import_json_sqlite(tmp_path):
+    source = tmp_path / "tasks.json"
+    json.dump({"1": ["Task1", "done", "06.05.2025 18:53:08", "N/A"],
+               "2": ["Task2", "todo", "2025", "N/A"]}, source.open("w"))
+    file = tmp_path / "tasks.db"
+    assert import_json(source, file) == 2
+    assert load_tasks(file) == json.load(source.open())
+
+
+# ---------- TESTES DE IDS ESTAVEIS ----------
+
+def test_delete_keeps_later_ids(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    for name in ["Task1", "Task2", "Task3"]:
+        add_task(name, file)
+    delete_task("1", file)
+    data = json.load(file.open())
+    assert data == {"2": data["2"], "3": data["3"]}
+    assert data["3"][0] == "Task3"
+
+
+def test_deleted_top_id_is_not_reused(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    add_task("Task1", file)
+    add_task("Task2", file)
+    delete_task("2", file)
+    add_task("Task3", file)
+    data = json.load(file.open())
+    assert sorted(data) == ["1", "3"]
+
+
+def test_legacy_file_without_header(tmp_path):
+    file = tmp_path / "tasks.json"
+    json.dump({"1": ["Task1", "todo", "2025", "N/A"], "5": ["Task5", "todo", "2025", "N/A"]}, file.open("w"))
+    add_task("Task6", file)
+    assert json.load(file.open())["6"][0] == "Task6"
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_renumber_tasks(tmp_path, name):
+    file = tmp_path / name
+    file.write_text("")
+    for task in ["Task1", "Task2", "Task3"]:
+        add_task(task, file)
+    delete_task("2", file)
+    renumber_tasks(file)
+    tasks = load_tasks(file)
+    assert {id: task[0] for id, task in tasks.items()} == {"1": "Task1", "2": "Task3"}
+    add_task("Task4", file)
+    assert load_tasks(file)["3"][0] == "Task4"
+
+
+# ---------- TESTES DE TASKSTORE ----------
+
+def test_task_store_serves_from_memory_until_flush(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    store = TaskStore(file, "exit")
+    add_task("Task1", store)
+    add_task("Task2", store)
+    update_status("1", "done", store)
+    assert file.read_text() == ""
+    assert store.get("1").status == "done"
+    store.flush()
+    assert json.load(file.open())["1"][1] == "done"
+
+
+def test_task_store_flushes_every_n_ops(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    store = TaskStore(file, "ops:2")
+    add_task("Task1", store)
+    assert file.read_text() == ""
+    add_task("Task2", store)
+    assert len(json.load(file.open())) == 2
+
+
+def test_task_store_flushes_after_timeout(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    store = TaskStore(file, "ms:10")
+    add_task("Task1", store)
+    store.timer.join()
+    assert len(json.load(file.open())) == 1
+
+
+def test_task_store_reloads_outside_changes(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    store = TaskStore(file, "exit")
+    add_task("Task1", store)
+    json.dump({"7": ["Outside", "todo", "2025", "N/A"]}, file.open("w"))
+    add_task("Task2", store)
+    tasks = dict(store.tasks())
+    assert tasks["7"].description == "Outside"
+    assert tasks["1"].description == "Task1"
+    assert tasks["8"].description == "Task2"
+
+
+def test_task_store_keeps_deleted_top_id_reserved(tmp_path):
+    file = tmp_path / "tasks.db"
+    store = TaskStore(file, "exit")
+    add_task("Task1", store)
+    add_task("Task2", store)
+    delete_task("2", store)
+    store.flush()
+    add_task("Task3", file)
+    assert sorted(load_tasks(file)) == ["1", "3"]
+
+
+def test_task_store_unknown_policy(tmp_path):
+    with pytest.raises(SystemExit, match="Unknown flush policy"):
+        TaskStore(tmp_path / "tasks.json", "sometimes")
+
+
+def test_main_flushes_on_exit(monkeypatch, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("task_manager.FLUSH_POLICY", "exit")
+
+    run_main_with_inputs(monkeypatch, ['add "Task1"', 'add "Task2"', 'exit'])
+    assert len(json.load(file.open())) == 2
+
+
+def test_main_flushes_before_crush(monkeypatch, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("task_manager.FLUSH_POLICY", "exit")
+
+    with pytest.raises(SystemExit):
+        run_main_with_inputs(monkeypatch, ['add "Task1"', 'delete 5'])
+    assert len(json.load(file.open())) == 1
+
+
+# ---------- TESTES DE INDICE POR STATUS ----------
+
+def test_status_index_updates_incrementally():
+    index = StatusIndex.build({"1": Task("Short", "todo", 0), "2": Task("Much longer", "done", 0)})
+    assert index.ids("todo") == ["1"]
+    assert index.max_width("todo") == 5
+    index.remove("2")
+    index.add("2", Task("Much longer", "todo", 0))
+    assert index.ids("todo") == ["1", "2"]
+    assert index.count("done") == 0
+    assert index.max_width("todo") == 11
+
+
+def test_json_meta_keeps_only_widths(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    add_task("Task1", file)
+    add_task("Task2 longer", file)
+    update_status("2", "done", file)
+    meta = json.loads((tmp_path / "tasks.json.meta").read_text())
+    assert sorted(meta) == ["next_id", "signature", "version", "widths"]
+    assert meta["widths"] == {"todo": 12, "done": 12}
+    with open_backend(file) as backend:
+        assert backend.index is None and backend.times is None
+        assert backend.count("todo") == 1 and backend.max_description_len("todo") == 5
+        backend.put("1", Task("Task1", "todo", 0))
+    # A commit with the status index measures the widths again.
+    assert json.loads((tmp_path / "tasks.json.meta").read_text())["widths"] == {"todo": 5, "done": 12}
+
+
+def test_status_index_rebuilt_after_outside_change(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    add_task("Task1", file)
+    json.dump({"1": ["Task1", "done", "2025", "N/A"], "2": ["Task2", "done", "2025", "N/A"]}, file.open("w"))
+    backend = open_backend(file)
+    assert backend.count("done") == 2
+    assert backend.count("todo") == 0
+
+
+def test_filtered_list_width_ignores_other_statuses(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    json.dump({"1": ["A very very long todo description", "todo", "2025", "N/A"],
+               "2": ["Done", "done", "2025", "N/A"]}, file.open("w"))
+    show_done_list(file)
+    captured = capsys.readouterr()
+    assert "2   | Done | " in captured.out
+
+
+@pytest.mark.parametrize("name", ["tasks.journal", "tasks.db"])
+def test_filtered_lists_other_backends(capsys, tmp_path, name):
+    file = tmp_path / name
+    add_task("A long description here", file)
+    add_task("Done", file)
+    update_status("2", "done", file)
+    show_done_list(file)
+    captured = capsys.readouterr()
+    assert "2   | Done | " in captured.out
+    assert "long" not in captured.out
+
+
+# ---------- TESTES DE LISTAGEM EM STREAMING ----------
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1 << 16])
+def test_json_object_reader_chunks(tmp_path, chunk_size):
+    data = {"1": ['Say "hi" {x}', "todo", "2025", "N/A"], "22": ["Task, with: comma", "done", "2025", "N/A"],
+            "next_id": 12345}
+    file = tmp_path / "tasks.json"
+    file.write_text(json.dumps(data, indent=2))
+    with file.open() as f:
+        assert dict(JsonObjectReader(f, chunk_size)) == data
+
+
+@pytest.mark.parametrize("text", ["", "   ", "[1, 2]", '{"1": ['])
+def test_json_object_reader_invalid(tmp_path, text):
+    file = tmp_path / "tasks.json"
+    file.write_text(text)
+    with pytest.raises(ValueError):
+        with file.open() as f:
+            list(JsonObjectReader(f))
+
+
+def test_read_json_header_stops_before_index(tmp_path):
+    file = tmp_path / "tasks.json.meta"
+    file.write_text('{"next_id": 3, "widths": {"todo": 5}, "index": {"todo": {"1": ')
+    assert read_json_header(file) == {"next_id": 3, "widths": {"todo": 5}}
+
+
+def test_scan_uses_stored_widths(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    add_task("Short", file)
+    add_task("A longer one", file)
+    update_status("1", "done", file)
+    width, rows = scan_tasks(file, "done")
+    assert width == 5
+    assert [(id, task.to_list()) for id, task in rows] == [("1", load_tasks(file)["1"])]
+
+
+@pytest.mark.parametrize("limit, stream_bytes, streamed", [
+    (None, 0, False), (2, 10 ** 6, False), (2, 0, True),
+])
+def test_scan_streams_only_when_a_limit_can_stop_early(monkeypatch, tmp_path, limit, stream_bytes, streamed):
+    file = tmp_path / "tasks.json"
+    json.dump({str(i): [f"Task{i}", "done" if i % 2 else "todo", "2025", "N/A"] for i in range(1, 6)}, file.open("w"))
+    monkeypatch.setattr("task_manager.JSON_STREAM_BYTES", stream_bytes)
+    used = []
+    stream, read = JsonBackend.stream, JsonBackend.read
+    monkeypatch.setattr(JsonBackend, "stream", staticmethod(lambda *args: used.append("stream") or stream(*args)))
+    monkeypatch.setattr(JsonBackend, "read", staticmethod(lambda *args: used.append("read") or read(*args)))
+    width, rows = scan_tasks(file, "done", limit)
+    assert [id for id, _ in rows] == ["1", "3", "5"][:limit]
+    assert used[-1] == ("stream" if streamed else "read")
+
+
+def test_show_list_limit(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    json.dump({str(i): [f"Task{i}", "todo", "2025", "N/A"] for i in range(1, 6)}, file.open("w"))
+    show_todo_list(file, limit=2)
+    captured = capsys.readouterr()
+    assert "Task1" in captured.out
+    assert "Task2" in captured.out
+    assert "Task3" not in captured.out
+
+
+def test_main_list_limit(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("task_manager.filename", str(file))
+
+    run_main_with_inputs(monkeypatch, ['add "Task1"', 'add "Task2"', 'list --limit 1', 'list todo --limit 1', 'exit'])
+    captured = capsys.readouterr()
+    assert "Task1" in captured.out
+    assert "Task2" not in captured.out
+
+
+def test_main_list_limit_streams_the_json_file(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    json.dump({str(i): [f"Task{i}", "todo", "2025", "N/A"] for i in range(1, 6)}, file.open("w"))
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("task_manager.CATALOG_FILE", str(tmp_path / "lists.json"))
+    monkeypatch.setattr("task_manager.JSON_STREAM_BYTES", 0)
+    store = TaskStore(str(file))
+    monkeypatch.setattr("json.load", lambda *args, **kwargs: pytest.fail("the whole file was decoded"))
+
+    main(["list", "--limit", "2"])
+    # A store without unsaved changes reads the page from the file, not from memory.
+    store.tasks_dict = {}
+    run_command(["list", "todo", "--limit", "3"], store)
+    out = capsys.readouterr().out
+    assert out.count("Task1") == 2 and out.count("Task3") == 1
+    assert "Task4" not in out
+
+
+# ---------- TESTES DE TASK ----------
+
+def test_task_from_legacy_list_roundtrip():
+    values = ["Buy milk", "todo", "06.05.2025 18:53:08", "N/A"]
+    task = Task.from_list(values)
+    assert isinstance(task.created, int)
+    assert task.updated is None
+    assert task.to_list() == values
+    assert Task.from_list(task.to_row()) == task
+
+
+def test_task_keeps_unparsable_legacy_timestamps():
+    task = Task.from_list(["Task1", "todo", "2025", "yesterday"])
+    assert task.to_list() == ["Task1", "todo", "2025", "yesterday"]
+
+
+def test_task_statuses_are_interned():
+    first = Task("a", "".join(["in-", "progress"]), 0)
+    second = Task("b", "".join(["in-pro", "gress"]), 0)
+    assert first.status is second.status
+
+
+@pytest.mark.parametrize("value", ["06.05.2025 18:53:08", "31.12.2024 23:59:59", "01.01.2025 00:00:00"])
+def test_parse_timestamp_matches_strptime(value):
+    expected = int(datetime.strptime(value, "%d.%m.%Y %H:%M:%S").timestamp())
+    assert parse_timestamp(value) == expected
+    assert format_timestamp(parse_timestamp(value)) == value
+
+
+@pytest.mark.parametrize("value", ["2025", "06.05.2025 18:61:08", "06.05.2025 18:53:xx", None, 5])
+def test_parse_timestamp_invalid(value):
+    assert parse_timestamp(value) is None
+
+
+# ---------- TESTES DE INDICE DE TEMPO ----------
+
+DAY = 24 * 60 * 60
+
+
+def dated_tasks():
+    base = parse_timestamp("01.09.2025 12:00:00")
+    return {
+        "1": Task("Old", "done", base, base + 9 * DAY),
+        "2": Task("Middle", "todo", base + 3 * DAY),
+        "3": Task("New", "todo", base + 6 * DAY, base + 7 * DAY),
+        "4": Task("Legacy", "todo", "2025"),
+    }
+
+
+def test_time_index_range_queries():
+    times = TimeIndex.build(dated_tasks())
+    base = parse_timestamp("01.09.2025 12:00:00")
+    assert times.ids_between("created", base + DAY, base + 6 * DAY) == ["2", "3"]
+    assert times.ids_between("created", None, base) == ["1"]
+    assert times.ids_between("updated", base + 8 * DAY) == ["1"]
+    times.remove("3", dated_tasks()["3"])
+    times.add("3", Task("New", "todo", base - DAY))
+    assert times.ids_between("created", None, base) == ["3", "1"]
+
+
+def test_time_index_same_timestamp():
+    tasks = {str(id): Task(f"Task{id}", "todo", 100) for id in range(1, 13)}
+    times = TimeIndex.build(tasks)
+    assert times.ids_between("created", 100, 100) == [str(id) for id in range(1, 13)]
+    times.remove("10", tasks["10"])
+    times.replace("2", tasks["2"], Task("Task2", "done", 100, 200))
+    times.add("10", Task("Task10", "todo", 100))
+    assert times.ids_between("created") == [str(id) for id in range(1, 13)]
+    assert times.ids_between("updated") == ["2"]
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_find_by_period(tmp_path, name):
+    file = tmp_path / name
+    file.write_text("")
+    with open_backend(file) as backend:
+        backend.replace_all(dated_tasks())
+    base = parse_timestamp("01.09.2025 12:00:00")
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.find(since=base + DAY)] == ["2", "3"]
+        assert [id for id, _ in backend.find("todo", until=base + 5 * DAY)] == ["2"]
+        assert [id for id, _ in backend.find(updated_since=base + DAY)] == ["1", "3"]
+        assert [id for id, _ in backend.find("done", since=base + DAY)] == []
+    store = TaskStore(file)
+    assert [id for id, _ in store.find(since=base + DAY, updated_since=base)] == ["3"]
+
+
+def test_sqlite_adds_updated_ts_to_old_files(tmp_path):
+    file = tmp_path / "tasks.db"
+    connection = sqlite3.connect(file)
+    connection.execute("CREATE TABLE tasks (id INTEGER PRIMARY KEY, description TEXT NOT NULL, status TEXT NOT NULL, "
+                       "created_at TEXT NOT NULL, updated_at TEXT NOT NULL, created_ts INTEGER)")
+    connection.execute("INSERT INTO tasks VALUES (1, 'Task1', 'todo', '06.05.2025 18:53:08', '07.05.2025 10:00:00', NULL)")
+    connection.commit()
+    connection.close()
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.find(updated_since=parse_date_option("07.05.2025"))] == ["1"]
+
+
+def test_parse_date_option():
+    assert parse_date_option("07.05.2025") == parse_timestamp("07.05.2025 00:00:00")
+    assert parse_date_option("07.05.2025", end_of_day=True) == parse_timestamp("07.05.2025 23:59:59")
+    with pytest.raises(SystemExit, match="Wrong date"):
+        parse_date_option("2025-05-07")
+
+
+def test_show_list_since(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    json.dump({"1": ["Old", "todo", "01.09.2025 12:00:00", "N/A"],
+               "2": ["New", "todo", "10.09.2025 12:00:00", "N/A"]}, file.open("w"))
+    show_todo_list(file, since=parse_date_option("05.09.2025"))
+    captured = capsys.readouterr()
+    assert "New" in captured.out
+    assert "Old" not in captured.out
+
+
+def test_main_list_until(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    json.dump({"1": ["Old", "todo", "01.09.2025 12:00:00", "N/A"],
+               "2": ["New", "todo", "10.09.2025 12:00:00", "N/A"]}, file.open("w"))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("task_manager.filename", str(file))
+
+    run_main_with_inputs(monkeypatch, ['list --until 01.09.2025', 'exit'])
+    captured = capsys.readouterr()
+    assert "Old" in captured.out
+    assert "New" not in captured.out
+
+
+# ---------- TESTES DE BUSCA ----------
+
+def search_tasks():
+    return {
+        "1": Task("Buy milk and bread", "todo", 1),
+        "2": Task("Bake bread", "done", 2),
+        "3": Task("Write report", "todo", 3),
+        "4": Task("Buy birthday present", "in-progress", 4),
+    }
+
+
+def test_parse_query():
+    assert parse_query("Milk bread") == [["milk", "bread"]]
+    assert parse_query("milk OR rep*") == [["milk"], ["rep*"]]
+    assert parse_query("e-mail OR") == [["e", "mail"]]
+    assert parse_query("  ") == []
+
+
+def test_search_index_and_or_prefix():
+    index = SearchIndex.build(search_tasks())
+    assert index.search(parse_query("bread")) == {"1", "2"}
+    assert index.search(parse_query("buy bread")) == {"1"}
+    assert index.search(parse_query("report OR present")) == {"3", "4"}
+    assert index.search(parse_query("b*")) == {"1", "2", "4"}
+    assert index.search(parse_query("bir* OR bak*")) == {"2", "4"}
+    assert index.search(parse_query("missing")) == set()
+
+
+def test_search_index_remove_drops_empty_words():
+    tasks = search_tasks()
+    index = SearchIndex.build(tasks)
+    index.remove("3", tasks["3"])
+    assert "report" not in index.postings
+    assert index.search(parse_query("rep*")) == set()
+    index.add("3", Task("Reply to Bob", "todo", 3))
+    assert index.search(parse_query("rep*")) == {"3"}
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_backend_search_follows_changes(tmp_path, name):
+    file = tmp_path / name
+    file.write_text("")
+    with open_backend(file) as backend:
+        backend.replace_all(search_tasks())
+    with open_backend(file) as backend:
+        backend.put("2", Task("Bake a cake", "done", 2))
+        backend.delete("4")
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.search(parse_query("bread"))] == ["1"]
+        assert [id for id, _ in backend.search(parse_query("b*"))] == ["1", "2"]
+        assert [id for id, _ in backend.search(parse_query("b*"), "done")] == ["2"]
+        assert [id for id, _ in backend.search(parse_query("cake OR report"))] == ["2", "3"]
+        assert list(backend.search(parse_query("present"))) == []
+    store = TaskStore(file)
+    assert [id for id, _ in store.search(parse_query("bread OR cake"), "todo")] == ["1"]
+
+
+def test_sqlite_adds_terms_to_old_files(tmp_path):
+    file = tmp_path / "tasks.db"
+    with open_backend(file) as backend:
+        backend.replace_all(search_tasks())
+    connection = sqlite3.connect(file)
+    connection.execute("DROP TABLE terms")
+    connection.commit()
+    connection.close()
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.search(parse_query("buy"))] == ["1", "4"]
+
+
+def test_json_meta_leaves_out_search_index(tmp_path):
+    file = tmp_path / "tasks.json"
+    with open_backend(file) as backend:
+        backend.replace_all(search_tasks())
+    header = json.loads((tmp_path / "tasks.json.meta").read_text())
+    assert "terms" not in header
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.search(parse_query("bread"))] == ["1", "2"]
+        assert [id for id, _ in backend.search(parse_query("bread"), "done")] == ["2"]
+        backend.put("9", Task("bread again", "todo", 0, None))
+        assert [id for id, _ in backend.search(parse_query("bre* OR report"))] == ["1", "2", "3", "9"]
+        # One command scans the tasks instead of building an index it would throw away.
+        assert backend.terms is None
+    store = TaskStore(str(file))
+    assert [id for id, _ in store.search(parse_query("bread"), "todo")] == ["1", "9"]
+    assert store.terms is not None
+
+
+def test_main_search(monkeypatch, capsys, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+
+    run_main_with_inputs(monkeypatch, [
+        'add "Buy milk"', 'add "Buy bread"', 'add "Walk the dog"', 'mark-done 2',
+        'search buy --status todo', 'exit',
+    ])
+    captured = capsys.readouterr()
+    assert "Buy milk" in captured.out
+    assert "Buy bread" not in captured.out
+    assert "Walk the dog" not in captured.out
+
+
+def test_main_search_nothing_found(monkeypatch, capsys, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+
+    run_main_with_inputs(monkeypatch, ['add "Buy milk"', 'search wal* OR dog', 'exit'])
+    captured = capsys.readouterr()
+    assert "Nothing to display." in captured.out
+
+
+# ---------- TESTES DE ARGV E BATCH ----------
+
+def test_main_argv_commands(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+
+    assert main(["add", "Buy milk"]) == 0
+    assert main(["add", "Walk the dog"]) == 0
+    assert main(["mark-done", "2"]) == 0
+    main(["list", "done"])
+    captured = capsys.readouterr()
+    assert "Walk the dog" in captured.out
+    assert "Buy milk" not in captured.out
+    assert "Welcome" not in captured.out
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db", "tasks.tbin"])
+def test_main_argv_commands_load_no_task_store(monkeypatch, capsys, tmp_path, name):
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / name))
+    monkeypatch.setattr("task_manager.CATALOG_FILE", str(tmp_path / "lists.json"))
+    monkeypatch.setattr(TaskStore, "reload", lambda self: pytest.fail("a shell command loaded a TaskStore"))
+
+    for argv in (["add", "Buy milk"], ["add", "Walk the dog"], ["mark-done", "1-2"], ["update", "1", "Buy bread"],
+                 ["delete", "2"], ["use", "work"], ["add", "Work task"], ["use", "default"]):
+        assert main(argv) == 0
+    capsys.readouterr()
+    main(["list", "--list", "*"])
+    main(["search", "bread"])
+    out = capsys.readouterr().out
+    assert "Work task" in out and out.count("Buy bread") == 2
+    assert "Walk the dog" not in out
+
+
+def test_main_argv_error_exits(monkeypatch, tmp_path):
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+    with pytest.raises(SystemExit, match="Error:"):
+        main(["delete", "7"])
+
+
+def test_main_batch_reports_errors_and_goes_on(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    script = tmp_path / "script.txt"
+    script.write_text('# nightly ingest\nadd "Task1"\ndelete 9\n\nadd "Task2"\nupdate 1 "Task1 v2"\nbogus command here now\n')
+    monkeypatch.setattr("task_manager.filename", str(file))
+
+    assert main(["batch", str(script)]) == 1
+    captured = capsys.readouterr()
+    assert "Line 3: Error: You can't delete" in captured.err
+    assert "Line 7: Error: Wrong command" in captured.err
+    assert "5 commands, 2 failed" in captured.out
+    tasks = load_tasks(file)
+    assert [task[0] for task in tasks.values()] == ["Task1 v2", "Task2"]
+
+
+def test_main_batch_from_stdin(monkeypatch, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("sys.stdin", io.StringIO('add "Task1"\nmark-in-progress 1\nexit\nadd "Task2"\n'))
+
+    assert main(["batch", "-"]) == 0
+    assert load_tasks(file) is not None
+    assert [task[1] for task in load_tasks(file).values()] == ["in-progress"]
+
+
+def test_run_batch_flushes_every_n_commands(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text("")
+    store = TaskStore(file, "exit")
+
+    def lines():
+        yield 'add "Task1"'
+        yield 'add "Task2"'
+        assert len(load_tasks(file)) == 2
+        yield 'add "Task3"'
+        assert len(load_tasks(file)) == 2
+
+    assert run_batch(lines(), store, every=2) == 0
+    assert len(load_tasks(file)) == 3
+
+
+def test_main_batch_bad_arguments(monkeypatch, tmp_path):
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+    with pytest.raises(SystemExit, match="--every"):
+        main(["batch", "-", "--every", "0"])
+    with pytest.raises(SystemExit, match="Can't read"):
+        main(["batch", str(tmp_path / "missing.txt")])
+
+
+# ---------- TESTES DE IMPORT/EXPORT ----------
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_import_tasks_ndjson_appends_with_new_ids(tmp_path, name):
+    file = tmp_path / name
+    add_task("Existing", file)
+    source = tmp_path / "in.ndjson"
+    source.write_text(
+        '{"id": "1", "description": "Imported1"}\n'
+        '\n'
+        '{"description": "Imported2", "status": "done", "created": "01.09.2025 12:00:00"}\n'
+        '{"description": "Imported3", "created": 1756728000, "updated": "02.09.2025 12:00:00"}\n'
+    )
+    assert import_tasks(source, file) == 3
+    with open_backend(file) as backend:
+        tasks = dict(backend.tasks())
+        assert backend.peek_next_id() == 5
+    assert [task.description for task in tasks.values()] == ["Existing", "Imported1", "Imported2", "Imported3"]
+    assert tasks["2"].status == "todo" and isinstance(tasks["2"].created, int)
+    assert tasks["3"].status == "done"
+    assert tasks["4"].created == parse_timestamp("01.09.2025 12:00:00")
+    assert tasks["4"].updated == parse_timestamp("02.09.2025 12:00:00")
+
+
+def test_import_tasks_in_chunks(monkeypatch, tmp_path):
+    monkeypatch.setattr("task_manager.IMPORT_CHUNK", 2)
+    file = tmp_path / "tasks.db"
+    source = tmp_path / "in.csv"
+    source.write_text("description,status\n" + "".join(f"Task{id},todo\n" for id in range(1, 6)))
+    assert import_tasks(source, file) == 5
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.tasks()] == ["1", "2", "3", "4", "5"]
+        assert [id for id, _ in backend.search(parse_query("task3"))] == ["3"]
+
+
+def test_import_tasks_bad_row_changes_nothing(tmp_path):
+    file = tmp_path / "tasks.json"
+    add_task("Existing", file)
+    source = tmp_path / "in.csv"
+    source.write_text("description,status\nGood,todo\nBad,someday\n")
+    with pytest.raises(SystemExit, match="Row 3 has an unknown status"):
+        import_tasks(source, file)
+    assert list(load_tasks(file)) == ["1"]
+    with pytest.raises(SystemExit, match="Unknown file format"):
+        import_tasks(tmp_path / "in.txt", file)
+
+
+def test_export_import_round_trip(tmp_path):
+    file = tmp_path / "tasks.json"
+    file.write_text(json.dumps({
+        "1": ["Buy milk, bread", "todo", "01.09.2025 12:00:00", "N/A"],
+        "3": ["Say \"hi\"", "done", "02.09.2025 12:00:00", "03.09.2025 12:00:00"],
+    }))
+    for name in ["out.csv", "out.ndjson"]:
+        assert export_tasks(file, tmp_path / name) == 2
+        copy = tmp_path / f"copy-{name}.db"
+        assert import_tasks(tmp_path / name, copy) == 2
+        assert list(load_tasks(copy).values()) == [
+            ["Buy milk, bread", "todo", "01.09.2025 12:00:00", "N/A"],
+            ["Say \"hi\"", "done", "02.09.2025 12:00:00", "03.09.2025 12:00:00"],
+        ]
+    lines = (tmp_path / "out.ndjson").read_text().splitlines()
+    assert json.loads(lines[1]) == {"id": "3", "description": "Say \"hi\"", "status": "done",
+                                    "created": "02.09.2025 12:00:00", "updated": "03.09.2025 12:00:00"}
+    assert (tmp_path / "out.csv").read_text().splitlines()[0] == "id,description,status,created,updated"
+
+
+def test_main_import_export(monkeypatch, capsys, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+    (tmp_path / "in.csv").write_text("description,status\nTask1,done\nTask2,todo\n")
+
+    run_main_with_inputs(monkeypatch, ['add "Task0"', 'import in.csv', 'export out.ndjson --status done', 'list', 'exit'])
+    captured = capsys.readouterr()
+    assert "Imported 2 tasks." in captured.out
+    assert "Exported 1 tasks." in captured.out
+    assert "Task2" in captured.out
+    assert [json.loads(line)["id"] for line in (tmp_path / "out.ndjson").read_text().splitlines()] == ["2"]
+
+
+def test_main_export_to_stdout(monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+    main(["add", "Task1"])
+    main(["export", "-", "--format", "csv"])
+    captured = capsys.readouterr()
+    assert captured.out.splitlines()[1].startswith("1,Task1,todo,")
+
+
+# ---------- TESTES DE CONCORRENCIA ----------
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_version_counts_commits(tmp_path, name):
+    file = tmp_path / name
+    add_task("Task1", file)
+    with open_backend(file) as backend:
+        first = backend.version()
+    add_task("Task2", file)
+    with open_backend(file) as backend:
+        second = backend.version()
+    renumber_tasks(file)
+    with open_backend(file) as backend:
+        third = backend.version()
+    load_tasks(file)
+    with open_backend(file) as backend:
+        assert first < second < third == backend.version()
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_task_store_conflict_moves_new_ids(tmp_path, name):
+    file = tmp_path / name
+    first = TaskStore(file, "exit")
+    second = TaskStore(file, "exit")
+    add_task("Task A", first)
+    add_task("Task B", second)
+    first.flush()
+    second.flush()
+    assert {id: task[0] for id, task in load_tasks(file).items()} == {"1": "Task A", "2": "Task B"}
+    assert second.get("2").description == "Task B"
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_task_store_conflict_merges_fields(tmp_path, name):
+    file = tmp_path / name
+    add_task("Task1", file)
+    add_task("Task2", file)
+    first = TaskStore(file, "exit")
+    second = TaskStore(file, "exit")
+    update_task("1", "Task1 v2", first)
+    update_status("1", "done", second)
+    delete_task("2", first)
+    update_status("2", "in-progress", second)
+    first.flush()
+    second.flush()
+    tasks = load_tasks(file)
+    assert list(tasks) == ["1"]
+    assert tasks["1"][:2] == ["Task1 v2", "done"]
+
+
+def test_task_store_without_conflict_keeps_memory(tmp_path):
+    file = tmp_path / "tasks.json"
+    store = TaskStore(file, "exit")
+    add_task("Task1", store)
+    store.flush()
+    add_task("Task2", store)
+    tasks_dict = store.tasks_dict
+    store.flush()
+    assert store.tasks_dict is tasks_dict
+    assert len(load_tasks(file)) == 2
+
+
+def stress_writer(filename, count):
+    store = TaskStore(filename)
+    for number in range(count):
+        # Half through a session store (optimistic), half as single units of work (locked).
+        add_task(f"Task {os.getpid()}-{number}", store if number % 2 else filename)
+        if number % 5 == 4:
+            update_status("1", "in-progress", store)
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+@pytest.mark.parametrize("writers", [1, 4, 16])
+def test_concurrent_writers_lose_nothing(tmp_path, name, writers):
+    multiprocessing = pytest.importorskip("multiprocessing")
+    if "fork" not in multiprocessing.get_all_start_methods():
+        pytest.skip("needs fork")
+    context = multiprocessing.get_context("fork")
+    file = tmp_path / name
+    count = 20
+
+    started = time.perf_counter()
+    processes = [context.Process(target=stress_writer, args=(str(file), count)) for _ in range(writers)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+    print(f"\n{name}: {writers} writers, {writers * count / elapsed:.0f} adds/s")
+
+    assert all(process.exitcode == 0 for process in processes)
+    tasks = load_tasks(file)
+    descriptions = [task[0] for task in tasks.values()]
+    assert len(tasks) == writers * count
+    assert len(set(descriptions)) == writers * count
+    assert sorted(map(int, tasks)) == list(range(1, writers * count + 1))
+
+
+# ---------- TESTES DE BLOBS ----------
+
+LONG_NOTE = "Meeting notes\n" + "lorem ipsum dolor " * 3000
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_long_description_moves_to_blob_store(tmp_path, name):
+    file = tmp_path / name
+    add_task(LONG_NOTE, file)
+    add_task(LONG_NOTE, file)
+    add_task("short", file)
+
+    with open_backend(file) as backend:
+        first, second, short = backend.get("1"), backend.get("2"), backend.get("3")
+    assert first.blob == second.blob
+    assert first.description.startswith("Meeting notes") and first.description.endswith("…")
+    assert len(first.description) <= 60
+    assert short.blob is None and short.description == "short"
+    # Identical texts are stored once.
+    blobs = [path for path in (tmp_path / f"{name}.blobs").rglob("*") if path.is_file()]
+    assert len(blobs) == 1
+    assert BlobStore(file).get(first.blob) == LONG_NOTE
+
+
+def test_blob_keeps_task_file_small(tmp_path):
+    file = tmp_path / "tasks.json"
+    for i in range(20):
+        add_task(LONG_NOTE + str(i), file)
+    assert os.path.getsize(file) < 20 * 200
+    assert len(LONG_NOTE) > BLOB_THRESHOLD
+
+
+def test_blob_survives_status_change_and_update(tmp_path):
+    file = tmp_path / "tasks.json"
+    add_task(LONG_NOTE, file)
+    update_status("1", "done", file)
+    with open_backend(file) as backend:
+        assert backend.get("1").blob is not None
+    update_task("1", "now short", file)
+    with open_backend(file) as backend:
+        task = backend.get("1")
+    assert task.blob is None and task.description == "now short"
+
+
+def test_show_task_prints_full_description(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    add_task(LONG_NOTE, file)
+    show_full_list(file)
+    listed = capsys.readouterr().out
+    assert "Meeting notes" in listed and "lorem ipsum dolor " * 10 not in listed
+    show_task("1", file)
+    assert LONG_NOTE in capsys.readouterr().out
+
+
+def test_show_task_errors(tmp_path):
+    file = tmp_path / "tasks.json"
+    with pytest.raises(SystemExit):
+        show_task("1", file)
+    add_task("short", file)
+    with pytest.raises(SystemExit):
+        show_task("2", file)
+
+
+def test_export_and_import_full_description(tmp_path):
+    source, target = tmp_path / "tasks.json", tmp_path / "copy.db"
+    add_task(LONG_NOTE, source)
+    export_tasks(source, tmp_path / "out.ndjson")
+    row = json.loads((tmp_path / "out.ndjson").read_text().splitlines()[0])
+    assert row["description"] == LONG_NOTE
+
+    import_tasks(tmp_path / "out.ndjson", target)
+    with open_backend(target) as backend:
+        task = backend.get("1")
+    assert task.blob is not None and BlobStore(target).get(task.blob) == LONG_NOTE
+
+
+def test_import_json_copies_blobs(tmp_path):
+    source, target = tmp_path / "tasks.json", tmp_path / "tasks.db"
+    add_task(LONG_NOTE, source)
+    import_json(source, target)
+    with open_backend(target) as backend:
+        task = backend.get("1")
+    assert BlobStore(target).get(task.blob) == LONG_NOTE
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db", "tasks.tbin"])
+def test_search_finds_words_of_the_whole_long_description(capsys, tmp_path, name):
+    file = tmp_path / name
+    add_task(LONG_NOTE + " renew passport", file)
+    add_task("short passport", file)
+    add_task("short", file)
+    update_status("1", "in-progress", file)
+    show_search_results("passport", file)
+    out = capsys.readouterr().out
+    assert "Meeting notes" in out and "short passport" in out
+    show_search_results("renew", file)
+    assert "Meeting notes" in capsys.readouterr().out
+    assert change_tasks(file, "done", where=parse_where_option("desc~RENEW PASSPORT"), dry_run=True) == 1
+
+    # Loaded stores keep the whole text indexed through changes.
+    store = TaskStore(str(file))
+    assert [id for id, _ in store.search(parse_query("renew"))] == ["1"]
+    update_task("1", "now short", store)
+    assert list(store.search(parse_query("renew"))) == []
+
+
+def test_sqlite_reindexes_long_descriptions_of_older_files(tmp_path):
+    file = tmp_path / "tasks.db"
+    add_task(LONG_NOTE + " renew passport", file)
+    # What versions that indexed only the preview left behind.
+    connection = sqlite3.connect(file)
+    connection.execute("DELETE FROM terms WHERE token = 'passport'")
+    connection.execute("DELETE FROM meta WHERE key = 'terms_version'")
+    connection.commit()
+    connection.close()
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.search(parse_query("passport"))] == ["1"]
+
+
+# ---------- TESTES DE BENCHMARK ----------
+
+def test_benchmarks_cover_every_op(tmp_path):
+    from bench_tasker import run_benchmarks
+    results = run_benchmarks([20], ["json", "journal", "db"], repeat=1, directory=str(tmp_path))
+    ops = {record["op"] for record in results}
+    assert {"startup", "add", "update", "mark", "delete", "list-all", "list-filtered"} <= ops
+    assert {"cli-add", "cli-update", "cli-mark", "cli-delete", "cli-list-all", "cli-list-limit", "cli-search"} <= ops
+    assert {record["backend"] for record in results} == {"json", "journal", "db"}
+    assert all(record["seconds"] >= 0 and record["peak_bytes"] >= 0 for record in results)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_benchmark_baseline_comparison(tmp_path):
+    from bench_tasker import compare_results, main_bench, read_results, write_results
+    baseline = [{"backend": "db", "size": 20, "op": "add", "seconds": 0.1}]
+    assert compare_results([{"backend": "db", "size": 20, "op": "add", "seconds": 0.15}], baseline, 2.0) == []
+    assert len(compare_results([{"backend": "db", "size": 20, "op": "add", "seconds": 0.3}], baseline, 2.0)) == 1
+
+    output, saved = tmp_path / "bench_output.txt", tmp_path / "baseline.txt"
+    arguments = ["--sizes", "20", "--backends", "db", "--repeat", "1", "--output", str(output)]
+    assert main_bench(arguments + ["--save-baseline", str(saved)]) == 0
+    assert read_results(output)
+    slow = read_results(saved)
+    for record in slow:
+        record["seconds"] = -1.0
+    write_results(slow, saved)
+    assert main_bench(arguments + ["--baseline", str(saved)]) == 1
+
+
+# ---------- TESTES DE PROFILE ----------
+
+def test_profile_nested_phases_are_exclusive():
+    profile = Profile("add")
+    with profile.phase("mutate"):
+        time.sleep(0.02)
+        with profile.phase("write"):
+            time.sleep(0.03)
+    record = profile.finish()
+    assert record["command"] == "add"
+    assert 15 <= record["phases_ms"]["mutate"] < 30
+    assert record["phases_ms"]["write"] >= 25
+    assert record["total_ms"] >= record["phases_ms"]["mutate"] + record["phases_ms"]["write"]
+
+
+def test_profiled_is_a_no_op_when_disabled(tmp_path):
+    file = tmp_path / "tasks.json"
+    assert profiled("add", file, lambda: 42, enabled=False) == 42
+    assert not os.path.exists(f"{file}.metrics.jsonl")
+    with profile_phase("load"):
+        pass
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_main_profile_writes_metrics(monkeypatch, capsys, tmp_path, name):
+    file = tmp_path / name
+    monkeypatch.setattr("task_manager.filename", str(file))
+    main(["--profile", "add", "Buy milk"])
+    main(["list", "--limit", "1", "--profile"])
+    main(["list"])
+    err = capsys.readouterr().err
+    assert "[profile] add:" in err and "[profile] list:" in err
+
+    records = read_metrics(f"{file}.metrics.jsonl")
+    assert [record["command"] for record in records] == ["add", "list"]
+    assert records[0]["phases_ms"]["mutate"] >= 0 and records[0]["phases_ms"]["write"] > 0
+    assert records[1]["tasks_emitted"] == 1 and records[1]["tasks_scanned"] >= 1
+    assert "render" in records[1]["phases_ms"]
+
+
+def test_profile_env_repl_and_cprofile(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("task_manager.PROFILE", True)
+    monkeypatch.setattr("task_manager.CPROFILE_FILE", str(tmp_path / "last.prof"))
+    monkeypatch.setattr("task_manager.METRICS_FILE", str(tmp_path / "metrics.jsonl"))
+    monkeypatch.setattr("sys.argv", ["tasker"])
+    inputs = iter(['add "Task"', "exit"])
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    main()
+    commands = [record["command"] for record in read_metrics(tmp_path / "metrics.jsonl")]
+    assert commands == ["startup", "add", "flush"]
+    assert (tmp_path / "last.prof").exists()
+
+
+def test_stats_profile_summary(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    main(["stats", "profile"])
+    assert "No profiled commands" in capsys.readouterr().out
+    for number in range(3):
+        main(["--profile", "add", f"Task {number}"])
+    main(["--profile", "list"])
+    capsys.readouterr()
+
+    assert len(read_metrics(f"{file}.metrics.jsonl", 2)) == 2
+    main(["stats", "profile", "3"])
+    out = capsys.readouterr().out
+    assert "Last 3 profiled commands" in out
+    add_line = next(line for line in out.splitlines() if line.startswith("add "))
+    assert add_line.split("|")[1].strip() == "2"
+    with pytest.raises(SystemExit):
+        main(["stats", "profile", "x"])
+    with pytest.raises(SystemExit):
+        main(["stats", "x"])
+
+
+# ---------- TESTES DE DAEMON ----------
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    """Serves tasks.json in tmp_path from a thread, yields its TaskStore."""
+    import asyncio
+    import threading
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    store = TaskStore(str(file), "ms:50")
+    path = socket_filename(file)
+    started = threading.Event()
+    thread = threading.Thread(target=asyncio.run, args=(serve_tasks(store, path, started.set),))
+    thread.start()
+    assert started.wait(5)
+    yield store
+    send_request(path, {"shutdown": True})
+    thread.join(5)
+    store.flush()
+    assert not os.path.exists(path)
+
+
+def test_daemon_runs_client_commands(daemon, capsys, tmp_path):
+    main(["add", "Buy milk"])
+    main(["add", "Call mom"])
+    main(["mark-done", "2"])
+    main(["list", "done"])
+    out = capsys.readouterr().out
+    assert "Call mom" in out and "Buy milk" not in out
+    # Served from memory: the client never opened the file itself.
+    assert daemon.get("2").status == "done"
+
+
+def test_daemon_reports_errors_and_uses_client_cwd(daemon, monkeypatch, capsys, tmp_path):
+    with pytest.raises(SystemExit, match="to-do list is empty"):
+        main(["delete", "7"])
+    client_dir = tmp_path / "client"
+    client_dir.mkdir()
+    (client_dir / "in.csv").write_text("description\nFrom csv\n")
+    monkeypatch.chdir(client_dir)
+    main(["import", "in.csv"])
+    assert "Imported 1 tasks." in capsys.readouterr().out
+    assert daemon.get("1").description == "From csv"
+
+
+def test_daemon_persists_by_policy(daemon, tmp_path):
+    main(["add", "Persist me"])
+    deadline = time.time() + 5
+    while time.time() < deadline and not load_tasks(tmp_path / "tasks.json"):
+        time.sleep(0.05)
+    assert load_tasks(tmp_path / "tasks.json")["1"][0] == "Persist me"
+
+
+def test_daemon_serves_concurrent_clients(daemon, tmp_path):
+    import threading
+    path = socket_filename(tmp_path / "tasks.json")
+    errors = []
+
+    def client(number):
+        for i in range(10):
+            reply = send_request(path, {"argv": ["add", f"Task {number}-{i}"], "cwd": str(tmp_path)})
+            if reply["error"] is not None:
+                errors.append(reply["error"])
+
+    clients = [threading.Thread(target=client, args=(number,)) for number in range(8)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    assert errors == []
+    assert daemon.count() == 80
+
+
+def test_daemon_answers_malformed_requests(daemon, tmp_path):
+    import socket as sockets
+    path = socket_filename(tmp_path / "tasks.json")
+    with sockets.socket(sockets.AF_UNIX) as client:
+        client.connect(path)
+        replies = client.makefile('rb')
+        for line in (b"not json\n", b"[1]\n", b'{"argv": "add x"}\n', b'{"argv": ["add", 5]}\n',
+                     b'{"argv": ["add", "Still served"]}\n', b"oops\n"):
+            client.sendall(line)
+            reply = json.loads(replies.readline())
+            assert reply["error"] == ("Error: Bad request." if b"Still" not in line else None)
+    assert [task.description for _, task in daemon.tasks()] == ["Still served"]
+
+
+def test_main_without_daemon_runs_directly(monkeypatch, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    # A socket file left by a crashed daemon is not a running daemon.
+    (tmp_path / "tasks.json.sock").write_text("")
+    main(["add", "Direct"])
+    assert load_tasks(file)["1"][0] == "Direct"
+    assert send_request(str(tmp_path / "missing.sock"), {"argv": ["help"]}) is None
+
+
+# ---------- TESTES DE GRAMATICA ----------
+
+@pytest.mark.parametrize("line, commands", [
+    ("add Buy milk", [["add", "Buy", "milk"]]),
+    ('add "Buy milk"; list done', [["add", "Buy milk"], ["list", "done"]]),
+    ('add "a;b" ; list;;', [["add", "a;b"], ["list"]]),
+    (r'add say \"hi\"', [["add", "say", '"hi"']]),
+    (r'add "say \"hi\" twice"', [["add", 'say "hi" twice']]),
+    (r'add a\;b\ c; list', [["add", "a;b c"], ["list"]]),
+    (r'add C:\temp', [["add", r"C:\temp"]]),
+    ('add ""', [["add", ""]]),
+    ('a"b c"d', [["ab cd"]]),
+    ('add "unterminated; still', [["add", "unterminated; still"]]),
+    ("  ;  ", []),
+])
+def test_parse_commands(line, commands):
+    assert parse_commands(line) == commands
+
+
+def test_parse_input_escaped_quote():
+    assert parse_input(r'add "say \"hi\""') == ["add", 'say "hi"']
+    assert parse_input("add a;b") == ["add", "a;b"]
+
+
+def test_run_command_binds_from_specs(tmp_path):
+    store = TaskStore(str(tmp_path / "tasks.json"))
+    run_command(["add", "Buy", "milk"], store)
+    run_command(["update", "1", "Buy", "bread"], store)
+    assert store.get("1").description == "Buy bread"
+    for parts in (["add"], ["delete", "x"], ["delete", "1", "2"], ["mark-done"], ["list", "done", "b"], []):
+        with pytest.raises(SystemExit, match="Incorrect arguments|Wrong command"):
+            run_command(parts, store)
+    with pytest.raises(SystemExit, match="can't be used with \"add\""):
+        run_command(["add", "x", "--limit", "3"], store)
+    with pytest.raises(SystemExit, match="Unknown list filter"):
+        run_command(["list", "later"], store)
+    with pytest.raises(SystemExit, match="needs a value"):
+        run_command(["list", "--limit"], store)
+
+
+def test_register_command_extends_grammar(monkeypatch, capsys, tmp_path):
+    monkeypatch.setattr("task_manager.COMMANDS", dict(COMMANDS))
+    seen = []
+    register_command(CommandSpec("touch", lambda store, id, limit=None: seen.append((id, limit)),
+                                 ["id"], ["--limit"], usage="touch <id>", aliases=["poke"]))
+    store = TaskStore(str(tmp_path / "tasks.json"))
+    run_command(["poke", "3", "--limit", "2"], store)
+    assert seen == [("3", 2)]
+    run_command(["help"], store)
+    assert "touch <id>" in capsys.readouterr().out
+
+
+def test_repl_and_batch_multi_command_lines(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    run_main_with_inputs(monkeypatch, ['add "Task1"; add Task2; mark-done 1; exit', 'add never'])
+    tasks = load_tasks(file)
+    assert [(task[0], task[1]) for task in tasks.values()] == [("Task1", "done"), ("Task2", "todo")]
+
+    store = TaskStore(str(file), "exit")
+    failed = run_batch(['add "Task3"; delete 9; add Task4', 'delete 2; exit; add never'], store)
+    assert failed == 1
+    assert "Batch done: 4 commands, 1 failed." in capsys.readouterr().out
+    assert [task[0] for task in load_tasks(file).values()] == ["Task1", "Task3", "Task4"]
+
+
+def test_main_argv_semicolon(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    main(["add", "One", ";", "add", "Two", ";", "list"])
+    out = capsys.readouterr().out
+    assert "One" in out and "Two" in out
+
+
+def test_parse_benchmark_runs():
+    from bench_tasker import run_parse_benchmarks
+    results = run_parse_benchmarks(60, repeat=1)
+    assert [record["op"] for record in results] == ["parse-legacy", "parse", "parse-multi"]
+
+
+# ---------- TESTES DE ARQUIVO ----------
+
+def make_aged_list(file, count=6):
+    """Adds count tasks and marks the odd ones done, the first three of them long ago."""
+    for i in range(1, count + 1):
+        add_task(f"Task{i} milk", file)
+    for i in range(1, count + 1, 2):
+        update_status(str(i), "done", file)
+    with open_backend(file) as backend:
+        for id in ["1", "3"]:
+            task = backend.get(id)
+            backend.put(id, Task(task.description, task.status, task.created, task.updated,
+                                 task.blob, task.completed - 40 * DAY))
+
+
+def test_update_status_tracks_completion(tmp_path):
+    file = tmp_path / "tasks.db"
+    add_task("Task1", file)
+    update_status("1", "done", file)
+    with open_backend(file) as backend:
+        completed = backend.get("1").completed
+    assert isinstance(completed, int)
+    update_status("1", "done", file)
+    with open_backend(file) as backend:
+        assert backend.get("1").completed == completed
+    update_status("1", "todo", file)
+    with open_backend(file) as backend:
+        assert backend.get("1").completed is None
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db"])
+def test_archive_moves_old_done_tasks(capsys, tmp_path, name):
+    file = tmp_path / name
+    make_aged_list(file)
+    assert archive_tasks(file, days=30) == 2
+    assert archive_tasks(file, days=30) == 0
+
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.tasks()] == ["2", "4", "5", "6"]
+    assert Archive(file).count() == 2
+
+    show_done_list(file)
+    out = capsys.readouterr().out
+    assert all(f"Task{i} milk" in out for i in [1, 3, 5])
+    show_full_list(file)
+    assert "Task1 milk" not in capsys.readouterr().out
+    show_search_results("milk", file, "done")
+    out = capsys.readouterr().out
+    assert out.index("Task1") < out.index("Task3") < out.index("Task5")
+    show_task("3", file)
+    assert "Task3 milk" in capsys.readouterr().out
+
+    exported = tmp_path / "out.ndjson"
+    assert export_tasks(file, str(exported)) == 6
+    assert [json.loads(line)["id"] for line in exported.read_text().splitlines()] == ["1", "2", "3", "4", "5", "6"]
+
+
+@pytest.mark.parametrize("compression, suffix", [("lzma", ".xz"), ("zlib", ".zz")])
+def test_archive_compression(monkeypatch, tmp_path, compression, suffix):
+    monkeypatch.setattr("task_manager.ARCHIVE_COMPRESSION", compression)
+    file = tmp_path / "tasks.json"
+    make_aged_list(file)
+    archive_tasks(file, days=30)
+    segments = [path.name for path in (tmp_path / "tasks.json.archive").iterdir() if path.name != "manifest.json"]
+    assert segments == [f"000001{suffix}"]
+    assert Archive(file).get("1").description == "Task1 milk"
+    assert Archive(file).get("2") is None
+
+
+def test_archive_keeps_ids_unique(tmp_path):
+    file = tmp_path / "tasks.json"
+    make_aged_list(file)
+    archive_tasks(file, days=30)
+    renumber_tasks(file)
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.tasks()] == ["4", "5", "6", "7"]
+    add_task("new", file)
+    with open_backend(file) as backend:
+        assert backend.get("8").description == "new"
+
+
+def test_archive_command(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    make_aged_list(file)
+    main(["archive", "--days", "30", ";", "list", "done"])
+    out = capsys.readouterr().out
+    assert "Archived 2 tasks." in out and "Task1 milk" in out
+    with pytest.raises(SystemExit):
+        main(["archive", "--days", "soon"])
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.db"])
+def test_archived_tasks_cannot_be_changed(monkeypatch, tmp_path, name):
+    file = tmp_path / name
+    monkeypatch.setattr("task_manager.filename", str(file))
+    make_aged_list(file, count=3)
+    archive_tasks(file, days=30)
+    for argv in [["delete", "1"], ["mark-done", "1"], ["mark-in-progress", "3"], ["update", "3", "new"]]:
+        with pytest.raises(SystemExit, match="because it's archived"):
+            main(argv)
+    with pytest.raises(SystemExit, match="not on the to-do list"):
+        main(["delete", "9"])
+
+    # Once every task is archived the hot file is empty, archived IDs still get the same error.
+    delete_task("2", file)
+    with pytest.raises(SystemExit, match="because it's archived"):
+        main(["mark-in-progress", "1"])
+    assert Archive(file).get("1").status == "done"
+
+
+# ---------- TESTES DE FORMATO BINARIO ----------
+
+def test_binary_backend_commands(capsys, tmp_path):
+    file = tmp_path / "tasks.tbin"
+    add_task("Buy milk", file)
+    add_task("Zażółć gęślą jaźń", file)
+    add_task(LONG_NOTE, file)
+    update_status("1", "done", file)
+    update_task("2", "Call mom", file)
+    delete_task("3", file)
+    add_task("Task4", file)
+
+    with open_backend(file) as backend:
+        assert isinstance(backend, BinaryBackend)
+        assert [(id, task.description, task.status) for id, task in backend.tasks()] == [
+            ("1", "Buy milk", "done"), ("2", "Call mom", "todo"), ("4", "Task4", "todo")]
+        assert backend.get("1").completed is not None and backend.get("2").updated is not None
+        assert backend.get("3") is None
+        assert backend.count("todo") == 2 and backend.max_description_len("done") == len("Buy milk")
+    show_todo_list(file)
+    out = capsys.readouterr().out
+    assert "Call mom" in out and "Buy milk" not in out
+    show_search_results("milk", file)
+    assert "Buy milk" in capsys.readouterr().out
+
+
+def test_binary_status_change_is_in_place(tmp_path):
+    file = tmp_path / "tasks.tbin"
+    for i in range(100):
+        add_task(f"Task{i}", file)
+    with open_backend(file) as backend:
+        heap = backend.files()[1]
+    before = (os.path.getsize(file), os.path.getsize(heap))
+    update_status("50", "done", file)
+    update_status("50", "in-progress", file)
+    assert (os.path.getsize(file), os.path.getsize(heap)) == before
+    with open_backend(file) as backend:
+        assert backend.get("50").status == "in-progress"
+
+
+def test_binary_changes_reach_the_files_on_commit(monkeypatch, tmp_path):
+    file = tmp_path / "tasks.tbin"
+    for i in range(1, 5):
+        add_task(f"Task{i}", file)
+    before = [file.read_bytes(), (tmp_path / "tasks.tbin.heap.1").read_bytes()]
+
+    with pytest.raises(RuntimeError):
+        with open_backend(file) as backend:
+            backend.put("1", Task("Task1", "done", 1))
+            backend.put("2", Task("Renamed", "todo", 1))
+            backend.delete("3")
+            backend.put(backend.next_id(), Task("Task5", "todo", 1))
+            assert [(id, task.description) for id, task in backend.tasks("todo")] == [
+                ("2", "Renamed"), ("4", "Task4"), ("5", "Task5")]
+            raise RuntimeError
+    assert [file.read_bytes(), (tmp_path / "tasks.tbin.heap.1").read_bytes()] == before
+
+    updates = []
+
+    def failing_with_status(task, status):
+        updates.append(task)
+        if len(updates) == 3:
+            raise RuntimeError
+        return Task(task.description, status, task.created)
+
+    monkeypatch.setattr("task_manager.with_status", failing_with_status)
+    with pytest.raises(RuntimeError):
+        change_tasks(file, "done", parse_id_ranges("1-4"))
+    assert len(updates) == 3
+    assert [file.read_bytes(), (tmp_path / "tasks.tbin.heap.1").read_bytes()] == before
+
+
+def test_binary_heap_is_rewritten(monkeypatch, tmp_path):
+    monkeypatch.setattr("task_manager.BINARY_HEAP_GARBAGE", 100)
+    file = tmp_path / "tasks.tbin"
+    add_task("keep", file)
+    for i in range(20):
+        add_task(f"Temporary task {i}", file)
+        delete_task(str(i + 2), file)
+    with open_backend(file) as backend:
+        heap = backend.files()[1]
+        assert [task.description for _, task in backend.tasks()] == ["keep"]
+        assert backend.peek_next_id() == 22
+    assert os.path.getsize(heap) < 100
+    assert sorted(path.name for path in tmp_path.glob("tasks.tbin.heap.*")) == [os.path.basename(heap)]
+
+
+def test_binary_rejects_other_files(tmp_path):
+    file = tmp_path / "tasks.tbin"
+    file.write_text("{}" * 40)
+    with pytest.raises(SystemExit):
+        BinaryBackend(file)
+
+
+def test_convert_json_to_binary_and_back(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    add_task("Task1", file)
+    add_task(LONG_NOTE, file)
+    add_task("Task3", file)
+    update_status("3", "done", file)
+    delete_task("1", file)
+    binary, back = tmp_path / "tasks.tbin", tmp_path / "back.json"
+
+    assert convert_tasks(file, binary) == 2
+    assert convert_tasks(binary, back) == 2
+    assert load_tasks(back) == load_tasks(file)
+    with open_backend(back) as backend:
+        assert backend.peek_next_id() == 4
+        assert BlobStore(back).get(backend.get("2").blob) == LONG_NOTE
+
+    monkeypatch.setattr("task_manager.filename", str(file))
+    main(["convert", str(tmp_path / "tasks.db")])
+    assert "Converted 2 tasks" in capsys.readouterr().out
+    with pytest.raises(SystemExit):
+        main(["convert", str(file)])
+
+
+# ---------- TESTES DE LISTAS NOMEADAS ----------
+
+@pytest.fixture
+def lists_dir(monkeypatch, tmp_path):
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+    monkeypatch.setattr("task_manager.CATALOG_FILE", str(tmp_path / "lists.json"))
+    return tmp_path
+
+
+def test_use_switches_and_creates_lists(lists_dir, capsys):
+    main(["add", "Home task"])
+    main(["use", "work"])
+    assert 'Created list "work"' in capsys.readouterr().out
+    main(["add", "Work task"])
+    main(["list"])
+    out = capsys.readouterr().out
+    assert "Work task" in out and "Home task" not in out
+    assert [task[0] for task in load_tasks(lists_dir / "work.json").values()] == ["Work task"]
+
+    main(["list", "--list", "default"])
+    assert "Home task" in capsys.readouterr().out
+    main(["lists"])
+    assert capsys.readouterr().out.splitlines() == ["  default  " + os.path.relpath(lists_dir / "tasks.json"),
+                                                   "* work     " + os.path.relpath(lists_dir / "work.json")]
+    with pytest.raises(SystemExit):
+        main(["list", "--list", "nowhere"])
+    with pytest.raises(SystemExit):
+        main(["use", "bad/name"])
+
+
+def test_use_refuses_names_taken_by_other_files(lists_dir, capsys):
+    main(["add", "Home task"])
+    for name in ("lists", "tasks"):
+        with pytest.raises(SystemExit, match="already the catalog or another list"):
+            main(["use", name])
+    assert Catalog().names() == ["default"]
+    main(["use", "work", ";", "add", "Work task", ";", "list", "--list", "default"])
+    assert "Home task" in capsys.readouterr().out
+    assert json.loads((lists_dir / "lists.json").read_text())["lists"] == {"work": "work.json"}
+
+
+def test_cross_list_queries(lists_dir, capsys):
+    main(["add", "Home task", ";", "mark-in-progress", "1"])
+    main(["use", "work", ";", "add", "Work task", ";", "add", "Work later", ";", "mark-in-progress", "1"])
+    main(["use", "empty", ";", "use", "default"])
+    capsys.readouterr()
+
+    main(["list", "in-progress", "--list", "*"])
+    out = capsys.readouterr().out
+    assert "List" in out and "Home task" in out and "Work task" in out and "Work later" not in out
+    main(["search", "work", "--list", "default,work", "--limit", "1"])
+    out = capsys.readouterr().out
+    assert "Work task" in out and "Work later" not in out
+    with pytest.raises(SystemExit):
+        main(["delete", "1", "--list", "*"])
+
+
+def test_workspace_switch_keeps_lists_loaded(lists_dir, monkeypatch, capsys):
+    run_main_with_inputs(monkeypatch, ['add "Home task"', "use work", 'add "Work task"', "use default", "lists", "exit"])
+    assert "(loaded)" in capsys.readouterr().out.split("default")[-1]
+
+    workspace = Workspace(Catalog())
+    loads = []
+    monkeypatch.setattr(TaskStore, "reload", lambda self, reload=TaskStore.reload: (loads.append(self.filename),
+                                                                                   reload(self)))
+    for name in ["work", "default", "work", "default"]:
+        workspace.store(name)
+    assert len(loads) == 2
+
+
+def test_store_cache_evicts_least_recently_used(tmp_path):
+    paths = [str(tmp_path / f"list{i}.json") for i in range(3)]
+    for path in paths:
+        add_task("Task", path)
+    cache = StoreCache("exit", budget=3 * 1024)
+    first = cache.get(paths[0])
+    first.put("2", Task("unsaved", "todo", 1))
+    cache.get(paths[1])
+    cache.get(paths[0])
+    cache.get(paths[2])
+    assert list(cache.stores) == [paths[0], paths[2]]
+    cache.get(paths[1])
+    assert paths[0] not in cache.stores
+    # Evicted lists are flushed first.
+    assert load_tasks(paths[0])["2"][0] == "unsaved"
+
+
+def test_run_command_without_workspace_rejects_lists(tmp_path):
+    store = TaskStore(str(tmp_path / "tasks.json"))
+    with pytest.raises(SystemExit):
+        run_command(["list", "--list", "work"], store)
+    with pytest.raises(SystemExit):
+        run_command(["use", "work"], store)
+
+
+# ---------- TESTES DE ORDENACAO ----------
+
+SORT_STATUSES = ["todo", "in-progress", "done"]
+
+
+def make_sortable_list(file):
+    """Adds 12 tasks with shuffled creation times and descriptions, every third one updated."""
+    with open_backend(file) as backend:
+        for i in range(1, 13):
+            backend.put(str(i), Task(f"{'cba'[i % 3]} task {i}", SORT_STATUSES[i % 3], 1000 + (i * 7) % 12,
+                                     2000 + i if i % 3 == 0 else None))
+
+
+def page_ids(capsys):
+    out = capsys.readouterr().out
+    ids = [line.split(" |")[0].strip() for line in out.splitlines() if " | " in line][1:]
+    cursor = out.split("--after ")[1].split()[0] if "--after " in out else None
+    return ids, cursor
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.db", "tasks.tbin"])
+@pytest.mark.parametrize("sort", ["created", "-created", "updated", "-updated", "status", "desc", "-id"])
+def test_sorted_pages_follow_cursors(capsys, tmp_path, name, sort):
+    file = tmp_path / name
+    make_sortable_list(file)
+    store = TaskStore(str(file))
+    expected = [id for id, _ in sorted_page(store, "all", sort)]
+    assert len(expected) == 12
+
+    seen, cursor = [], None
+    for _ in range(5):
+        run_command(["list", "--sort", sort, "--limit", "5"] + (["--after", cursor] if cursor else []), store)
+        ids, cursor = page_ids(capsys)
+        seen += ids
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_sort_orders(tmp_path):
+    file = tmp_path / "tasks.json"
+    make_sortable_list(file)
+    store = TaskStore(str(file))
+    rows = sorted_page(store, "all", "-updated", 5)
+    assert [id for id, _ in rows] == ["12", "9", "6", "3", "11"]
+    rows = sorted_page(store, "todo", "created")
+    assert [task.created for _, task in rows] == sorted(task.created for _, task in rows)
+    assert all(task.status == "todo" for _, task in rows)
+    assert [task.description[0] for _, task in sorted_page(store, "all", "desc")] == list("aaaabbbbcccc")
+    assert [task.status for _, task in sorted_page(store, "all", "status", 5)] == ["todo"] * 4 + ["in-progress"]
+
+
+def test_sort_errors(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    make_sortable_list(file)
+    store = TaskStore(str(file))
+    with pytest.raises(SystemExit):
+        run_command(["list", "--sort", "size"], store)
+    with pytest.raises(SystemExit):
+        run_command(["list", "--after", "garbage"], store)
+    run_command(["list", "--sort", "created", "--limit", "2"], store)
+    _, cursor = page_ids(capsys)
+    with pytest.raises(SystemExit):
+        run_command(["list", "--sort", "desc", "--after", cursor], store)
+    # The cursor remembers its order.
+    run_command(["list", "--limit", "2", "--after", cursor], store)
+    ids, _ = page_ids(capsys)
+    assert ids == [id for id, _ in sorted_page(store, "all", "created")][2:4]
+
+
+# ---------- TESTES DE FORMATOS DE SAIDA ----------
+
+def make_format_list(file):
+    add_task("Buy milk", file)
+    add_task('Say "hi", then\tleave', file)
+    add_task("漢字のタスク", file)
+    update_status("1", "done", file)
+
+
+@pytest.mark.parametrize("format", ["json", "ndjson", "csv", "tsv"])
+def test_machine_formats_parse_back(capsys, tmp_path, format):
+    import csv
+    file = tmp_path / "tasks.json"
+    make_format_list(file)
+    show_full_list(file, format=format)
+    out = capsys.readouterr().out
+    assert "\033[" not in out
+    if format == "json":
+        rows = json.loads(out)
+    elif format == "ndjson":
+        rows = [json.loads(line) for line in out.splitlines()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(out), delimiter="," if format == "csv" else "\t"))
+    assert [row["description"] for row in rows] == ["Buy milk", 'Say "hi", then\tleave', "漢字のタスク"]
+    assert rows[0]["status"] == "done" and rows[0]["updated"] == "N/A"
+
+
+def test_machine_formats_write_whole_long_descriptions(lists_dir, capsys):
+    main(["add", LONG_NOTE])
+    main(["use", "work", ";", "add", LONG_NOTE + " at work", ";", "use", "default"])
+    capsys.readouterr()
+    for argv in (["list", "--format", "ndjson"], ["list", "--sort", "id", "--format", "ndjson"],
+                 ["search", "meeting", "--format", "ndjson"]):
+        main(argv)
+        assert [json.loads(line)["description"] for line in capsys.readouterr().out.splitlines()] == [LONG_NOTE]
+    main(["list", "--list", "*", "--format", "ndjson"])
+    rows = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [row["description"] for row in rows] == [LONG_NOTE, LONG_NOTE + " at work"]
+    main(["list"])
+    assert LONG_NOTE not in capsys.readouterr().out
+
+
+def test_empty_machine_output(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    add_task("Task1", file)
+    show_done_list(file, format="json")
+    assert json.loads(capsys.readouterr().out) == []
+    show_done_list(file, format="csv")
+    assert capsys.readouterr().out == "id,description,status,created,updated\n"
+
+
+def test_plain_table_and_wide_characters(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    make_format_list(file)
+    show_full_list(file, format="plain")
+    lines = [line for line in capsys.readouterr().out.splitlines() if " | " in line]
+    assert "\033[" not in "".join(lines)
+    assert display_width("漢字のタスク") == 12
+    # Every row ends its Task column in the same terminal column.
+    assert len({display_width(line.split(" | ")[1]) for line in lines}) == 1
+
+
+def test_table_truncates_to_terminal(monkeypatch, capsys):
+    monkeypatch.setattr("task_manager.table_width_limit", lambda: 20)
+    render_tasks([("1", Task("a" * 50, "todo", 0)), ("2", Task("漢" * 30, "todo", 0))])
+    lines = capsys.readouterr().out.splitlines()
+    assert "a" * 19 + "…" in lines[4]
+    assert {display_width(line.split(" | ")[1]) for line in lines[4:6]} == {20}
+    assert fit_text("漢字", 3) == "漢…" and fit_text("ab", 4) == "ab  "
+
+
+def test_format_option_in_commands(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("task_manager.CATALOG_FILE", str(tmp_path / "lists.json"))
+    make_format_list(file)
+    main(["search", "milk", "--format", "ndjson"])
+    assert json.loads(capsys.readouterr().out)["id"] == "1"
+    main(["list", "--sort", "desc", "--limit", "1", "--format", "json"])
+    captured = capsys.readouterr()
+    assert len(json.loads(captured.out)) == 1 and "Next page: --after" in captured.err
+    main(["list", "--list", "*", "--format", "csv"])
+    assert capsys.readouterr().out.splitlines()[:2] == ["list,id,description,status,created,updated",
+                                                        "default,1,Buy milk,done," + load_tasks(file)["1"][2] + ",N/A"]
+    with pytest.raises(SystemExit):
+        main(["list", "--format", "xml"])
+
+
+# ---------- TESTES DE WATCH ----------
+
+@pytest.mark.parametrize("suffix", [".journal", ".db", ".tbin"])
+def test_store_reads_only_the_changes(monkeypatch, tmp_path, suffix):
+    file = str(tmp_path / f"tasks{suffix}")
+    with open_backend(file) as backend:
+        backend.replace_all({str(id): Task(f"task {id}", "todo", 100) for id in range(1, 6)})
+    store = TaskStore(file)
+    with open_backend(file) as backend:
+        backend.put("2", Task("task 2", "done", 100, 200))
+        backend.delete("3")
+        backend.put(backend.next_id(), Task("new", "todo", 300))
+    monkeypatch.setattr(TaskStore, "reload", lambda self: pytest.fail("reloaded everything"))
+    store.refresh(changed=True)
+    with open_backend(file) as backend:
+        assert store.tasks_dict == dict(backend.tasks())
+    assert store.get("2").status == "done" and store.get("3") is None and store.get("6").description == "new"
+    assert list(store.index.ids("todo")) == ["1", "4", "5", "6"]
+    assert store.peek_next_id() == 7
+
+
+@pytest.mark.parametrize("suffix", [".journal", ".db", ".tbin"])
+def test_store_reloads_when_changes_are_unknown(tmp_path, suffix):
+    file = str(tmp_path / f"tasks{suffix}")
+    add_task("first", file)
+    store = TaskStore(file)
+    with open_backend(file) as backend:
+        # A journal reset, the end of the SQLite change log and a new heap generation.
+        backend.replace_all({"7": Task("replaced", "todo", 100)})
+    store.refresh(changed=True)
+    assert [(id, task.description) for id, task in store.tasks()] == [("7", "replaced")]
+
+
+def test_watch_screen_rewrites_changed_lines():
+    output = io.StringIO()
+    screen = WatchScreen(output)
+    assert screen.draw(["title", "row 1", "row 2"]) == 3
+    assert output.getvalue().startswith("\033[H\033[2J")
+    output.truncate(0)
+    output.seek(0)
+    assert screen.draw(["title", "row 1", "row 2*"]) == 1
+    assert output.getvalue() == "\033[3;1Hrow 2*\033[K\033[4;1H"
+    output.truncate(0)
+    output.seek(0)
+    assert screen.draw(["title", "row 1", "row 2*"]) == 0
+    assert output.getvalue() == ""
+    assert screen.draw(["title"]) == 0
+    assert output.getvalue() == "\033[2;1H\033[J\033[2;1H"
+
+
+@pytest.mark.parametrize("inotify", [True, False])
+def test_file_watcher_wakes_on_writes(tmp_path, inotify):
+    file = tmp_path / "tasks.json"
+    file.write_text("{}")
+    watcher = FileWatcher([str(file)], interval=0.01, inotify=inotify)
+    if inotify and watcher.fd is None:
+        pytest.skip("no inotify here")
+    try:
+        (tmp_path / "tasks.json.lock").write_text("")
+        assert not watcher.wait(0.05)
+        os.replace(file, tmp_path / "old.json")
+        (tmp_path / "tasks.json.tmp").write_text('{"1": []}')
+        os.replace(tmp_path / "tasks.json.tmp", file)
+        assert watcher.wait(2)
+    finally:
+        watcher.close()
+
+
+def test_watch_redraws_after_a_change(tmp_path):
+    import threading
+    file = str(tmp_path / "tasks.journal")
+    for number in range(3):
+        add_task(f"task {number}", file)
+    store = TaskStore(file, "exit")
+    output = io.StringIO()
+    stop = threading.Event()
+    thread = threading.Thread(target=watch_tasks, args=(store, "todo"),
+                              kwargs={"screen": WatchScreen(output), "stop": stop,
+                                      "watcher": FileWatcher(store.files(), interval=0.01)})
+    thread.start()
+    try:
+        deadline = time.time() + 5
+        while "task 2" not in output.getvalue() and time.time() < deadline:
+            time.sleep(0.01)
+        drawn = len(output.getvalue())
+        update_status("2", "done", file)
+        while len(output.getvalue()) == drawn and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        stop.set()
+        thread.join()
+    redraw = output.getvalue()[drawn:]
+    # "task 1" left the list and "task 2" moved up; the title count changed, the header and "task 0" didn't.
+    assert "todo tasks" in redraw and "task 2" in redraw
+    assert "task 1" not in redraw and "task 0" not in redraw and "Created" not in redraw
+    assert watch_lines(store, "todo")[0].endswith(": 2")
+
+
+def test_watch_command_checks_arguments(monkeypatch, tmp_path):
+    monkeypatch.setattr("task_manager.filename", str(tmp_path / "tasks.json"))
+    monkeypatch.setattr("task_manager.CATALOG_FILE", str(tmp_path / "lists.json"))
+    for argv in (["watch", "--interval", "0"], ["watch", "all", "done"], ["watch", "--sort", "size"],
+                 ["watch", "--list", "missing"]):
+        with pytest.raises(SystemExit):
+            main(argv)
+
+
+# ---------- TESTES DE ESTATISTICAS ----------
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db", "tasks.tbin"])
+def test_stats_follow_every_change(tmp_path, name):
+    file = tmp_path / name
+    for number in range(1, 7):
+        add_task(f"Task{number}", file)
+    update_status("1", "done", file)
+    update_status("2", "in-progress", file)
+    update_status("3", "done", file)
+    update_status("3", "todo", file)
+    update_task("4", "Task4 renamed", file)
+    delete_task("5", file)
+    update_status("6", "done", file)
+    delete_task("6", file)
+
+    saved = read_stats(file)
+    with open_backend(file) as backend:
+        counted = TaskStats.build(backend.tasks())
+    assert saved.to_json() == counted.to_json()
+    assert saved.counts == {"todo": 2, "in-progress": 1, "done": 1}
+    assert sum(saved.created.values()) == 4 and sum(saved.completed.values()) == 1
+
+
+def test_stats_sketch_percentiles_and_removal():
+    base = 1_700_000_000
+    leads = [round(1.5 ** power) for power in range(10, 40)] * 3
+    rows = [(str(id), Task("x", "done", base, base + lead, None, base + lead)) for id, lead in enumerate(leads, 1)]
+    stats = TaskStats.build(rows)
+    ordered = sorted(leads)
+    for fraction in (0.5, 0.9, 0.99):
+        exact = ordered[int(fraction * (len(ordered) - 1))]
+        assert abs(stats.percentile(fraction) - exact) <= 0.01 * exact
+    assert TaskStats(json.loads(json.dumps(stats.to_json()))).to_json() == stats.to_json()
+
+    for _, task in rows:
+        stats.change(task, None)
+    assert stats.to_json() == {"counts": {}, "created": {}, "completed": {}, "lead": {}}
+    assert stats.percentile(0.5) is None
+
+
+def test_stats_command_reads_saved_stats(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.db"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("task_manager.CATALOG_FILE", str(tmp_path / "lists.json"))
+    for number in range(3):
+        main(["add", f"Task {number}"])
+    main(["mark-done", "2"])
+    capsys.readouterr()
+
+    # Up to date stats answer without loading the list.
+    monkeypatch.setattr(TaskStore, "reload", lambda self: pytest.fail("stats loaded the list"))
+    main(["stats", "--days", "2"])
+    out = capsys.readouterr().out
+    assert "Tasks: 3" in out
+    assert [line.split()[-1] for line in out.splitlines() if line.startswith("  ")] == ["2", "0", "1"]
+    today = datetime.now().strftime("%d.%m.%Y")
+    assert f"{today} |       3 |       1" in out
+    assert "Lead time to done: p50 " in out
+    with pytest.raises(SystemExit):
+        main(["stats", "--rebuild", "1"])
+
+
+def test_stats_recount_after_outside_edit(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    for number in range(3):
+        add_task(f"Task {number}", file)
+    assert read_stats(file).counts == {"todo": 3}
+    data = json.loads(file.read_text())
+    data["1"][1] = "done"
+    file.write_text(json.dumps(data))
+    assert read_stats(file) is None
+
+    workspace = Workspace(Catalog(str(tmp_path / "lists.json"), str(file)))
+    run_command(["stats"], workspace)
+    assert read_stats(file).counts == {"todo": 2, "done": 1}
+    # --rebuild counts again even if the saved stats look current.
+    stats_file = stats_filename(file)
+    saved = json.loads(open(stats_file).read())
+    saved["counts"] = {"todo": 99}
+    with open(stats_file, 'w') as out:
+        json.dump(saved, out)
+    run_command(["stats", "--rebuild"], workspace)
+    assert read_stats(file).counts == {"todo": 2, "done": 1}
+    assert capsys.readouterr().out.count("Tasks: 3") == 2
+
+
+def test_stats_survive_journal_compaction(tmp_path):
+    file = tmp_path / "tasks.journal"
+    for number in range(4):
+        add_task(f"Task {number}", file)
+    update_status("2", "done", file)
+    before = read_stats(file).to_json()
+    Journal(str(file)).compact()
+    assert read_stats(file).to_json() == before
+
+
+def test_stats_count_archived_tasks(capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    make_aged_list(file)
+    archive_tasks(file, days=30)
+    archive = Archive(file)
+    assert archive.stats().counts == {"done": 2}
+
+    # Manifests written before segments kept their stats get them on the first count.
+    manifest = archive.manifest()
+    for segment in manifest["segments"]:
+        del segment["stats"]
+    with open(archive.manifest_filename, 'w') as out:
+        json.dump(manifest, out)
+    assert Archive(file).stats().counts == {"done": 2}
+    assert "stats" in Archive(file).manifest()["segments"][0]
+
+    show_task_stats(read_stats(file), Archive(file).stats(), days=0)
+    out = capsys.readouterr().out
+    assert "Tasks: 6 (2 archived)" in out
+    assert [line.split()[-1] for line in out.splitlines() if line.startswith("  ")] == ["3", "0", "3"]
+
+
+# ---------- TESTES DE ALTERACOES EM LOTE ----------
+
+def test_parse_id_ranges_and_where():
+    assert parse_id_ranges("10-500,730") == [(10, 500), (730, 730)]
+    assert parse_id_ranges("5,3-4,1-2,4") == [(1, 5)]
+    for value in ("", "3-", "-3", "5-2", "1,,2", "a-b"):
+        assert parse_id_ranges(value) is None
+    assert parse_where_option("status=in-progress AND desc~Milk") == [("status", "=", "in-progress"),
+                                                                     ("desc", "~", "milk")]
+    assert parse_where_option('desc~"Rock AND Roll" and status!=done') == [("desc", "~", "rock and roll"),
+                                                                          ("status", "!=", "done")]
+    for value in ("status=later", "status~todo", "size=3", "desc"):
+        with pytest.raises(SystemExit, match="Wrong condition"):
+            parse_where_option(value)
+
+
+@pytest.mark.parametrize("name", ["tasks.json", "tasks.journal", "tasks.db", "tasks.tbin"])
+def test_change_tasks_in_one_commit(monkeypatch, tmp_path, name):
+    file = tmp_path / name
+    for number in range(1, 21):
+        add_task(f"Task{number} {'obsolete' if number % 4 == 0 else 'milk'}", file)
+    update_status("3", "done", file)
+    commits = []
+    backend_class = type(open_backend(file))
+    commit = backend_class.commit
+    monkeypatch.setattr(backend_class, "commit", lambda self: commits.append(1) or commit(self))
+
+    assert change_tasks(file, "done", parse_id_ranges("1-5,12"), dry_run=True) == 5
+    assert change_tasks(file, "done", parse_id_ranges("1-5,12")) == 5
+    assert change_tasks(file, "done", parse_id_ranges("1-5,12")) == 0
+    assert change_tasks(file, "delete", where=parse_where_option("desc~OBSOLETE and status!=done")) == 3
+    assert change_tasks(file, "in-progress", parse_id_ranges("1-1000000"), parse_where_option("status=todo")) == 11
+    assert len(commits) == 5
+
+    with open_backend(file) as backend:
+        statuses = {id: task.status for id, task in backend.tasks()}
+        assert backend.get("3").completed is not None
+    assert [id for id, status in statuses.items() if status == "done"] == ["1", "2", "3", "4", "5", "12"]
+    assert not {"8", "16", "20"} & set(statuses)
+    assert sum(status == "in-progress" for status in statuses.values()) == 11
+    assert read_stats(file).counts == {"done": 6, "in-progress": 11}
+
+
+def test_change_commands(monkeypatch, capsys, tmp_path):
+    file = tmp_path / "tasks.json"
+    monkeypatch.setattr("task_manager.filename", str(file))
+    monkeypatch.setattr("task_manager.CATALOG_FILE", str(tmp_path / "lists.json"))
+    for number in range(1, 7):
+        main(["add", f"Task {number}"])
+    with open_backend(file) as backend:
+        task = backend.get("6")
+        backend.put("6", Task(task.description, task.status, task.created + 10 * DAY))
+    capsys.readouterr()
+
+    main(["mark-done", "1-3,5", "--dry-run"])
+    assert "Would mark 4 tasks as done." in capsys.readouterr().out
+    main(["mark-done", "1-3,5"])
+    assert "Marked 4 tasks as done." in capsys.readouterr().out
+    tomorrow = datetime.fromtimestamp(time.time() + DAY).strftime("%d.%m.%Y")
+    main(["delete", "--where", "status=todo", "--created-before", tomorrow])
+    assert "Deleted 1 task." in capsys.readouterr().out
+    with open_backend(file) as backend:
+        assert [id for id, _ in backend.tasks("todo")] == ["6"]
+    yesterday = datetime.fromtimestamp(time.time() - DAY).strftime("%d.%m.%Y")
+    later = datetime.fromtimestamp(time.time() + 20 * DAY).strftime("%d.%m.%Y")
+    for options in (["--until", yesterday, "--created-before", later],
+                    ["--created-before", later, "--until", yesterday]):
+        main(["mark-done", "--where", "status=todo"] + options + ["--dry-run"])
+        assert "Would mark 0 tasks as done." in capsys.readouterr().out
+    main(["mark-done", "--where", "status=todo", "--created-before", later, "--dry-run"])
+    assert "Would mark 1 task as done." in capsys.readouterr().out
+
+    with pytest.raises(SystemExit, match="it's not on the to-do list"):
+        main(["mark-done", "4"])
+    for argv in (["delete"], ["mark-done", "3-1"], ["delete", "--where", "colour=red"],
+                 ["mark-done", "--created-before", "yesterday"]):
+        with pytest.raises(SystemExit):
+            main(argv)